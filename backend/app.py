@@ -10,26 +10,34 @@ from .config import config
 from .utils.constants import TOTAL_PAGES
 from .database import db_manager
 from .routes import api_bp
+from .utils.log_pipeline import configure_logging
 
-def create_app():
+def create_app(config_name='default'):
     app = Flask(__name__)
+
+    app.config.from_object(config[config_name])
     
-    app.config.from_object(config['default'])
-    
-    # Configure structlog
-    structlog.configure(
-        processors=[
-            structlog.processors.TimeStamper(fmt="iso"),
-            structlog.processors.JSONRenderer()
-        ]
-    )
+    # Configure structlog (rendering and writes happen off the request path unless LOG_ASYNC is off)
+    configure_logging(app)
     logger = structlog.get_logger()
     
     # Initialize extensions
     db_manager.init_app(app)
     jwt = JWTManager(app)
+    if app.config.get('JWT_BLACKLIST_ENABLED'):
+        from .services.token_revocation import init_token_revocation
+        init_token_revocation(app, jwt, db_manager)
     CORS(app, origins=app.config['CORS_ORIGINS'])
-    socketio = SocketIO(app, cors_allowed_origins=app.config.get('CORS_ORIGINS', '*'))
+    # Packets splice pre-encoded payloads from the broadcast cache instead of re-serializing them
+    from .services.broadcast import PayloadJSON, payload_cache
+    payload_cache.configure(app.config['PAYLOAD_CACHE_TTL'], app.config['PAYLOAD_CACHE_MAX_ENTRIES'])
+    from .middleware.compression import configure_socket_deflate
+    configure_socket_deflate(app.config['SOCKETIO_WS_DEFLATE'], app.config['SOCKETIO_WS_DEFLATE_LEVEL'],
+                             app.config['SOCKETIO_WS_DEFLATE_WINDOW_BITS'], app.config['SOCKETIO_WS_DEFLATE_MIN_SIZE'],
+                             app.config['SOCKETIO_WS_DEFLATE_NO_CONTEXT_TAKEOVER'])
+    socketio = SocketIO(app, cors_allowed_origins=app.config.get('CORS_ORIGINS', '*'), json=PayloadJSON,
+                        http_compression=app.config['SOCKETIO_HTTP_COMPRESSION'],
+                        compression_threshold=app.config['SOCKETIO_COMPRESSION_THRESHOLD'])
 
     # Validate critical env configuration
     if not app.config.get('SECRET_KEY'):
@@ -41,25 +49,53 @@ def create_app():
     
     app.register_blueprint(api_bp)
     
-    # Initialize database using Page model
-    try:
-        from .models.page import Page
-        page_model = Page(db_manager)
-        if page_model.count() == 0:
-            page_model.create_default_pages()
-        
-        game_state_collection = db_manager.get_collection('game_state')
-        if game_state_collection.count_documents({'type': 'current'}) == 0:
-            game_state = {
-                'type': 'current',
-                'current_page': 1,
-                'revealed_letters': {},
-                'game_status': 'waiting'
-            }
-            game_state_collection.insert_one(game_state)
-    except Exception as e:
-        logger.error("Failed to initialize database", error=str(e))
-        raise RuntimeError(f"Database initialization failed: {str(e)}")
+    # Everything below is in-memory wiring; seeding and indexes are done by `flask init-db`
+    from .models.page import configure_page_tables
+    hash_key = app.config['SECRET_KEY'].encode('utf-8') if app.config.get('PAGE_SOLUTION_HASHING') else None
+    configure_page_tables(hash_key)
+    
+    from .services.slow_query_log import slow_query_log
+    if app.config.get('SLOW_QUERY_LOG_ENABLED'):
+        slow_query_log.configure(db_manager, app.config['SLOW_QUERY_THRESHOLD_MS'],
+                                 app.config['SLOW_QUERY_EXPLAIN_SAMPLE_RATE'])
+    
+    from .services.event_stream import event_streams
+    event_streams.configure(app.config['SSE_RING_SIZE'], app.config['SSE_HEARTBEAT_SECONDS'],
+                            app.config['SSE_RETRY_MS'], app.config['SSE_MAX_CONNECTIONS'])
+    
+    from .services.circuit_breaker import circuit_breaker, init_circuit_breaker
+    if app.config.get('DB_BREAKER_ENABLED'):
+        circuit_breaker.configure(True, app.config['DB_BREAKER_WINDOW_SECONDS'], app.config['DB_BREAKER_MIN_CALLS'],
+                                  app.config['DB_BREAKER_FAILURE_RATIO'], app.config['DB_BREAKER_SLOW_CALL_MS'],
+                                  app.config['DB_BREAKER_OPEN_SECONDS'])
+    # Database failures are answered with 503 whether or not the breaker is enabled
+    init_circuit_breaker(app)
+    
+    if app.config.get('IDEMPOTENCY_ENABLED'):
+        from .middleware.idempotency import idempotency_store
+        idempotency_store.configure(db_manager, app.config['IDEMPOTENCY_TTL_SECONDS'],
+                                    app.config['IDEMPOTENCY_LOCK_SECONDS'], app.config['IDEMPOTENCY_CACHE_SIZE'])
+    
+    if app.config.get('PAGE_ANALYTICS_ENABLED'):
+        from .services.page_analytics import page_analytics
+        page_analytics.configure(db_manager, app.config['PAGE_ANALYTICS_BUCKET_SECONDS'])
+    
+    if app.config.get('GAME_ENGINE_ENABLED'):
+        # Engines start lazily on the first request of each game
+        from .services.game_engine import configure_game_engine
+        configure_game_engine(app, db_manager)
+    
+    if app.config.get('COMPRESSION_ENABLED'):
+        # Registered before profiling so it also compresses profiler reports (after_request runs in reverse)
+        from .middleware.compression import init_response_compression
+        init_response_compression(app)
+    
+    if app.config.get('PROFILING_ENABLED'):
+        from .services.profiler import init_request_profiling
+        init_request_profiling(app)
+    
+    from .commands import register_commands
+    register_commands(app)
     
     @app.route('/')
     def index():
@@ -67,7 +103,7 @@ def create_app():
             'message': 'HashQuest Backend',
             'word': 'POWERHOUSE',
             'pages': TOTAL_PAGES,
-            'max_teams': 20
+            'max_teams': app.config['MAX_TEAMS']
         })
     
     # Register WebSocket handlers
@@ -83,5 +119,8 @@ app = create_app()
 socketio = app.extensions['socketio']
 
 if __name__ == '__main__':
+    from .commands import init_db
+    with app.app_context():
+        init_db()
     socketio.run(app, host='0.0.0.0', port=5000, debug=True)
 
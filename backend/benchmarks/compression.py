@@ -0,0 +1,129 @@
+"""
+Compression benchmark: bytes saved versus CPU spent per response or frame, per
+zlib level, for the admin payloads and the socket broadcasts.
+
+    python -m backend.benchmarks.compression --teams 100 --iterations 500
+
+"us" is wall time of one compression. Under gevent that time blocks the whole
+worker (every greenlet waits), so it is the number to weigh against "saved".
+WebSocket rows stream a run of leaderboard updates through one connection's
+permessage-deflate context, with and without context takeover.
+"""
+import argparse
+import json
+import random
+import string
+import timeit
+from datetime import datetime, timedelta
+
+from wsproto.frame_protocol import Opcode, RsvBits
+
+from ..middleware.compression import ENCODING_GZIP, TunedPerMessageDeflate, compress
+
+LEVELS = (1, 3, 6, 9)
+
+
+def _word(rng, length):
+    return ''.join(rng.choices(string.ascii_uppercase, k=length))
+
+
+def sample_payloads(teams: int):
+    rng = random.Random(7)
+    now = datetime(2024, 1, 1)
+    team_docs = [{
+        '_id': f'{rng.getrandbits(96):024x}',
+        'name': f'Team {_word(rng, 8).title()}',
+        'code': _word(rng, 6),
+        'NOMs': rng.randint(0, 8),
+        'guesses_left': rng.randint(0, 3),
+        'word_guesses': [{'word': _word(rng, 10), 'greens': rng.randint(0, 10), 'yellows': rng.randint(0, 10),
+                          'timestamp': (now + timedelta(seconds=rng.randint(0, 7200))).isoformat()}
+                         for _ in range(rng.randint(0, 3))],
+        'letter_guesses': [{'letter': rng.choice(string.ascii_uppercase),
+                            'timestamp': (now + timedelta(seconds=rng.randint(0, 7200))).isoformat()}
+                           for _ in range(rng.randint(0, 6))],
+        'created_at': now.isoformat(),
+        'last_activity': (now + timedelta(seconds=rng.randint(0, 7200))).isoformat()
+    } for _ in range(teams)]
+    pages = [{
+        'number': number,
+        'letter': 'POWERHOUSE'[number - 1],
+        'puzzle': ' '.join(_word(rng, rng.randint(3, 9)).lower() for _ in range(40)),
+        'is_solved': number < 4,
+        'solved_by': _word(rng, 6) if number < 4 else None,
+        'solved_at': now.isoformat() if number < 4 else None
+    } for number in range(1, 11)]
+    rankings = [{'name': team['name'], 'code': team['code'], 'greens': rng.randint(0, 10),
+                 'yellows': rng.randint(0, 10), 'NOMs': team['NOMs'], 'word_guesses_count': len(team['word_guesses']),
+                 'guesses_left': team['guesses_left']} for team in team_docs[:20]]
+    return {
+        f'admin teams ({teams})': {'success': True, 'data': {'teams': team_docs, 'pagination': {
+            'page': 1, 'per_page': teams, 'total': teams, 'pages': 1}}},
+        'admin pages': {'success': True, 'data': {'pages': pages, 'statistics': {'total_pages': 10, 'solved': 3}}},
+        'admin game state': {'success': True, 'data': {'game_state': {
+            'current_page': 4, 'game_status': 'in_progress', 'epoch': 2,
+            'revealed_letters': {'P': [0], 'O': [1, 6]}, 'word': 'POWERHOUSE', 'updated_at': now.isoformat()},
+            'epochs': [{'epoch': e, 'reset_at': now.isoformat(), 'reason': 'reset'} for e in range(2)]}},
+        'leaderboard (20)': {'rankings': rankings}
+    }
+
+
+def measure_http(payloads, iterations: int):
+    rows = []
+    for name, payload in payloads.items():
+        body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        for level in LEVELS:
+            size = len(compress(body, ENCODING_GZIP, level))
+            seconds = timeit.timeit(lambda: compress(body, ENCODING_GZIP, level), number=iterations) / iterations
+            rows.append((name, level, len(body), size, seconds * 1e6))
+    return rows
+
+
+class _ServerSide:
+    client = False
+
+
+def _frames(messages, level: int, no_context_takeover: bool):
+    TunedPerMessageDeflate.level = level
+    TunedPerMessageDeflate.no_context_takeover = no_context_takeover
+    extension = TunedPerMessageDeflate()
+    return [extension.frame_outbound(_ServerSide, Opcode.TEXT, RsvBits(False, False, False), message, True)[1]
+            for message in messages]
+
+
+def measure_websocket(payloads, updates: int):
+    rng = random.Random(11)
+    rankings = payloads['leaderboard (20)']['rankings']
+    messages = []
+    for _ in range(updates):
+        rng.choice(rankings)['greens'] = rng.randint(0, 10)
+        packet = '42' + json.dumps(['leaderboard_update', {'rankings': rankings}], separators=(',', ':'))
+        messages.append(packet.encode('utf-8'))
+    raw = sum(len(message) for message in messages) / updates
+    rows = []
+    for takeover in (True, False):
+        for level in LEVELS:
+            sent = sum(len(frame) for frame in _frames(messages, level, not takeover)) / updates
+            seconds = timeit.timeit(lambda: _frames(messages, level, not takeover), number=5) / 5 / updates
+            label = 'ws leaderboard' + ('' if takeover else ' (no ctx)')
+            rows.append((label, level, raw, sent, seconds * 1e6))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--teams', type=int, default=100)
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--updates', type=int, default=200)
+    args = parser.parse_args()
+
+    payloads = sample_payloads(args.teams)
+    rows = measure_http(payloads, args.iterations) + measure_websocket(payloads, args.updates)
+    print(f'{"payload":28} {"level":>5} {"raw B":>9} {"sent B":>9} {"saved":>7} {"us":>9} {"MB/s":>8}')
+    for name, level, raw, sent, us in rows:
+        print(f'{name:28} {level:>5} {raw:>9.0f} {sent:>9.0f} {1 - sent / raw:>7.0%} {us:>9.1f} '
+              f'{raw / us if us else 0:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
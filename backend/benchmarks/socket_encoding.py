@@ -0,0 +1,89 @@
+"""
+Socket payload benchmark: bytes on the wire and encode time per broadcast for
+JSON text packets versus compact MessagePack binary attachments.
+
+    python -m backend.benchmarks.socket_encoding --teams 20 --iterations 2000
+
+Sizes are whole Socket.IO packets as sent to each client (a binary event is a
+short text header plus the attachment); "sent as" is what a MessagePack client
+receives. Times cover encoding one payload, which happens once per broadcast.
+"""
+import argparse
+import json
+import random
+import string
+import sys
+import timeit
+
+from socketio import packet
+
+from ..services import socket_codec
+
+
+def sample_payloads(teams: int):
+    rng = random.Random(42)
+    rankings = [{
+        'name': f'Team {"".join(rng.choices(string.ascii_letters, k=8))}',
+        'code': ''.join(rng.choices(string.ascii_uppercase + string.digits, k=6)),
+        'greens': rng.randint(0, 10),
+        'yellows': rng.randint(0, 10),
+        'NOMs': rng.randint(0, 8),
+        'word_guesses_count': rng.randint(0, 3),
+        'guesses_left': rng.randint(0, 3)
+    } for _ in range(teams)]
+    status = {
+        'current_page': 4,
+        'game_status': 'in_progress',
+        'revealed_letters': {'P': [0], 'O': [1, 6], 'E': [3, 9]},
+        'page_info': {'number': 4, 'letter': 'E',
+                      'puzzle': 'I have cities, but no houses. I have mountains, but no trees. I have water, but '
+                                'no fish. What am I?'},
+        'word': 'POWERHOUSE'
+    }
+    return {
+        'game_status': status,
+        f'leaderboard ({teams} teams)': {'rankings': rankings},
+        'page_solved': {'page': 4, 'team_code': 'AB12CD'},
+        'letter_guessed': {'letter': 'O', 'positions': [1, 6]}
+    }
+
+
+def packet_size(event: str, data) -> int:
+    encoded = packet.Packet(packet.EVENT, data=[event, data]).encode()
+    parts = encoded if isinstance(encoded, list) else [encoded]
+    return sum(len(part) if isinstance(part, bytes) else len(part.encode('utf-8')) for part in parts)
+
+
+def measure(payloads, iterations: int):
+    rows = []
+    for name, payload in payloads.items():
+        event = name.split(' ')[0]
+        packed = socket_codec.pack(payload)
+        assert socket_codec.unpack(packed) == payload, f'{name} does not round-trip'
+        json_bytes = packet_size(event, payload)
+        msgpack_bytes = packet_size(event, packed)
+        json_us = timeit.timeit(lambda: json.dumps(payload, separators=(',', ':')), number=iterations) / iterations * 1e6
+        msgpack_us = timeit.timeit(lambda: socket_codec.pack(payload), number=iterations) / iterations * 1e6
+        json_text = json.dumps(payload, separators=(',', ':'))
+        sent = 'msgpack' if len(packed) + socket_codec.BINARY_OVERHEAD < len(json_text) else 'json'
+        rows.append((name, json_bytes, msgpack_bytes, sent, json_us, msgpack_us))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--teams', type=int, default=20)
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+    if not socket_codec.available():
+        sys.exit('msgpack is not installed (pip install msgpack)')
+
+    rows = measure(sample_payloads(args.teams), args.iterations)
+    print(f'{"payload":28} {"json B":>8} {"msgpack B":>10} {"saved":>7} {"sent as":>8} {"json us":>9} {"msgpack us":>11}')
+    for name, json_bytes, msgpack_bytes, sent, json_us, msgpack_us in rows:
+        saved = 1 - msgpack_bytes / json_bytes
+        print(f'{name:28} {json_bytes:>8} {msgpack_bytes:>10} {saved:>7.0%} {sent:>8} {json_us:>9.1f} {msgpack_us:>11.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Startup benchmark: time a cold `import backend.app` (which builds the app) in fresh
+interpreters and fail when the median exceeds the import-time budget.
+
+    python -m backend.benchmarks.startup --runs 5 --budget-ms 800
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+PROBE = (
+    "import time; t = time.perf_counter(); import backend.app; "
+    "print((time.perf_counter() - t) * 1000)"
+)
+
+
+def measure(runs: int) -> list:
+    env = dict(os.environ)
+    # The app refuses to start without keys; dummy values are fine for timing
+    env.setdefault('SECRET_KEY', 'startup-benchmark')
+    env.setdefault('JWT_SECRET_KEY', 'startup-benchmark')
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', PROBE], cwd=root, env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            sys.exit(f'import backend.app failed:\n{result.stderr}')
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=float(os.environ.get('STARTUP_BUDGET_MS', 800)))
+    args = parser.parse_args()
+
+    timings = measure(args.runs)
+    median = statistics.median(timings)
+    print(f'import backend.app: median {median:.1f} ms, min {min(timings):.1f} ms, max {max(timings):.1f} ms '
+          f'over {args.runs} runs (budget {args.budget_ms:.0f} ms)')
+    if median > args.budget_ms:
+        print('FAIL: startup exceeds budget', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
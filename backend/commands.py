@@ -0,0 +1,95 @@
+"""
+Flask CLI commands (run with `flask --app backend.app <command>`)
+"""
+import os
+import click
+import structlog
+
+from .database import db_manager
+from .utils.constants import DEFAULT_GAME_ID
+
+logger = structlog.get_logger()
+
+
+def init_db(game_id: str = DEFAULT_GAME_ID):
+    """Check connectivity, create indexes, migrate legacy documents and seed a game"""
+    from .models.team import Team
+    from .models.page import Page
+    from .models.game_state import GameState
+    from .models.scope import migrate_legacy_documents, provision_game
+    from .models.epoch import ensure_archive_indexes, stamp_legacy_epochs
+    from .services.slow_query_log import ensure_slow_query_collection
+    from .services.page_analytics import ensure_page_stats_indexes
+    from .middleware.idempotency import ensure_idempotency_indexes
+    from .services.token_revocation import ensure_revocation_indexes
+    from .middleware.security import ensure_rate_limit_indexes
+    from flask import current_app
+
+    db_manager.ping()
+    migrate_legacy_documents(db_manager)
+    stamp_legacy_epochs(db_manager)
+    ensure_archive_indexes(db_manager)
+    ensure_page_stats_indexes(db_manager)
+    ensure_idempotency_indexes(db_manager)
+    ensure_revocation_indexes(db_manager)
+    ensure_rate_limit_indexes(db_manager)
+    for model in (Team(db_manager), Page(db_manager), GameState(db_manager)):
+        model.ensure_indexes()
+    ensure_slow_query_collection(db_manager, current_app.config['SLOW_QUERY_LOG_SIZE_BYTES'],
+                                 current_app.config['SLOW_QUERY_LOG_MAX_DOCUMENTS'])
+    provision_game(db_manager, game_id)
+    logger.info("Database initialized", game_id=game_id)
+
+
+def register_commands(app):
+    @app.cli.command('init-db')
+    @click.option('--game-id', default=DEFAULT_GAME_ID, show_default=True, help='Game to seed')
+    def init_db_command(game_id):
+        """Create indexes and seed the game state and default pages (one-shot)"""
+        init_db(game_id)
+        click.echo(f'Database initialized for game {game_id}')
+    
+    @app.cli.command('check-indexes')
+    def check_indexes_command():
+        """Explain every query shape the app issues; fail on collection scans or in-memory sorts.
+
+        Data is written under a throwaway game id and removed afterwards. On the memory backend plans come from
+        its planner (see storage/planner.py); tests/test_index_check.py runs the same check in CI.
+        """
+        from .services.index_check import check_indexes
+        init_db()
+        results = check_indexes(app, db_manager)
+        for result in results:
+            status = 'OK  ' if result.ok else 'FAIL'
+            detail = result.error or f"{result.plan_summary} [{', '.join(result.indexes) or 'no index'}]"
+            click.echo(f'{status} {result.key}\n       {detail}')
+        failed = [result for result in results if not result.ok]
+        click.echo(f'{len(results)} query shapes checked, {len(failed)} failing')
+        if failed:
+            raise SystemExit(1)
+
+    
+    @app.cli.command('archive-game')
+    @click.argument('game_id')
+    @click.option('--out', 'directory', default=None, help='Archive directory [default: archives/<game_id>-<timestamp>]')
+    @click.option('--keep', is_flag=True, help='Keep the game in the live collections')
+    @click.option('--force', is_flag=True, help='Archive even if the game is not completed')
+    def archive_game_command(game_id, directory, keep, force):
+        """Write a game to compressed column files with a manifest, then prune it from MongoDB.
+
+        Stop the game (and any in-memory engine serving it) first: writes made while archiving are lost on pruning.
+        """
+        from datetime import datetime
+        from .services.game_archive import archive_game
+        from .utils.constants import GAME_STATUS_COMPLETED
+        
+        state = db_manager.get_collection('game_state').find_one({'game_id': game_id, 'type': 'current'})
+        if state is None:
+            raise click.ClickException(f'Game {game_id} not found')
+        if state.get('game_status') != GAME_STATUS_COMPLETED and not force:
+            raise click.ClickException(f"Game {game_id} is {state.get('game_status')}, not completed (use --force)")
+        directory = directory or os.path.join('archives', f"{game_id}-{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}")
+        manifest = archive_game(db_manager, game_id, directory, prune=not keep)
+        for entity, details in manifest['entities'].items():
+            click.echo(f"{entity:15} {details['rows']:>8} rows {details['bytes']:>10} bytes  {details['file']}")
+        click.echo(f'Archived {game_id} to {directory}' + ('' if keep else ' and pruned it from the database'))
@@ -14,10 +14,49 @@ class Config:
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=env_config('JWT_REFRESH_TOKEN_EXPIRES_DAYS', default=30, cast=int))
     JWT_BLACKLIST_ENABLED = True
     JWT_BLACKLIST_TOKEN_CHECKS = ['access', 'refresh']
+    # Revoked tokens: per-worker Bloom filter sizing and how quickly revocations from other workers arrive
+    JWT_REVOCATION_FILTER_CAPACITY = env_config('JWT_REVOCATION_FILTER_CAPACITY', default=10000, cast=int)
+    JWT_REVOCATION_FILTER_ERROR_RATE = env_config('JWT_REVOCATION_FILTER_ERROR_RATE', default=0.001, cast=float)
+    JWT_REVOCATION_REFRESH_SECONDS = env_config('JWT_REVOCATION_REFRESH_SECONDS', default=2.0, cast=float)
+    JWT_REVOCATION_RELOAD_SECONDS = env_config('JWT_REVOCATION_RELOAD_SECONDS', default=600.0, cast=float)
     
     # Database Configuration
     MONGODB_URI = env_config('MONGODB_URI', default='mongodb://localhost:27017/hashquest')
     MONGODB_DATABASE = env_config('MONGODB_DATABASE', default='hashquest')
+    MONGODB_MAX_POOL_SIZE = env_config('MONGODB_MAX_POOL_SIZE', default=100, cast=int)
+    MONGODB_MIN_POOL_SIZE = env_config('MONGODB_MIN_POOL_SIZE', default=0, cast=int)
+    MONGODB_MAX_IDLE_TIME_MS = env_config('MONGODB_MAX_IDLE_TIME_MS', default=60000, cast=int)
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS = env_config('MONGODB_WAIT_QUEUE_TIMEOUT_MS', default=2000, cast=int)
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS = env_config('MONGODB_SERVER_SELECTION_TIMEOUT_MS', default=5000, cast=int)
+    MONGODB_CONNECT_TIMEOUT_MS = env_config('MONGODB_CONNECT_TIMEOUT_MS', default=5000, cast=int)
+    MONGODB_SOCKET_TIMEOUT_MS = env_config('MONGODB_SOCKET_TIMEOUT_MS', default=10000, cast=int)
+    MONGODB_WRITE_CONCERN = env_config('MONGODB_WRITE_CONCERN', default='1')  # number or 'majority'
+    MONGODB_WRITE_CONCERN_JOURNAL = env_config('MONGODB_WRITE_CONCERN_JOURNAL', default=False, cast=bool)
+    MONGODB_READ_PREFERENCE = env_config('MONGODB_READ_PREFERENCE', default='primary')
+    # Read preferences for read-heavy paths that tolerate replication lag
+    MONGODB_READ_ROUTES = {
+        'leaderboard': env_config('MONGODB_LEADERBOARD_READ_PREFERENCE', default='primary'),
+        'admin': env_config('MONGODB_ADMIN_READ_PREFERENCE', default='primary')
+    }
+    # Per-collection overrides, e.g. "slow_queries:secondaryPreferred,teams:primary"
+    MONGODB_COLLECTION_READ_PREFERENCES = dict(
+        item.split(':', 1) for item in env_config('MONGODB_COLLECTION_READ_PREFERENCES', default='').split(',') if ':' in item
+    )
+    MONGODB_CAUSAL_SESSIONS = env_config('MONGODB_CAUSAL_SESSIONS', default=True, cast=bool)
+    HEALTH_PROBE_INTERVAL = env_config('HEALTH_PROBE_INTERVAL', default=5.0, cast=float)
+    # Storage engine: 'mongo', or 'memory' for the embedded engine (single process, no mongod needed)
+    STORAGE_BACKEND = env_config('STORAGE_BACKEND', default='mongo')
+    # Directory of the memory engine's journal and snapshots; empty keeps everything in memory only
+    STORAGE_MEMORY_PATH = env_config('STORAGE_MEMORY_PATH', default='')
+    STORAGE_MEMORY_FSYNC = env_config('STORAGE_MEMORY_FSYNC', default=False, cast=bool)
+    STORAGE_MEMORY_SNAPSHOT_BYTES = env_config('STORAGE_MEMORY_SNAPSHOT_BYTES', default=64 * 1024 * 1024, cast=int)
+    
+    # Slow-query log: operations over the threshold go to the capped `slow_queries` collection
+    SLOW_QUERY_LOG_ENABLED = env_config('SLOW_QUERY_LOG_ENABLED', default=True, cast=bool)
+    SLOW_QUERY_THRESHOLD_MS = env_config('SLOW_QUERY_THRESHOLD_MS', default=50.0, cast=float)
+    SLOW_QUERY_EXPLAIN_SAMPLE_RATE = env_config('SLOW_QUERY_EXPLAIN_SAMPLE_RATE', default=0.1, cast=float)
+    SLOW_QUERY_LOG_SIZE_BYTES = env_config('SLOW_QUERY_LOG_SIZE_BYTES', default=16 * 1024 * 1024, cast=int)
+    SLOW_QUERY_LOG_MAX_DOCUMENTS = env_config('SLOW_QUERY_LOG_MAX_DOCUMENTS', default=10000, cast=int)
     
     
     # CORS Configuration
@@ -29,9 +68,77 @@ class Config:
     
     # Game Configuration
     MAX_TEAMS = env_config('MAX_TEAMS', default=20, cast=int)
+    # Admin roster import: rows per request, and processes hashing passwords (0 hashes inline)
+    BULK_IMPORT_MAX_ROWS = env_config('BULK_IMPORT_MAX_ROWS', default=1000, cast=int)
+    BULK_IMPORT_HASH_WORKERS = env_config('BULK_IMPORT_HASH_WORKERS', default=os.cpu_count() or 1, cast=int)
     MAX_WORD_GUESSES = env_config('MAX_WORD_GUESSES', default=3, cast=int)
     GAME_WORD = env_config('GAME_WORD', default='POWERHOUSE')
     TOTAL_PAGES = env_config('TOTAL_PAGES', default=10, cast=int)
+    PAGE_SOLUTION_HASHING = env_config('PAGE_SOLUTION_HASHING', default=False, cast=bool)  # keep only HMACs of solutions in memory
+    
+    # In-memory game engine (authoritative state in process, journaled, persisted asynchronously)
+    GAME_ENGINE_ENABLED = env_config('GAME_ENGINE_ENABLED', default=False, cast=bool)
+    GAME_ENGINE_JOURNAL = env_config('GAME_ENGINE_JOURNAL', default='data/game_engine-{game_id}.journal')
+    GAME_ENGINE_FSYNC = env_config('GAME_ENGINE_FSYNC', default=True, cast=bool)
+    
+    # Admin profiling (sampling endpoint and per-request cProfile mode)
+    PROFILING_ENABLED = env_config('PROFILING_ENABLED', default=True, cast=bool)
+    PROFILER_MAX_SECONDS = env_config('PROFILER_MAX_SECONDS', default=30, cast=float)
+    PROFILER_INTERVAL_MS = env_config('PROFILER_INTERVAL_MS', default=5, cast=float)
+    PROFILER_REQUEST_TOP = env_config('PROFILER_REQUEST_TOP', default=50, cast=int)
+    
+    # Serialize-once payload cache (status/leaderboard); the TTL bounds staleness across processes
+    PAYLOAD_CACHE_TTL = env_config('PAYLOAD_CACHE_TTL', default=1.0, cast=float)
+    PAYLOAD_CACHE_MAX_ENTRIES = env_config('PAYLOAD_CACHE_MAX_ENTRIES', default=1024, cast=int)
+    
+    # Spectator Server-Sent Events (events kept per game for Last-Event-ID resume, keepalive interval, connection cap)
+    SSE_RING_SIZE = env_config('SSE_RING_SIZE', default=256, cast=int)
+    SSE_HEARTBEAT_SECONDS = env_config('SSE_HEARTBEAT_SECONDS', default=15.0, cast=float)
+    SSE_RETRY_MS = env_config('SSE_RETRY_MS', default=3000, cast=int)
+    SSE_MAX_CONNECTIONS = env_config('SSE_MAX_CONNECTIONS', default=5000, cast=int)
+    
+    # Page analytics (solve attempts counted into time buckets of this many seconds)
+    PAGE_ANALYTICS_ENABLED = env_config('PAGE_ANALYTICS_ENABLED', default=True, cast=bool)
+    PAGE_ANALYTICS_BUCKET_SECONDS = env_config('PAGE_ANALYTICS_BUCKET_SECONDS', default=300, cast=int)
+    
+    # Database circuit breaker (opens when FAILURE_RATIO of at least MIN_CALLS operations in the window failed or
+    # took SLOW_CALL_MS or longer; stays open OPEN_SECONDS, serving stale status/leaderboard and refusing writes)
+    DB_BREAKER_ENABLED = env_config('DB_BREAKER_ENABLED', default=True, cast=bool)
+    DB_BREAKER_WINDOW_SECONDS = env_config('DB_BREAKER_WINDOW_SECONDS', default=10, cast=int)
+    DB_BREAKER_MIN_CALLS = env_config('DB_BREAKER_MIN_CALLS', default=20, cast=int)
+    DB_BREAKER_FAILURE_RATIO = env_config('DB_BREAKER_FAILURE_RATIO', default=0.5, cast=float)
+    DB_BREAKER_SLOW_CALL_MS = env_config('DB_BREAKER_SLOW_CALL_MS', default=1000.0, cast=float)
+    DB_BREAKER_OPEN_SECONDS = env_config('DB_BREAKER_OPEN_SECONDS', default=5.0, cast=float)
+    
+    # Idempotency keys on POST/DELETE endpoints (stored responses expire after the TTL; claims lapse after the lock)
+    IDEMPOTENCY_ENABLED = env_config('IDEMPOTENCY_ENABLED', default=True, cast=bool)
+    IDEMPOTENCY_TTL_SECONDS = env_config('IDEMPOTENCY_TTL_SECONDS', default=86400, cast=int)
+    IDEMPOTENCY_LOCK_SECONDS = env_config('IDEMPOTENCY_LOCK_SECONDS', default=30.0, cast=float)
+    IDEMPOTENCY_CACHE_SIZE = env_config('IDEMPOTENCY_CACHE_SIZE', default=2048, cast=int)
+    
+    # Response compression (gzip/deflate of buffered text responses of at least COMPRESSION_MIN_SIZE bytes)
+    COMPRESSION_ENABLED = env_config('COMPRESSION_ENABLED', default=True, cast=bool)
+    COMPRESSION_MIN_SIZE = env_config('COMPRESSION_MIN_SIZE', default=1024, cast=int)
+    COMPRESSION_LEVEL = env_config('COMPRESSION_LEVEL', default=3, cast=int)
+    
+    # Socket.IO compression: long-polling responses (engine.io) and permessage-deflate WebSocket frames
+    SOCKETIO_HTTP_COMPRESSION = env_config('SOCKETIO_HTTP_COMPRESSION', default=True, cast=bool)
+    SOCKETIO_COMPRESSION_THRESHOLD = env_config('SOCKETIO_COMPRESSION_THRESHOLD', default=1024, cast=int)
+    SOCKETIO_WS_DEFLATE = env_config('SOCKETIO_WS_DEFLATE', default=True, cast=bool)
+    SOCKETIO_WS_DEFLATE_LEVEL = env_config('SOCKETIO_WS_DEFLATE_LEVEL', default=6, cast=int)
+    SOCKETIO_WS_DEFLATE_WINDOW_BITS = env_config('SOCKETIO_WS_DEFLATE_WINDOW_BITS', default=15, cast=int)
+    SOCKETIO_WS_DEFLATE_MIN_SIZE = env_config('SOCKETIO_WS_DEFLATE_MIN_SIZE', default=256, cast=int)
+    SOCKETIO_WS_DEFLATE_NO_CONTEXT_TAKEOVER = env_config('SOCKETIO_WS_DEFLATE_NO_CONTEXT_TAKEOVER', default=False,
+                                                         cast=bool)
+    
+    # Admin exports (cursor batch size of streamed NDJSON/CSV exports)
+    EXPORT_BATCH_SIZE = env_config('EXPORT_BATCH_SIZE', default=500, cast=int)
+    
+    # Logging: queue-backed writer, per-event sampling ("event:rate") and per-second caps ("event:max")
+    LOG_ASYNC = env_config('LOG_ASYNC', default=True, cast=bool)
+    LOG_QUEUE_SIZE = env_config('LOG_QUEUE_SIZE', default=10000, cast=int)
+    LOG_SAMPLE_RATES = env_config('LOG_SAMPLE_RATES', default='Client connected:0.05,Client disconnected:0.05')
+    LOG_RATE_LIMITS = env_config('LOG_RATE_LIMITS', default='Document created:20,Document updated:20,Team joined game:20')
     
     # Security Configuration
     BCRYPT_LOG_ROUNDS = env_config('BCRYPT_LOG_ROUNDS', default=12, cast=int)
@@ -39,6 +146,38 @@ class Config:
     TEAM_CODE_LENGTH = env_config('TEAM_CODE_LENGTH', default=6, cast=int)
     ADMIN_TOKEN = env_config('ADMIN_TOKEN', default='admin-secret')
     
+    # Rate Limiting (per-team token buckets on gameplay endpoints)
+    RATE_LIMIT_ENABLED = env_config('RATE_LIMIT_ENABLED', default=True, cast=bool)
+    RATE_LIMIT_BACKEND = env_config('RATE_LIMIT_BACKEND', default='memory')  # memory | mongo
+    RATE_LIMIT_CAPACITY = env_config('RATE_LIMIT_CAPACITY', default=10, cast=int)
+    RATE_LIMIT_REFILL_RATE = env_config('RATE_LIMIT_REFILL_RATE', default=1.0, cast=float)  # tokens per second
+    
+    # Load Shedding (bounded concurrency per endpoint class; lower priority number wins)
+    LOAD_SHED_ENABLED = env_config('LOAD_SHED_ENABLED', default=True, cast=bool)
+    LOAD_SHED_MAX_INFLIGHT = env_config('LOAD_SHED_MAX_INFLIGHT', default=64, cast=int)
+    LOAD_SHED_CLASSES = {
+        'gameplay': {
+            'concurrency': env_config('LOAD_SHED_GAMEPLAY_CONCURRENCY', default=32, cast=int),
+            'queue_timeout': env_config('LOAD_SHED_GAMEPLAY_QUEUE_TIMEOUT', default=2.0, cast=float),
+            'priority': 0
+        },
+        'auth': {
+            'concurrency': env_config('LOAD_SHED_AUTH_CONCURRENCY', default=8, cast=int),
+            'queue_timeout': env_config('LOAD_SHED_AUTH_QUEUE_TIMEOUT', default=1.0, cast=float),
+            'priority': 1
+        },
+        'read': {
+            'concurrency': env_config('LOAD_SHED_READ_CONCURRENCY', default=16, cast=int),
+            'queue_timeout': env_config('LOAD_SHED_READ_QUEUE_TIMEOUT', default=0.5, cast=float),
+            'priority': 2
+        },
+        'admin': {
+            'concurrency': env_config('LOAD_SHED_ADMIN_CONCURRENCY', default=4, cast=int),
+            'queue_timeout': env_config('LOAD_SHED_ADMIN_QUEUE_TIMEOUT', default=0.5, cast=float),
+            'priority': 3
+        }
+    }
+    
     # Logging Configuration
     LOG_LEVEL = env_config('LOG_LEVEL', default='INFO')
     LOG_FILE = env_config('LOG_FILE', default='logs/hashquest.log')
@@ -70,8 +209,11 @@ class TestingConfig(Config):
     TESTING = True
     DEBUG = True
     MONGODB_URI = env_config('TEST_MONGODB_URI', default='mongodb://localhost:27017/hashquest_test')
+    STORAGE_BACKEND = env_config('TEST_STORAGE_BACKEND', default='memory')
+    STORAGE_MEMORY_PATH = ''
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=5)
     WTF_CSRF_ENABLED = False
+    RATE_LIMIT_ENABLED = False
 
 class ProductionConfig(Config):
     DEBUG = False
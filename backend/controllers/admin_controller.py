@@ -1,24 +1,29 @@
-from flask import request, jsonify
+from flask import request, jsonify, current_app, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime, timedelta
 from typing import Dict, Any
 import structlog
 
 from ..services.auth_service import AuthService
-from ..models.team import Team
-from ..models.page import Page
-from ..models.game_state import GameState
+from ..services.game_engine import reload_game_engine
+from ..services.profiler import sampling_profiler, format_collapsed, ProfilerBusy
+from ..services.slow_query_log import recent_slow_queries, slow_query_shapes
+from ..services.export import EXPORTS, FORMATS, stream_export
+from ..services.page_analytics import page_difficulty
+from ..services.token_revocation import revocation_store
+from ..services.circuit_breaker import UNAVAILABLE_ERRORS
+from ..services.team_import import RosterError, parse_roster, import_teams
+from ..models.scope import GameScoped, game_exists, list_games, provision_game
+from ..models.epoch import archived_progress
 from ..utils.helpers import create_response, create_error_response, format_leaderboard
 from ..utils.constants import ERROR_MESSAGES, SUCCESS_MESSAGES
 from ..middleware.security import validate_required_fields, admin_required
 
 logger = structlog.get_logger()
 
-class AdminController:
+class AdminController(GameScoped):
     def __init__(self, db_manager):
-        self.team_model = Team(db_manager)
-        self.page_model = Page(db_manager)
-        self.game_state_model = GameState(db_manager)
+        self.db_manager = db_manager
     
     @jwt_required()
     @admin_required
@@ -26,7 +31,7 @@ class AdminController:
         """Get comprehensive dashboard statistics"""
         try:
             # Get team statistics
-            teams = self.team_model.get_all()
+            teams = self.team_model.get_all(read_route='admin')
             active_teams = self.team_model.get_active_teams()
             
             # Get page statistics
@@ -66,6 +71,8 @@ class AdminController:
             
             return create_response(data=stats), 200
             
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to get dashboard stats", error=str(e))
             return create_error_response(ERROR_MESSAGES['INTERNAL_ERROR'], 500), 500
@@ -103,10 +110,11 @@ class AdminController:
                 query=query,
                 sort=[('created_at', -1)],
                 skip=(page - 1) * per_page,
-                limit=per_page
+                limit=per_page,
+                read_route='admin'
             )
             
-            total = self.team_model.count(query)
+            total = self.team_model.count(query, read_route='admin')
             
             # Clean team data
             cleaned_teams = [self.team_model.clean_team_data(team) for team in teams]
@@ -123,6 +131,8 @@ class AdminController:
             
             return create_response(data=response_data), 200
             
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to get teams", error=str(e))
             return create_error_response(ERROR_MESSAGES['INTERNAL_ERROR'], 500), 500
@@ -153,10 +163,51 @@ class AdminController:
                 message=SUCCESS_MESSAGES['TEAM_REGISTERED']
             ), 201
             
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to create team", error=str(e))
             return create_error_response(ERROR_MESSAGES['INTERNAL_ERROR'], 500), 500
     
+    @jwt_required()
+    @admin_required
+    def import_teams(self) -> tuple[Dict[str, Any], int]:
+        """Create teams from a CSV or JSON roster, reporting each row"""
+        try:
+            upload = request.files.get('file')
+            if upload is not None:
+                data = upload.read()
+                fmt = 'json' if (upload.filename or '').lower().endswith('.json') else 'csv'
+            else:
+                data = request.get_data()
+                fmt = 'csv' if 'csv' in (request.mimetype or '') else 'json'
+            fmt = request.args.get('format', fmt).lower()
+            rows = parse_roster(data, fmt)
+            if not rows:
+                return create_error_response('Roster has no teams', 400), 400
+            max_rows = current_app.config['BULK_IMPORT_MAX_ROWS']
+            if len(rows) > max_rows:
+                return create_error_response(f'Roster has more than {max_rows} teams', 400), 400
+
+            report = import_teams(self.team_model, rows, current_app.config['MAX_TEAMS'],
+                                  current_app.config['PASSWORD_MIN_LENGTH'],
+                                  current_app.config['BULK_IMPORT_HASH_WORKERS'])
+            if report['created']:
+                reload_game_engine()
+
+            return create_response(
+                data=report,
+                message=f"Imported {report['created']} of {len(rows)} teams"
+            ), 200
+
+        except RosterError as e:
+            return create_error_response(str(e), 400), 400
+        except UNAVAILABLE_ERRORS:
+            raise
+        except Exception as e:
+            logger.error("Failed to import teams", error=str(e))
+            return create_error_response(ERROR_MESSAGES['INTERNAL_ERROR'], 500), 500
+
     @jwt_required()
     @admin_required
     def delete_team(self, team_id: str) -> tuple[Dict[str, Any], int]:
@@ -168,9 +219,14 @@ class AdminController:
             success = self.team_model.delete(team_id)
             if not success:
                 return create_error_response('Failed to delete team', 500), 500
+            if current_app.config.get('JWT_BLACKLIST_ENABLED'):
+                revocation_store.revoke_subject(team_id, 'team_deleted')
+            reload_game_engine()
             
             return create_response(message='Team deleted successfully'), 200
             
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to delete team", team_id=team_id, error=str(e))
             return create_error_response(ERROR_MESSAGES['INTERNAL_ERROR'], 500), 500
@@ -190,6 +246,8 @@ class AdminController:
             
             return create_response(data=response_data), 200
             
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to get pages", error=str(e))
             return create_error_response(ERROR_MESSAGES['INTERNAL_ERROR'], 500), 500
@@ -205,9 +263,12 @@ class AdminController:
             success = self.page_model.reset_page(page_number)
             if not success:
                 return create_error_response('Failed to reset page', 500), 500
+            reload_game_engine()
             
             return create_response(message=f'Page {page_number} reset successfully'), 200
             
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to reset page", page_number=page_number, error=str(e))
             return create_error_response(ERROR_MESSAGES['INTERNAL_ERROR'], 500), 500
@@ -218,11 +279,14 @@ class AdminController:
         """Reset all pages"""
         try:
             count = self.page_model.reset_all_pages()
+            reload_game_engine()
             return create_response(
                 data={'reset_count': count},
                 message=f'Reset {count} pages successfully'
             ), 200
             
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to reset all pages", error=str(e))
             return create_error_response(ERROR_MESSAGES['INTERNAL_ERROR'], 500), 500
@@ -244,6 +308,8 @@ class AdminController:
             
             return create_response(data=response_data), 200
             
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to get game state", error=str(e))
             return create_error_response(ERROR_MESSAGES['INTERNAL_ERROR'], 500), 500
@@ -277,9 +343,12 @@ class AdminController:
             
             if not success:
                 return create_error_response('Failed to control game', 500), 500
+            reload_game_engine()
             
             return create_response(message=message), 200
             
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to control game", error=str(e))
             return create_error_response(ERROR_MESSAGES['INTERNAL_ERROR'], 500), 500
@@ -295,9 +364,12 @@ class AdminController:
             success = self.game_state_model.set_page(page_number)
             if not success:
                 return create_error_response('Failed to set page', 500), 500
+            reload_game_engine()
             
             return create_response(message=f'Current page set to {page_number}'), 200
             
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to set current page", page_number=page_number, error=str(e))
             return create_error_response(ERROR_MESSAGES['INTERNAL_ERROR'], 500), 500
@@ -310,8 +382,8 @@ class AdminController:
             game_state = self.game_state_model.get_current()
             revealed_letters = game_state.get('revealed_letters', {})
             
-            teams = self.team_model.get_all()
-            leaderboard = format_leaderboard(teams, revealed_letters)
+            teams = self.team_model.get_all(read_route='leaderboard')
+            leaderboard = format_leaderboard(teams, revealed_letters, game_state.get('word'))
             
             response_data = {
                 'leaderboard': leaderboard,
@@ -321,6 +393,8 @@ class AdminController:
             
             return create_response(data=response_data), 200
             
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to get leaderboard", error=str(e))
             return create_error_response(ERROR_MESSAGES['INTERNAL_ERROR'], 500), 500
@@ -338,7 +412,7 @@ class AdminController:
                 return create_error_response('Letter already revealed', 400), 400
             
             from ..utils.helpers import get_letter_positions
-            positions = get_letter_positions(letter)
+            positions = get_letter_positions(letter, self.game_state_model.get_word())
             
             if not positions:
                 return create_error_response('Letter not found in word', 400), 400
@@ -346,12 +420,15 @@ class AdminController:
             success = self.game_state_model.reveal_letter(letter, positions)
             if not success:
                 return create_error_response('Failed to reveal letter', 500), 500
+            reload_game_engine()
             
             return create_response(
                 data={'letter': letter, 'positions': positions},
                 message=f'Letter {letter} revealed successfully'
             ), 200
             
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to reveal letter", letter=letter, error=str(e))
             return create_error_response(ERROR_MESSAGES['INTERNAL_ERROR'], 500), 500
@@ -385,9 +462,188 @@ class AdminController:
             
             return create_response(data=response_data), 200
             
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to get team details", team_id=team_id, error=str(e))
             return create_error_response(ERROR_MESSAGES['INTERNAL_ERROR'], 500), 500
+    
+    @jwt_required()
+    @admin_required
+    def get_games(self) -> tuple[Dict[str, Any], int]:
+        """List all games hosted by this deployment"""
+        try:
+            return create_response(data={'games': list_games(self.db_manager)}), 200
+        except UNAVAILABLE_ERRORS:
+            raise
+        except Exception as e:
+            logger.error("Failed to list games", error=str(e))
+            return create_error_response(ERROR_MESSAGES['INTERNAL_ERROR'], 500), 500
+    
+    @jwt_required()
+    @admin_required
+    @validate_required_fields(['game_id'])
+    def create_game(self) -> tuple[Dict[str, Any], int]:
+        """Create a new game with its own state, pages and teams"""
+        try:
+            data = request.get_json()
+            game_id = data['game_id'].strip()
+            word = data.get('word', '').strip().upper() or None
+            
+            if not game_id.replace('-', '').replace('_', '').isalnum() or len(game_id) > 64:
+                return create_error_response('Invalid game id', 400), 400
+            if game_exists(self.db_manager, game_id):
+                return create_error_response('Game already exists', 400), 400
+            
+            models = provision_game(self.db_manager, game_id, word)
+            return create_response(
+                data={'game_id': game_id, 'word': models.game_state.get_word()},
+                message='Game created successfully'
+            ), 201
+            
+        except UNAVAILABLE_ERRORS:
+            raise
+        except Exception as e:
+            logger.error("Failed to create game", error=str(e))
+            return create_error_response(ERROR_MESSAGES['INTERNAL_ERROR'], 500), 500
+    
+    @jwt_required()
+    @admin_required
+    def profile_sampling(self):
+        """Sample all threads and greenlets for a few seconds and return collapsed stacks"""
+        if not current_app.config.get('PROFILING_ENABLED', True):
+            return create_error_response('Profiling is disabled', 404), 404
+        try:
+            max_seconds = current_app.config.get('PROFILER_MAX_SECONDS', 30)
+            try:
+                seconds = float(request.args.get('seconds', 5))
+                interval_ms = float(request.args.get('interval_ms', current_app.config.get('PROFILER_INTERVAL_MS', 5)))
+            except ValueError:
+                return create_error_response('seconds and interval_ms must be numbers', 400), 400
+            if not 0 < seconds <= max_seconds or not 1 <= interval_ms <= 1000:
+                return create_error_response(f'seconds must be in (0, {max_seconds}] and interval_ms in [1, 1000]', 400), 400
+            include_idle = request.args.get('idle', 'true').lower() != 'false'
+            
+            result = sampling_profiler.run(seconds, interval_ms / 1000, include_idle=include_idle)
+            logger.info("Sampling profile taken", seconds=seconds, samples=result['samples'])
+            
+            if request.args.get('format') == 'json':
+                return create_response(data=result), 200
+            response = current_app.response_class(format_collapsed(result['stacks']), mimetype='text/plain')
+            response.headers['Content-Disposition'] = f'attachment; filename=profile-{int(datetime.utcnow().timestamp())}.folded'
+            return response, 200
+        except ProfilerBusy:
+            return create_error_response('A profile is already running', 409), 409
+        except UNAVAILABLE_ERRORS:
+            raise
+        except Exception as e:
+            logger.error("Failed to take sampling profile", error=str(e))
+            return create_error_response(ERROR_MESSAGES['INTERNAL_ERROR'], 500), 500
+    
+    @jwt_required()
+    @admin_required
+    def get_slow_queries(self) -> tuple[Dict[str, Any], int]:
+        """Browse the slow-query log, raw or grouped by query shape"""
+        try:
+            limit = min(int(request.args.get('limit', 50)), 500)
+            query = {}
+            for field in ('collection', 'operation', 'game_id'):
+                if request.args.get(field):
+                    query[field] = request.args[field]
+            if request.args.get('min_ms'):
+                query['duration_ms'] = {'$gte': float(request.args['min_ms'])}
+            
+            if request.args.get('group') == 'shape':
+                shapes = slow_query_shapes(self.db_manager, query, limit, read_route='admin')
+                for shape in shapes:
+                    shape.update(shape.pop('_id'))
+                return create_response(data={'shapes': shapes}), 200
+            return create_response(data={'queries': recent_slow_queries(self.db_manager, query, limit, read_route='admin')}), 200
+        except ValueError:
+            return create_error_response('limit and min_ms must be numbers', 400), 400
+        except UNAVAILABLE_ERRORS:
+            raise
+        except Exception as e:
+            logger.error("Failed to get slow queries", error=str(e))
+            return create_error_response(ERROR_MESSAGES['INTERNAL_ERROR'], 500), 500
+    
+    @jwt_required()
+    @admin_required
+    def get_epochs(self) -> tuple[Dict[str, Any], int]:
+        """Current reset epoch and summaries of earlier ones"""
+        try:
+            return create_response(data=self.game_state_model.get_epoch_history()), 200
+        except UNAVAILABLE_ERRORS:
+            raise
+        except Exception as e:
+            logger.error("Failed to get epochs", error=str(e))
+            return create_error_response(ERROR_MESSAGES['INTERNAL_ERROR'], 500), 500
+    
+    @jwt_required()
+    @admin_required
+    def get_epoch_archive(self, epoch: int) -> tuple[Dict[str, Any], int]:
+        """Archived page and team progress of an earlier epoch"""
+        try:
+            entries = archived_progress(self.db_manager, self.game_state_model.game_id, epoch, read_route='admin')
+            return create_response(data={
+                'epoch': epoch,
+                'pages': [entry for entry in entries if entry['collection'] == 'pages'],
+                'teams': [entry for entry in entries if entry['collection'] == 'teams']
+            }), 200
+        except UNAVAILABLE_ERRORS:
+            raise
+        except Exception as e:
+            logger.error("Failed to get epoch archive", epoch=epoch, error=str(e))
+            return create_error_response(ERROR_MESSAGES['INTERNAL_ERROR'], 500), 500
 
-
-
+    
+    @jwt_required()
+    @admin_required
+    def get_page_analytics(self) -> tuple[Dict[str, Any], int]:
+        """Attempts, wrong-answer histograms and time to first solve per page"""
+        try:
+            state = self.game_state_model.get_current()
+            epoch = int(request.args.get('epoch', state.get('epoch', 0)))
+            top = min(int(request.args.get('top', 10)), 100)
+            timeline = request.args.get('timeline', 'false').lower() in ('1', 'true', 'yes')
+            pages = page_difficulty(self.db_manager, self.game_state_model.game_id, epoch, top_answers=top,
+                                    timeline=timeline, read_route='admin')
+            return create_response(data={
+                'epoch': epoch,
+                'current_page': state.get('current_page') if epoch == state.get('epoch', 0) else None,
+                'page_started_at': state.get('page_started_at') if epoch == state.get('epoch', 0) else None,
+                'pages': pages
+            }), 200
+        except ValueError:
+            return create_error_response('epoch and top must be numbers', 400), 400
+        except UNAVAILABLE_ERRORS:
+            raise
+        except Exception as e:
+            logger.error("Failed to get page analytics", error=str(e))
+            return create_error_response(ERROR_MESSAGES['INTERNAL_ERROR'], 500), 500
+    
+    @jwt_required()
+    @admin_required
+    def export(self, entity: str):
+        """Stream teams, word guesses, letter guesses or page solves as NDJSON or CSV"""
+        entity = entity.replace('-', '_')
+        if entity not in EXPORTS:
+            return create_error_response(f"Unknown export, expected one of: {', '.join(sorted(EXPORTS))}", 404), 404
+        fmt = request.args.get('format', 'ndjson').lower()
+        if fmt not in FORMATS:
+            return create_error_response(f"format must be one of: {', '.join(FORMATS)}", 400), 400
+        compress = request.args.get('gzip', 'false').lower() in ('1', 'true', 'yes')
+        game_id = self.game_state_model.game_id
+        
+        chunks = stream_export(self.db_manager, game_id, entity, fmt, compress=compress,
+                               batch_size=current_app.config.get('EXPORT_BATCH_SIZE', 500))
+        # No Content-Length: the body goes out with chunked transfer encoding as it is produced
+        response = current_app.response_class(stream_with_context(chunks), mimetype=FORMATS[fmt])
+        filename = f"{game_id}-{entity}-{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}.{fmt}"
+        if compress:
+            filename += '.gz'
+            response.mimetype = 'application/gzip'
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+        response.headers['X-Accel-Buffering'] = 'no'
+        logger.info("Export started", entity=entity, format=fmt, gzip=compress)
+        return response, 200
@@ -1,13 +1,17 @@
 from flask import request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity, create_access_token
 from ..services.auth_service import AuthService
-from ..models.team import Team
+from ..models.scope import GameScoped, game_exists
+from ..utils.helpers import current_game_id
 
-class AuthController:
+class AuthController(GameScoped):
     def __init__(self, db_manager):
-        self.team_model = Team(db_manager)
+        self.db_manager = db_manager
     
     def register(self):
+        if not game_exists(self.db_manager, current_game_id()):
+            return jsonify({'error': 'Game not found'}), 404
+        
         data = request.get_json()
         name = data.get('name', '').strip()
         password = data.get('password', '').strip()
@@ -27,12 +31,12 @@ class AuthController:
         success, team_id, errors = self.team_model.create_team(name, password)
         if not success:
             if 'Maximum number of teams' in str(errors):
-                return jsonify({'error': 'Maximum number of teams (20) reached'}), 400
+                return jsonify({'error': errors['error']}), 400
             return jsonify({'error': errors}), 400
         
         # Get the created team to get the code
         team = self.team_model.get_by_id(team_id)
-        token = create_access_token(identity=team_id)
+        token = create_access_token(identity=team_id, additional_claims={'game_id': current_game_id()})
         
         return jsonify({
             'team_id': team_id,
@@ -49,7 +53,7 @@ class AuthController:
         if not team or not AuthService.verify_password(password, team['password_hash']):
             return jsonify({'error': 'Invalid credentials'}), 401
         
-        token = create_access_token(identity=str(team['_id']))
+        token = create_access_token(identity=str(team['_id']), additional_claims={'game_id': current_game_id()})
         
         return jsonify({
             'team_id': str(team['_id']),
@@ -1,38 +1,62 @@
-from flask import request, jsonify, current_app
+from flask import request, jsonify, current_app, stream_with_context
 from flask_jwt_extended import get_jwt_identity
 from datetime import datetime
 from ..services.game_service import GameManager
-from ..models.team import Team
-from ..models.page import Page
-from ..models.game_state import GameState
+from ..services.game_engine import get_game_engine
+from ..services.broadcast import emit, json_response, leaderboard_payload, status_payload
+from ..services.event_stream import event_streams
+from ..services.page_analytics import OUTCOME_CONFLICT, OUTCOME_CORRECT, OUTCOME_WRONG, page_analytics
+from ..models.page import get_page_table
+from ..models.scope import GameScoped, game_exists
 from ..utils.constants import GAME_STATUS_COMPLETED, TOTAL_PAGES
+from ..utils.helpers import normalize_answer, current_game_id
 
-class GameController:
+class GameController(GameScoped):
     def __init__(self, db_manager):
-        self.team_model = Team(db_manager)
-        self.page_model = Page(db_manager)
-        self.game_state_model = GameState(db_manager)
+        self.db_manager = db_manager
+    
+    def _engine_response(self, result):
+        """Broadcast the events of an engine command and build its HTTP response"""
+        for event, payload in result.events:
+            emit(event, payload, current_game_id())
+        return jsonify(result.body), result.status
     
     def status(self):
-        game_state = self.game_state_model.get_current()
-        current_page = self.page_model.get_by_number(game_state['current_page'])
-        
-        return jsonify({
-            'current_page': game_state['current_page'],
-            'game_status': game_state['game_status'],
-            'revealed_letters': game_state.get('revealed_letters', {}),
-            'page_info': current_page,
-            'word': GameManager.WORD
-        }), 200
+        return json_response(status_payload(current_game_id()))
+    
+    def stream(self):
+        """Read-only Server-Sent Events feed of a game's broadcasts for spectators (no authentication)"""
+        game_id = current_game_id()
+        if not game_exists(self.db_manager, game_id):
+            return jsonify({'error': 'Game not found'}), 404
+        if not event_streams.open():
+            return jsonify({'error': 'Too many spectators, try again later'}), 503
+        
+        def snapshot():
+            return [('game_status', status_payload(game_id).text), ('leaderboard', leaderboard_payload(game_id).text)]
+        
+        frames = event_streams.stream(game_id, request.headers.get('Last-Event-ID'), snapshot)
+        response = current_app.response_class(stream_with_context(frames), mimetype='text/event-stream')
+        response.call_on_close(event_streams.release)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
     
     def solve_page(self):
         team_id = get_jwt_identity()
+        engine = get_game_engine()
+        if engine:
+            answer = normalize_answer((request.get_json() or {}).get('answer', ''))
+            if not answer:
+                return jsonify({'error': 'Answer required'}), 400
+            return self._engine_response(engine.execute('solve_page', team_id=team_id, answer=answer))
+        
         team = self.team_model.get_by_id(team_id)
         if not team:
             return jsonify({'error': 'Team not found'}), 404
         
         data = request.get_json()
-        answer = data.get('answer', '').strip().upper()
+        answer = normalize_answer(data.get('answer', ''))
         
         if not answer:
             return jsonify({'error': 'Answer required'}), 400
@@ -43,18 +67,22 @@ class GameController:
         if game_state['game_status'] != 'in_progress':
             return jsonify({'error': 'Game is not in progress'}), 400
         
-        current_page = self.page_model.get_by_number(game_state['current_page'])
-        
-        if current_page.get('is_solved'):
-            return jsonify({'error': 'Page already solved'}), 400
+        def record_attempt(outcome, **details):
+            page_analytics.record_attempt(self.game_state_model.game_id, game_state.get('epoch', 0),
+                                          game_state['current_page'], outcome,
+                                          page_started_at=game_state.get('page_started_at'), **details)
         
-        if answer != current_page.get('solution'):
+        # Answer check against the preloaded page table; only the claim below touches the DB
+        if not get_page_table(self.page_model).check_answer(game_state['current_page'], answer):
+            record_attempt(OUTCOME_WRONG, answer=answer)
             return jsonify({'error': 'Incorrect answer'}), 400
         
         # Atomically mark page as solved
         success = self.page_model.mark_solved(game_state['current_page'], team['code'], answer)
         if not success:
+            record_attempt(OUTCOME_CONFLICT)
             return jsonify({'error': 'Page was solved by another team'}), 409
+        record_attempt(OUTCOME_CORRECT, team_code=team['code'])
         
         # If not last page, advance; if last page, complete game
         if game_state['current_page'] < TOTAL_PAGES:
@@ -66,29 +94,12 @@ class GameController:
         self.team_model.increment_noms(team_id)
         # Track solved page for team
         try:
-            self.team_model.collection.update_one(
-                {'_id': team['_id']},
-                {
-                    '$addToSet': {'solved_pages': game_state['current_page']},
-                    '$set': {'last_activity': datetime.utcnow()}
-                }
-            )
+            self.team_model.add_solved_page(team['_id'], game_state['current_page'])
         except Exception:
             pass
         # Broadcast page solved and page advance
-        try:
-            socketio = current_app.extensions.get('socketio')
-            if socketio:
-                socketio.emit('page_solved', {
-                    'page': game_state['current_page'],
-                    'team_code': team.get('code')
-                }, room='updates')
-                new_state = self.game_state_model.get_current()
-                socketio.emit('advance_page', {
-                    'current_page': new_state.get('current_page')
-                }, room='updates')
-        except Exception as emit_err:
-            current_app.logger.error('socket_emit_failed', error=str(emit_err))
+        emit('page_solved', {'page': game_state['current_page'], 'team_code': team.get('code')}, current_game_id())
+        emit('advance_page', {'current_page': self.game_state_model.get_current().get('current_page')}, current_game_id())
         
         response_data = {
             'message': 'Page solved successfully! You can now guess a letter.',
@@ -100,6 +111,13 @@ class GameController:
     
     def guess_letter(self):
         team_id = get_jwt_identity()
+        engine = get_game_engine()
+        if engine:
+            letter = (request.get_json() or {}).get('letter', '').strip().upper()
+            if not letter or len(letter) != 1:
+                return jsonify({'error': 'Invalid letter'}), 400
+            return self._engine_response(engine.execute('guess_letter', team_id=team_id, letter=letter))
+        
         team = self.team_model.get_by_id(team_id)
         if not team:
             return jsonify({'error': 'Team not found'}), 404
@@ -119,9 +137,9 @@ class GameController:
         if game_state['current_page'] > TOTAL_PAGES:
             return jsonify({'error': 'All pages have been solved'}), 400
         
-        current_page = self.page_model.get_by_number(game_state['current_page'])
-        if not current_page:
+        if not get_page_table(self.page_model).get(game_state['current_page']):
             return jsonify({'error': 'Invalid page'}), 400
+        current_page = self.page_model.get_solve_state(game_state['current_page']) or {}
         
         # Check if this team is the first solver
         if current_page.get('first_solver_team_code') != team['code']:
@@ -139,13 +157,10 @@ class GameController:
         if letter in game_state.get('revealed_letters', {}):
             return jsonify({'error': 'Letter already revealed'}), 400
         
-        positions = GameManager.get_letter_positions(letter)
+        positions = GameManager.get_letter_positions(letter, game_state.get('word'))
         
         # Mark letter as guessed for this page
-        self.page_model.collection.update_one(
-            {'number': game_state['current_page']},
-            {'$set': {'letter_guessed': True}}
-        )
+        self.page_model.mark_letter_guessed(game_state['current_page'])
         
         # Track this letter guess for the team
         self.team_model.add_letter_guess(team_id, letter, game_state['current_page'])
@@ -153,15 +168,7 @@ class GameController:
         if positions:
             self.game_state_model.reveal_letter(letter, positions)
             # Broadcast letter reveal
-            try:
-                socketio = current_app.extensions.get('socketio')
-                if socketio:
-                    socketio.emit('letter_guessed', {
-                        'letter': letter,
-                        'positions': positions
-                    }, room='updates')
-            except Exception as emit_err:
-                current_app.logger.error('socket_emit_failed', error=str(emit_err))
+            emit('letter_guessed', {'letter': letter, 'positions': positions}, current_game_id())
             return jsonify({
                 'correct': True,
                 'letter': letter,
@@ -177,6 +184,13 @@ class GameController:
     
     def guess_word(self):
         team_id = get_jwt_identity()
+        engine = get_game_engine()
+        if engine:
+            guess = (request.get_json() or {}).get('guess', '').strip().upper()
+            if not guess:
+                return jsonify({'error': 'Word guess required'}), 400
+            return self._engine_response(engine.execute('guess_word', team_id=team_id, guess=guess))
+        
         team = self.team_model.get_by_id(team_id)
         if not team:
             return jsonify({'error': 'Team not found'}), 404
@@ -196,7 +210,7 @@ class GameController:
         if len(team.get('word_guesses', [])) >= 3:
             return jsonify({'error': 'No more word guesses remaining'}), 400
         
-        is_correct = GameManager.validate_word_guess(guess)
+        is_correct = GameManager.validate_word_guess(guess, game_state.get('word'))
         
         self.team_model.add_guess(team_id, {
             'guess': guess,
@@ -207,15 +221,7 @@ class GameController:
         if is_correct:
             self.game_state_model.update_state({'game_status': GAME_STATUS_COMPLETED})
             # Broadcast word guessed
-            try:
-                socketio = current_app.extensions.get('socketio')
-                if socketio:
-                    socketio.emit('word_guessed', {
-                        'team_code': team.get('code'),
-                        'correct': True
-                    }, room='updates')
-            except Exception as emit_err:
-                current_app.logger.error('socket_emit_failed', error=str(emit_err))
+            emit('word_guessed', {'team_code': team.get('code'), 'correct': True}, current_game_id())
             return jsonify({
                 'correct': True,
                 'message': 'Congratulations! You guessed the word correctly!'
@@ -228,15 +234,7 @@ class GameController:
             remaining = updated_team.get('guesses_left', 0)
             
             # Broadcast wrong word guess
-            try:
-                socketio = current_app.extensions.get('socketio')
-                if socketio:
-                    socketio.emit('word_guessed', {
-                        'team_code': team.get('code'),
-                        'correct': False
-                    }, room='updates')
-            except Exception as emit_err:
-                current_app.logger.error('socket_emit_failed', error=str(emit_err))
+            emit('word_guessed', {'team_code': team.get('code'), 'correct': False}, current_game_id())
             return jsonify({
                 'correct': False,
                 'message': f'Incorrect guess. {remaining} guesses remaining.',
@@ -244,62 +242,28 @@ class GameController:
             }), 200
     
     def leaderboard(self):
-        teams = self.team_model.get_all()
-        rankings = []
-        for team in teams:
-            greens, yellows = GameManager.best_team_scores(team)
-            rankings.append({
-                'name': team.get('name'),
-                'code': team.get('code'),
-                'greens': greens,
-                'yellows': yellows,
-                'NOMs': team.get('NOMs', 0),
-                'word_guesses_count': len(team.get('word_guesses', [])),
-                'guesses_left': team.get('guesses_left', 3)
-            })
-        rankings.sort(key=lambda x: (-x['greens'], -x['NOMs'], -x['yellows']))
-        return jsonify({'rankings': rankings}), 200
+        return json_response(leaderboard_payload(current_game_id()))
     
     def start_game(self):
+        engine = get_game_engine()
+        if engine:
+            return self._engine_response(engine.execute('start_game'))
+        
         game_state = self.game_state_model.get_current()
         
         if game_state['game_status'] != 'waiting':
             return jsonify({'error': 'Game is not in waiting state'}), 400
         
-        self.game_state_model.update_state({'game_status': 'in_progress'})
+        self.game_state_model.update_state({'game_status': 'in_progress', 'page_started_at': datetime.utcnow()})
         return jsonify({'message': 'Game started successfully'}), 200
     
     def reset_game(self):
-        # Reset all pages
-        self.page_model.collection.update_many(
-            {},
-            {'$set': {
-                'is_solved': False,
-                'solved_by': None,
-                'solved_at': None,
-                'first_solver_team_code': None,
-                'letter_guessed': False
-            }}
-        )
-        
-        # Reset all teams
-        self.team_model.collection.update_many(
-            {},
-            {'$set': {
-                'word_guesses': [],
-                'guesses_left': 3,
-                'NOMs': 0,
-                'solved_pages': [],
-                'letter_guesses': [],
-                'current_word_state': ['_' for _ in GameManager.WORD]
-            }}
-        )
-        
-        # Reset game state
-        self.game_state_model.update_state({
-            'current_page': 1,
-            'revealed_letters': {},
-            'game_status': 'waiting'
-        })
+        engine = get_game_engine()
+        if engine:
+            return self._engine_response(engine.execute('reset_game'))
+        
+        # Starts a new epoch; pages and teams of the old one read as fresh and are archived in the background
+        if not self.game_state_model.reset_game():
+            return jsonify({'error': 'Failed to reset game'}), 500
         
         return jsonify({'message': 'Game reset successfully'}), 200
\ No newline at end of file
@@ -1,5 +1,12 @@
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+from flask import g, has_app_context
 from flask_pymongo import PyMongo
 from pymongo.errors import ConnectionFailure
+from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
 import logging
 
 logger = logging.getLogger(__name__)
@@ -8,21 +15,131 @@ class DatabaseManager:
     def __init__(self, app=None):
         self.mongo = None
         self.db = None
+        self.read_routes: Dict[str, str] = {}
+        self.collection_read_preferences: Dict[str, str] = {}
+        self.causal_sessions = False
+        self._routed = {}
+        self._health: Dict[str, Any] = {'status': 'unknown', 'db': 'unknown', 'checked_at': None}
+        self._probe: Optional[threading.Thread] = None
+        self._probe_interval = 5.0
         if app:
             self.init_app(app)
     
     def init_app(self, app):
+        cfg = app.config
+        self.read_routes = dict(cfg.get('MONGODB_READ_ROUTES', {}))
+        self.collection_read_preferences = dict(cfg.get('MONGODB_COLLECTION_READ_PREFERENCES', {}))
+        self.causal_sessions = cfg.get('MONGODB_CAUSAL_SESSIONS', True)
+        self._probe_interval = cfg.get('HEALTH_PROBE_INTERVAL', 5.0)
+        self._routed = {}
+        if cfg.get('STORAGE_BACKEND', 'mongo') == 'memory':
+            self._init_memory(cfg)
+        else:
+            self._init_mongo(app, cfg)
+        
+        @app.teardown_appcontext
+        def end_request_session(exc):
+            session = g.pop('mongo_session', None)
+            if session is not None:
+                session.end_session()
+    
+    def _init_mongo(self, app, cfg):
+        options = {
+            'maxPoolSize': cfg['MONGODB_MAX_POOL_SIZE'],
+            'minPoolSize': cfg['MONGODB_MIN_POOL_SIZE'],
+            'maxIdleTimeMS': cfg['MONGODB_MAX_IDLE_TIME_MS'],
+            'waitQueueTimeoutMS': cfg['MONGODB_WAIT_QUEUE_TIMEOUT_MS'],
+            'serverSelectionTimeoutMS': cfg['MONGODB_SERVER_SELECTION_TIMEOUT_MS'],
+            'connectTimeoutMS': cfg['MONGODB_CONNECT_TIMEOUT_MS'],
+            'socketTimeoutMS': cfg['MONGODB_SOCKET_TIMEOUT_MS'],
+            'w': int(cfg['MONGODB_WRITE_CONCERN']) if cfg['MONGODB_WRITE_CONCERN'].isdigit() else cfg['MONGODB_WRITE_CONCERN'],
+            'journal': cfg['MONGODB_WRITE_CONCERN_JOURNAL'],
+            'readPreference': cfg['MONGODB_READ_PREFERENCE']
+        }
+        # connect=False defers all network I/O to the first operation, so workers start instantly
+        self.mongo = PyMongo(app, uri=cfg['MONGODB_URI'], connect=False, **options)
+        self.db = self.mongo.db
+        self.client = self.mongo.cx
+    
+    def _init_memory(self, cfg):
+        """Embedded engine behind the same collection API; persisted when STORAGE_MEMORY_PATH is set"""
+        from .storage import Journal, MemoryClient
+        journal = None
+        if cfg.get('STORAGE_MEMORY_PATH'):
+            journal = Journal(cfg['STORAGE_MEMORY_PATH'], fsync=cfg.get('STORAGE_MEMORY_FSYNC', False),
+                              snapshot_bytes=cfg.get('STORAGE_MEMORY_SNAPSHOT_BYTES', 64 * 1024 * 1024))
+        self.mongo = None
+        self.client = MemoryClient(journal)
+        self.db = self.client[cfg['MONGODB_DATABASE']]
+        if journal is not None:
+            # Snapshot on a clean exit so the next start has no journal to replay
+            atexit.register(self.client.close)
+        logger.info(f"Using in-memory storage (persistence: {cfg.get('STORAGE_MEMORY_PATH') or 'none'})")
+    
+    def ping(self):
+        """Check connectivity; raises ConnectionFailure when MongoDB is unreachable"""
         try:
-            self.mongo = PyMongo(app)
-            self.db = self.mongo.db
-            self.client = self.mongo.cx
             self.client.admin.command('ping')
             logger.info("MongoDB connected")
         except ConnectionFailure as e:
             logger.error(f"MongoDB connection failed: {e}")
             raise
     
-    def get_collection(self, collection_name):
-        return self.db[collection_name]
+    def get_collection(self, collection_name, read_route: str = None):
+        """Collection handle; `read_route` (e.g. 'leaderboard', 'admin') selects a configured read preference"""
+        mode = self.read_routes.get(read_route) or self.collection_read_preferences.get(collection_name)
+        if not mode:
+            return self.db[collection_name]
+        key = (collection_name, mode)
+        if key not in self._routed:
+            read_preference = make_read_preference(read_pref_mode_from_name(mode), tag_sets=None)
+            self._routed[key] = self.db[collection_name].with_options(read_preference=read_preference)
+        return self._routed[key]
+    
+    def is_secondary_route(self, collection_name, read_route: str = None) -> bool:
+        mode = self.read_routes.get(read_route) or self.collection_read_preferences.get(collection_name)
+        return bool(mode) and mode != 'primary'
+    
+    def request_session(self):
+        """Causally consistent session shared by the routed reads of one request"""
+        if not self.causal_sessions or not has_app_context():
+            return None
+        if 'mongo_session' not in g:
+            g.mongo_session = self.client.start_session(causal_consistency=True)
+        return g.mongo_session
+    
+    @contextmanager
+    def causal_session(self):
+        """Explicit causal session for work outside a request"""
+        session = self.client.start_session(causal_consistency=True)
+        try:
+            yield session
+        finally:
+            session.end_session()
+    
+    def health(self) -> Dict[str, Any]:
+        """Last result of the background health probe (started on first call)"""
+        if self._probe is None:
+            self._probe_once()
+            self._probe = threading.Thread(target=self._run_probe, name='mongo-health-probe', daemon=True)
+            self._probe.start()
+        return dict(self._health)
+    
+    def _run_probe(self):
+        while True:
+            time.sleep(self._probe_interval)
+            self._probe_once()
+    
+    def _probe_once(self):
+        started = time.monotonic()
+        try:
+            self.client.admin.command('ping')
+            status = {'status': 'healthy', 'db': 'ok'}
+        except Exception as e:
+            logger.error(f"MongoDB health probe failed: {e}")
+            status = {'status': 'degraded', 'db': 'error'}
+        status['latency_ms'] = round((time.monotonic() - started) * 1000, 2)
+        status['checked_at'] = time.time()
+        self._health = status
 
-db_manager = DatabaseManager()
\ No newline at end of file
+db_manager = DatabaseManager()
@@ -0,0 +1,149 @@
+"""
+Response and WebSocket frame compression.
+
+HTTP: an `after_request` hook gzip/deflate-encodes buffered text responses
+(JSON, CSV, plain text) above a size threshold when the client accepts it.
+Streamed bodies (exports, the SSE stream) and responses that already carry a
+`Content-Encoding` go out untouched. Pre-encoded payloads from the broadcast
+cache are compressed once per version rather than once per request.
+
+WebSocket: simple-websocket, which the gevent driver uses when gevent-websocket
+is not installed, negotiates permessage-deflate at zlib's default settings.
+`configure_socket_deflate` swaps in an extension with a tunable level, window
+and minimum message size, or turns it off.
+"""
+import zlib
+from typing import Optional
+from flask import request
+from wsproto.extensions import PerMessageDeflate
+from wsproto.frame_protocol import Opcode
+import structlog
+
+logger = structlog.get_logger()
+
+ENCODING_GZIP = 'gzip'
+ENCODING_DEFLATE = 'deflate'
+# zlib window bits: gzip wrapper, zlib wrapper (HTTP "deflate")
+WBITS = {ENCODING_GZIP: 31, ENCODING_DEFLATE: 15}
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/plain', 'text/csv', 'text/html')
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Preferred of gzip/deflate by Accept-Encoding q-value (gzip on ties), or None"""
+    weights = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        weights[name.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for encoding in (ENCODING_GZIP, ENCODING_DEFLATE):
+        quality = weights.get(encoding, weights.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body: bytes, encoding: str, level: int) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, WBITS[encoding])
+    return compressor.compress(body) + compressor.flush()
+
+
+def init_response_compression(app):
+    """Register the compressing `after_request` hook (register before hooks that replace the response)"""
+    min_size = app.config.get('COMPRESSION_MIN_SIZE', 1024)
+    level = app.config.get('COMPRESSION_LEVEL', 3)
+
+    @app.after_request
+    def compress_response(response):
+        if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return response
+        response.vary.add('Accept-Encoding')
+        if (response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers
+                or response.status_code < 200 or response.status_code in (204, 304)):
+            return response
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+        if encoding is None:
+            return response
+        encoded = getattr(response, 'encoded', None)
+        body = encoded.body if encoded is not None else response.get_data()
+        if len(body) < min_size:
+            return response
+        compressed = encoded.compressed(encoding, level) if encoded is not None else compress(body, encoding, level)
+        if len(compressed) >= len(body):
+            return response
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        etag, _ = response.get_etag()
+        if etag:
+            # Same resource, different bytes
+            response.set_etag(etag, weak=True)
+        return response
+
+
+class TunedPerMessageDeflate(PerMessageDeflate):
+    """permessage-deflate with a compression level, a cap on the server window and a size floor.
+
+    Messages shorter than `min_size` go out as plain frames (RSV1 unset), which
+    the extension allows per message; they never touch the compression context.
+    """
+
+    enabled_by_config = True
+    level = zlib.Z_DEFAULT_COMPRESSION
+    window_bits = PerMessageDeflate.DEFAULT_SERVER_MAX_WINDOW_BITS
+    min_size = 0
+    no_context_takeover = False
+
+    def __init__(self):
+        super().__init__(server_no_context_takeover=self.no_context_takeover)
+
+    def accept(self, offer: str):
+        if not self.enabled_by_config:
+            return None
+        parameters = super().accept(offer)
+        if parameters is None or self.server_max_window_bits <= self.window_bits:
+            return parameters
+        # The server may lower its own window even when the client did not ask for it
+        self.server_max_window_bits = self.window_bits
+        parameters = [p for p in parameters.split('; ') if p and not p.startswith('server_max_window_bits')]
+        parameters.append(f'server_max_window_bits={self.window_bits}')
+        return '; '.join(parameters)
+
+    def frame_outbound(self, proto, opcode, rsv, data, fin):
+        if opcode is not Opcode.CONTINUATION and self._compressible_opcode(opcode):
+            if fin and len(data) < self.min_size:
+                return rsv, data
+            if self._compressor is None:
+                self._compressor = zlib.compressobj(self.level, zlib.DEFLATED, -int(self.server_max_window_bits))
+        return super().frame_outbound(proto, opcode, rsv, data, fin)
+
+
+def configure_socket_deflate(enabled: bool, level: int, window_bits: int, min_size: int,
+                             no_context_takeover: bool) -> bool:
+    """Use `TunedPerMessageDeflate` for new WebSocket connections; False when simple-websocket is not in use"""
+    try:
+        import geventwebsocket  # noqa: F401
+        # engine.io prefers gevent-websocket, which has no permessage-deflate
+        return False
+    except ImportError:
+        pass
+    try:
+        from simple_websocket import ws as simple_ws
+    except ImportError:
+        return False
+    TunedPerMessageDeflate.enabled_by_config = enabled
+    TunedPerMessageDeflate.level = level
+    TunedPerMessageDeflate.window_bits = window_bits
+    TunedPerMessageDeflate.min_size = min_size
+    TunedPerMessageDeflate.no_context_takeover = no_context_takeover
+    # Looked up by name on every handshake
+    simple_ws.PerMessageDeflate = TunedPerMessageDeflate
+    logger.info("WebSocket compression configured", enabled=enabled, compression_level=level, window_bits=window_bits)
+    return True
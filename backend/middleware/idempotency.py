@@ -0,0 +1,209 @@
+"""
+`Idempotency-Key` support for POST/DELETE endpoints.
+
+The first request with a key claims it in a TTL-indexed collection, runs, and
+stores its response there; a repeat of the key (same identity, game and path)
+gets that stored response back without touching the game. Completed responses
+are also kept in a per-process LRU, so a retry storm costs no database round
+trip at all. A key reused with a different body is rejected (422); a repeat
+that arrives while the first request is still running gets 409. Server errors
+and transient refusals (409, 429, 503, ...) are not stored, so a request that
+failed can be retried for real.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import wraps
+from typing import Any, Callable, Dict, Optional
+from flask import request, jsonify, current_app
+from flask_jwt_extended import get_jwt_identity
+from pymongo.errors import DuplicateKeyError
+import structlog
+
+from ..services.circuit_breaker import circuit_breaker
+from ..utils.helpers import current_game_id
+
+logger = structlog.get_logger()
+
+IDEMPOTENCY_COLLECTION = 'idempotency_keys'
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+STATE_IN_PROGRESS = 'in_progress'
+STATE_COMPLETED = 'completed'
+# Refusals that say "try again later" rather than answer the request; storing them would replay them for the TTL
+TRANSIENT_STATUSES = frozenset({408, 409, 423, 425, 429, 503})
+
+
+class ResponseLRU:
+    """Completed responses by scoped key, bounded and expiring with the collection's TTL"""
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            record = self._entries.get(key)
+            if record is None:
+                return None
+            if record['expires_at'] <= datetime.utcnow():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return record
+
+    def put(self, key: str, record: Dict[str, Any]):
+        with self._lock:
+            self._entries[key] = record
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class IdempotencyStore:
+    def __init__(self):
+        self.db_manager = None
+        self.ttl_seconds = 86400
+        self.lock_seconds = 30.0
+        self.cache = ResponseLRU()
+
+    def configure(self, db_manager, ttl_seconds: int, lock_seconds: float, cache_size: int):
+        self.db_manager = db_manager
+        self.ttl_seconds = ttl_seconds
+        self.lock_seconds = lock_seconds
+        self.cache = ResponseLRU(cache_size)
+
+    @property
+    def collection(self):
+        return self.db_manager.get_collection(IDEMPOTENCY_COLLECTION)
+
+    def claim(self, key: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """Claim `key` for this request: None when claimed, else the existing record"""
+        now = datetime.utcnow()
+        try:
+            circuit_breaker.call(lambda: self.collection.insert_one({
+                '_id': key,
+                'state': STATE_IN_PROGRESS,
+                'fingerprint': fingerprint,
+                'locked_until': now + timedelta(seconds=self.lock_seconds),
+                'created_at': now,
+                'expires_at': now + timedelta(seconds=self.ttl_seconds)
+            }))
+            return None
+        except DuplicateKeyError:
+            pass
+        existing = circuit_breaker.call(lambda: self.collection.find_one({'_id': key}))
+        if existing is None:
+            # Expired between the insert and the read
+            return self.claim(key, fingerprint)
+        if existing['state'] == STATE_IN_PROGRESS and existing['fingerprint'] == fingerprint:
+            # The first attempt's worker died mid-request: take its claim over once the lock lapses
+            taken = circuit_breaker.call(lambda: self.collection.update_one(
+                {'_id': key, 'state': STATE_IN_PROGRESS, 'locked_until': {'$lt': now}},
+                {'$set': {'locked_until': now + timedelta(seconds=self.lock_seconds)}}
+            ))
+            if taken.modified_count:
+                return None
+        return existing
+
+    def complete(self, key: str, fingerprint: str, status: int, body: bytes, mimetype: str):
+        record = {
+            'state': STATE_COMPLETED,
+            'fingerprint': fingerprint,
+            'status': status,
+            'body': body,
+            'mimetype': mimetype,
+            'expires_at': datetime.utcnow() + timedelta(seconds=self.ttl_seconds)
+        }
+        circuit_breaker.call(
+            lambda: self.collection.update_one({'_id': key}, {'$set': record, '$unset': {'locked_until': ''}})
+        )
+        self.cache.put(key, record)
+
+    def release(self, key: str):
+        """Drop an unfinished claim so the request can be retried for real"""
+        try:
+            circuit_breaker.call(lambda: self.collection.delete_one({'_id': key, 'state': STATE_IN_PROGRESS}))
+        except Exception as e:
+            logger.error("Failed to release idempotency key", error=str(e))
+
+
+idempotency_store = IdempotencyStore()
+
+
+def ensure_idempotency_indexes(db_manager):
+    collection = db_manager.get_collection(IDEMPOTENCY_COLLECTION)
+    collection.create_index('expires_at', expireAfterSeconds=0)
+
+
+def _error(message: str, status: int):
+    response = jsonify({'success': False, 'error': message})
+    response.status_code = status
+    return response
+
+
+def _replay(record: Dict[str, Any]):
+    response = current_app.response_class(bytes(record['body']), status=record['status'],
+                                          mimetype=record['mimetype'])
+    response.headers[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def idempotent(fn: Callable):
+    """Honour an `Idempotency-Key` header on a state-changing endpoint.
+
+    Must be applied below ``jwt_required`` (keys are scoped per identity) and below
+    ``rate_limit``, so a throttled client is turned away before its key is claimed.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not current_app.config.get('IDEMPOTENCY_ENABLED', True) or idempotency_store.db_manager is None:
+            return fn(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return _error(f'{HEADER} must be at most {MAX_KEY_LENGTH} characters', 400)
+        scoped = f'{get_jwt_identity()}:{current_game_id()}:{request.method}:{request.path}:{key}'
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+
+        record = idempotency_store.cache.get(scoped)
+        if record is None:
+            try:
+                record = idempotency_store.claim(scoped, fingerprint)
+            except Exception as e:
+                # A broken store must not take gameplay down with it
+                logger.error("Idempotency store failure", path=request.path, error=str(e))
+                return fn(*args, **kwargs)
+        if record is not None:
+            if record['fingerprint'] != fingerprint:
+                return _error(f'{HEADER} was already used with a different request body', 422)
+            if record['state'] == STATE_IN_PROGRESS:
+                response = _error('A request with this idempotency key is still in progress', 409)
+                response.headers['Retry-After'] = '1'
+                return response
+            idempotency_store.cache.put(scoped, record)
+            logger.info("Idempotent request replayed", path=request.path)
+            return _replay(record)
+
+        try:
+            response = current_app.make_response(fn(*args, **kwargs))
+        except Exception:
+            idempotency_store.release(scoped)
+            raise
+        try:
+            if response.status_code >= 500 or response.status_code in TRANSIENT_STATUSES or response.is_streamed:
+                idempotency_store.release(scoped)
+            else:
+                idempotency_store.complete(scoped, fingerprint, response.status_code, response.get_data(),
+                                           response.mimetype)
+        except Exception as e:
+            logger.error("Failed to store idempotent response", path=request.path, error=str(e))
+        return response
+    return wrapper
@@ -0,0 +1,116 @@
+import threading
+import time
+from functools import wraps
+from typing import Callable, Dict, Optional
+from flask import current_app, jsonify
+import structlog
+
+from ..utils.cooperative import Condition
+
+logger = structlog.get_logger()
+
+
+class AdmissionController:
+    """Bounded concurrency per endpoint class with priority-ordered, deadline-bound queues.
+
+    A request is admitted when both the global and its class limit have room and no
+    admissible request of a higher priority (lower number) is waiting. Requests that
+    cannot be admitted before their class queue timeout are shed. Queued requests
+    wait cooperatively, so under gevent the requests they wait for keep running.
+    """
+
+    def __init__(self, max_inflight: int, classes: Dict[str, Dict[str, float]]):
+        self.max_inflight = max_inflight
+        self.classes = classes
+        self._cond = Condition()
+        self._total = 0
+        self._inflight = {name: 0 for name in classes}
+        self._waiting = {name: 0 for name in classes}
+        self.shed_counts = {name: 0 for name in classes}
+
+    def _has_room(self, name: str) -> bool:
+        return self._total < self.max_inflight and self._inflight[name] < self.classes[name]['concurrency']
+
+    def _preempted(self, name: str) -> bool:
+        priority = self.classes[name]['priority']
+        return any(
+            self._waiting[other] and spec['priority'] < priority and self._has_room(other)
+            for other, spec in self.classes.items()
+        )
+
+    def _admit(self, name: str):
+        self._total += 1
+        self._inflight[name] += 1
+
+    def acquire(self, name: str) -> bool:
+        deadline = time.monotonic() + self.classes[name]['queue_timeout']
+        with self._cond:
+            if self._has_room(name) and not self._preempted(name):
+                self._admit(name)
+                return True
+            self._waiting[name] += 1
+            try:
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.shed_counts[name] += 1
+                        return False
+                    self._cond.wait(remaining)
+                    if self._has_room(name) and not self._preempted(name):
+                        self._admit(name)
+                        return True
+            finally:
+                self._waiting[name] -= 1
+
+    def release(self, name: str):
+        with self._cond:
+            self._total -= 1
+            self._inflight[name] -= 1
+            self._cond.notify_all()
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._cond:
+            return {
+                name: {
+                    'inflight': self._inflight[name],
+                    'waiting': self._waiting[name],
+                    'shed': self.shed_counts[name]
+                }
+                for name in self.classes
+            }
+
+
+_controller: Optional[AdmissionController] = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                cfg = current_app.config
+                _controller = AdmissionController(cfg['LOAD_SHED_MAX_INFLIGHT'], cfg['LOAD_SHED_CLASSES'])
+    return _controller
+
+
+def load_shed(endpoint_class: str):
+    """Admit the request through the `endpoint_class` queue or fail fast with 503"""
+    def decorator(fn: Callable):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not current_app.config.get('LOAD_SHED_ENABLED', True):
+                return fn(*args, **kwargs)
+            controller = get_admission_controller()
+            if not controller.acquire(endpoint_class):
+                logger.warning("Request shed", endpoint_class=endpoint_class)
+                response = jsonify({'success': False, 'error': 'Server overloaded, retry shortly'})
+                response.status_code = 503
+                response.headers['Retry-After'] = '1'
+                return response
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                controller.release(endpoint_class)
+        return wrapper
+    return decorator
@@ -1,7 +1,17 @@
+import math
+import threading
+import time
 from functools import wraps
-from typing import Callable, List
-from flask import request, jsonify
+from typing import Callable, List, Tuple
+from flask import request, jsonify, current_app
+from flask_jwt_extended import get_jwt_identity
 from decouple import config as env_config
+import structlog
+
+from ..services.circuit_breaker import circuit_breaker
+from ..utils.helpers import is_admin_request
+
+logger = structlog.get_logger()
 
 
 def validate_required_fields(required_fields: List[str]):
@@ -20,11 +30,129 @@ def validate_required_fields(required_fields: List[str]):
 def admin_required(fn: Callable):
     @wraps(fn)
     def wrapper(*args, **kwargs):
-        admin_token_header = request.headers.get('X-Admin-Token')
-        expected = env_config('ADMIN_TOKEN', default='')
-        if not expected:
+        if not env_config('ADMIN_TOKEN', default=''):
             return jsonify({'success': False, 'error': 'Admin token not configured'}), 500
-        if not admin_token_header or admin_token_header != expected:
+        if not is_admin_request():
             return jsonify({'success': False, 'error': 'Admin authorization required'}), 403
         return fn(*args, **kwargs)
     return wrapper
+
+
+class InMemoryTokenBuckets:
+    """Per-process token buckets keyed by an arbitrary string"""
+
+    MAX_KEYS = 10000
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key: str, capacity: int, refill_rate: float) -> Tuple[bool, float]:
+        """Take one token; returns (allowed, seconds until a token is available)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (float(capacity), now))
+            tokens = min(float(capacity), tokens + (now - last) * refill_rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                allowed, retry_after = True, 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                allowed, retry_after = False, (1 - tokens) / refill_rate
+            if len(self._buckets) > self.MAX_KEYS:
+                self._prune(now, capacity, refill_rate)
+        return allowed, retry_after
+
+    def _prune(self, now: float, capacity: int, refill_rate: float):
+        # Buckets that would be full again carry no state worth keeping
+        full_after = capacity / refill_rate
+        for key in [k for k, (_, last) in self._buckets.items() if now - last >= full_after]:
+            del self._buckets[key]
+
+
+RATE_LIMIT_COLLECTION = 'rate_limits'
+
+
+class MongoTokenBuckets:
+    """Token buckets shared by all workers through an atomic pipeline update.
+
+    A bucket left alone until it has refilled is the same as no bucket, so each
+    update pushes `expires_at` that far out and a TTL index removes idle ones.
+    """
+
+    def __init__(self, db_manager, collection_name: str = RATE_LIMIT_COLLECTION):
+        self.db_manager = db_manager
+        self.collection_name = collection_name
+
+    def consume(self, key: str, capacity: int, refill_rate: float) -> Tuple[bool, float]:
+        from pymongo import ReturnDocument
+        collection = self.db_manager.get_collection(self.collection_name)
+        elapsed = {'$divide': [{'$subtract': ['$$NOW', {'$ifNull': ['$updated_at', '$$NOW']}]}, 1000]}
+        refilled = {'$min': [capacity, {'$add': [{'$ifNull': ['$tokens', capacity]}, {'$multiply': [elapsed, refill_rate]}]}]}
+        idle_ms = math.ceil(capacity / refill_rate * 1000)
+        doc = circuit_breaker.call(lambda: collection.find_one_and_update(
+            {'_id': key},
+            [
+                {'$set': {'tokens': refilled, 'updated_at': '$$NOW', 'expires_at': {'$add': ['$$NOW', idle_ms]}}},
+                {'$set': {'allowed': {'$gte': ['$tokens', 1]}}},
+                {'$set': {'tokens': {'$cond': ['$allowed', {'$subtract': ['$tokens', 1]}, '$tokens']}}}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        ))
+        if doc['allowed']:
+            return True, 0.0
+        return False, (1 - doc['tokens']) / refill_rate
+
+
+def ensure_rate_limit_indexes(db_manager):
+    db_manager.get_collection(RATE_LIMIT_COLLECTION).create_index('expires_at', expireAfterSeconds=0)
+
+
+class RateLimiter:
+    def __init__(self):
+        self._backends = {}
+
+    def backend(self, name: str):
+        if name not in self._backends:
+            if name == 'mongo':
+                from ..database import db_manager
+                self._backends[name] = MongoTokenBuckets(db_manager)
+            else:
+                self._backends[name] = InMemoryTokenBuckets()
+        return self._backends[name]
+
+    def consume(self, key: str) -> Tuple[bool, float]:
+        cfg = current_app.config
+        backend = self.backend(cfg.get('RATE_LIMIT_BACKEND', 'memory'))
+        return backend.consume(key, cfg.get('RATE_LIMIT_CAPACITY', 10), cfg.get('RATE_LIMIT_REFILL_RATE', 1.0))
+
+
+rate_limiter = RateLimiter()
+
+
+def rate_limit(scope: str):
+    """Shed requests from a JWT identity that exceeds its token bucket for `scope`.
+
+    Must be applied below ``jwt_required`` so the identity is already verified.
+    """
+    def decorator(fn: Callable):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not current_app.config.get('RATE_LIMIT_ENABLED', True):
+                return fn(*args, **kwargs)
+            identity = get_jwt_identity()
+            try:
+                allowed, retry_after = rate_limiter.consume(f'{scope}:{identity}')
+            except Exception as e:
+                # A broken limiter backend must not take gameplay down with it
+                logger.error("Rate limiter failure", scope=scope, error=str(e))
+                return fn(*args, **kwargs)
+            if not allowed:
+                response = jsonify({'success': False, 'error': 'Too many requests', 'retry_after': round(retry_after, 2)})
+                response.status_code = 429
+                response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+                return response
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,25 +1,109 @@
+import time
 from datetime import datetime
 from bson import ObjectId
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Callable, Dict, List, Optional, Union
 import structlog
 from ..utils.helpers import serialize_object, is_valid_object_id
+from ..utils.constants import DEFAULT_GAME_ID
+from ..services.slow_query_log import slow_query_log
+from ..services.circuit_breaker import UNAVAILABLE_ERRORS, CircuitOpenError, circuit_breaker
 
 logger = structlog.get_logger()
 
+# Callables notified of every model operation as (collection, operation, query, details); used by `check-indexes`
+operation_observers: List[Callable[[str, str, Dict[str, Any], Dict[str, Any]], None]] = []
+
 class BaseModel:
-    def __init__(self, collection_name: str, db_manager):
+    def __init__(self, collection_name: str, db_manager, game_id: str = DEFAULT_GAME_ID):
         self.collection_name = collection_name
         self.collection = db_manager.get_collection(collection_name)
         self.db_manager = db_manager
+        self.game_id = game_id
+    
+    def scoped(self, query: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Restrict a query to this model's game"""
+        scoped_query = dict(query or {})
+        scoped_query['game_id'] = self.game_id
+        return scoped_query
+    
+    def _execute(self, operation: str, query: Dict[str, Any], call, **details):
+        """Run one collection operation, timing it for the slow-query log.
+
+        Every collection call of a model goes through here; `details` (sort,
+        update, pipeline) are only used to explain the operation if it is slow.
+        While the database circuit is open it raises `CircuitOpenError` at once.
+        """
+        if not circuit_breaker.allow():
+            raise CircuitOpenError(circuit_breaker.retry_after)
+        started = time.perf_counter()
+        error = None
+        try:
+            return call()
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            circuit_breaker.record(elapsed_ms, error)
+            slow_query_log.observe(self.collection_name, operation, query, elapsed_ms, **details)
+            for observer in operation_observers:
+                observer(self.collection_name, operation, query, details)
+    
+    def _find_one(self, query: Dict[str, Any], projection: Dict[str, Any] = None, collection=None, session=None):
+        collection = collection if collection is not None else self.collection
+        return self._execute('find_one', query, lambda: collection.find_one(query, projection, session=session))
+    
+    def _find(self, query: Dict[str, Any], sort: List[tuple] = None, skip: int = None, limit: int = None,
+              projection: Dict[str, Any] = None, collection=None, session=None) -> List[Dict[str, Any]]:
+        collection = collection if collection is not None else self.collection
+        def run():
+            cursor = collection.find(query, projection, session=session)
+            if sort:
+                cursor = cursor.sort(sort)
+            if skip:
+                cursor = cursor.skip(skip)
+            if limit:
+                cursor = cursor.limit(limit)
+            return list(cursor)
+        return self._execute('find', query, run, sort=sort)
+    
+    def _count(self, query: Dict[str, Any], collection=None, session=None, **kwargs) -> int:
+        collection = collection if collection is not None else self.collection
+        return self._execute('count', query, lambda: collection.count_documents(query, session=session, **kwargs))
+    
+    def _update_one(self, query: Dict[str, Any], update, **kwargs):
+        return self._execute('update_one', query, lambda: self.collection.update_one(query, update, **kwargs), update=update)
+    
+    def _update_many(self, query: Dict[str, Any], update, **kwargs):
+        return self._execute('update_many', query, lambda: self.collection.update_many(query, update, **kwargs), update=update)
+    
+    def _delete_one(self, query: Dict[str, Any]):
+        return self._execute('delete_one', query, lambda: self.collection.delete_one(query))
+    
+    def _delete_many(self, query: Dict[str, Any]):
+        return self._execute('delete_many', query, lambda: self.collection.delete_many(query))
+    
+    def _insert_one(self, document: Dict[str, Any]):
+        return self._execute('insert_one', {}, lambda: self.collection.insert_one(document))
+    
+    def _insert_many(self, documents: List[Dict[str, Any]], **kwargs):
+        return self._execute('insert_many', {}, lambda: self.collection.insert_many(documents, **kwargs))
+    
+    def _aggregate(self, pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        query = pipeline[0].get('$match', {}) if pipeline else {}
+        return self._execute('aggregate', query, lambda: list(self.collection.aggregate(pipeline)), pipeline=pipeline)
     
     def create(self, data: Dict[str, Any]) -> str:
         """Create a new document"""
         try:
+            data['game_id'] = self.game_id
             data['created_at'] = datetime.utcnow()
             data['updated_at'] = datetime.utcnow()
-            result = self.collection.insert_one(data)
+            result = self._insert_one(data)
             logger.info("Document created", collection=self.collection_name, id=str(result.inserted_id))
             return str(result.inserted_id)
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to create document", collection=self.collection_name, error=str(e))
             raise
@@ -29,7 +113,9 @@ class BaseModel:
         try:
             if not is_valid_object_id(id):
                 return None
-            return self.collection.find_one({'_id': ObjectId(id)})
+            return self._find_one(self.scoped({'_id': ObjectId(id)}))
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to get document by ID", collection=self.collection_name, id=id, error=str(e))
             return None
@@ -40,11 +126,13 @@ class BaseModel:
             if not is_valid_object_id(id):
                 return False
             data['updated_at'] = datetime.utcnow()
-            result = self.collection.update_one({'_id': ObjectId(id)}, {'$set': data})
+            result = self._update_one(self.scoped({'_id': ObjectId(id)}), {'$set': data})
             success = result.modified_count > 0
             if success:
                 logger.info("Document updated", collection=self.collection_name, id=id)
             return success
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to update document", collection=self.collection_name, id=id, error=str(e))
             return False
@@ -54,11 +142,13 @@ class BaseModel:
         try:
             if not is_valid_object_id(id):
                 return False
-            result = self.collection.delete_one({'_id': ObjectId(id)})
+            result = self._delete_one(self.scoped({'_id': ObjectId(id)}))
             success = result.deleted_count > 0
             if success:
                 logger.info("Document deleted", collection=self.collection_name, id=id)
             return success
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to delete document", collection=self.collection_name, id=id, error=str(e))
             return False
@@ -66,35 +156,39 @@ class BaseModel:
     def find_one(self, query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Find one document by query"""
         try:
-            return self.collection.find_one(query)
+            return self._find_one(self.scoped(query))
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to find document", collection=self.collection_name, query=query, error=str(e))
             return None
     
+    def routed(self, read_route: str = None):
+        """Collection and causal session for a read path (see DatabaseManager.get_collection)"""
+        if not read_route or not self.db_manager.is_secondary_route(self.collection_name, read_route):
+            return self.collection, None
+        return self.db_manager.get_collection(self.collection_name, read_route), self.db_manager.request_session()
+    
     def find_many(self, query: Dict[str, Any] = None, sort: List[tuple] = None, 
-                  limit: int = None, skip: int = None) -> List[Dict[str, Any]]:
+                  limit: int = None, skip: int = None, read_route: str = None) -> List[Dict[str, Any]]:
         """Find multiple documents by query"""
         try:
-            cursor = self.collection.find(query or {})
-            
-            if sort:
-                cursor = cursor.sort(sort)
-            
-            if skip:
-                cursor = cursor.skip(skip)
-            
-            if limit:
-                cursor = cursor.limit(limit)
-            
-            return list(cursor)
+            collection, session = self.routed(read_route)
+            return self._find(self.scoped(query), sort=sort, skip=skip, limit=limit,
+                              collection=collection, session=session)
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to find documents", collection=self.collection_name, query=query, error=str(e))
             return []
     
-    def count(self, query: Dict[str, Any] = None) -> int:
+    def count(self, query: Dict[str, Any] = None, read_route: str = None) -> int:
         """Count documents by query"""
         try:
-            return self.collection.count_documents(query or {})
+            collection, session = self.routed(read_route)
+            return self._count(self.scoped(query), collection=collection, session=session)
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to count documents", collection=self.collection_name, query=query, error=str(e))
             return 0
@@ -102,23 +196,28 @@ class BaseModel:
     def exists(self, query: Dict[str, Any]) -> bool:
         """Check if document exists"""
         try:
-            return self.collection.count_documents(query, limit=1) > 0
+            return self._count(self.scoped(query), limit=1) > 0
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to check document existence", collection=self.collection_name, query=query, error=str(e))
             return False
     
-    def bulk_create(self, data_list: List[Dict[str, Any]]) -> List[str]:
-        """Create multiple documents"""
+    def bulk_create(self, data_list: List[Dict[str, Any]], ordered: bool = True) -> List[str]:
+        """Create multiple documents; with ordered=False every valid document is inserted even if some fail"""
         try:
             now = datetime.utcnow()
             for data in data_list:
+                data['game_id'] = self.game_id
                 data['created_at'] = now
                 data['updated_at'] = now
             
-            result = self.collection.insert_many(data_list)
+            result = self._insert_many(data_list, ordered=ordered)
             ids = [str(id) for id in result.inserted_ids]
             logger.info("Bulk documents created", collection=self.collection_name, count=len(ids))
             return ids
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to bulk create documents", collection=self.collection_name, error=str(e))
             raise
@@ -129,9 +228,11 @@ class BaseModel:
             if '$set' not in update:
                 update['$set'] = {}
             update['$set']['updated_at'] = datetime.utcnow()
-            result = self.collection.update_many(query, update)
+            result = self._update_many(self.scoped(query), update)
             logger.info("Bulk documents updated", collection=self.collection_name, count=result.modified_count)
             return result.modified_count
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to bulk update documents", collection=self.collection_name, error=str(e))
             return 0
@@ -139,7 +240,9 @@ class BaseModel:
     def aggregate(self, pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Run aggregation pipeline"""
         try:
-            return list(self.collection.aggregate(pipeline))
+            return self._aggregate([{'$match': self.scoped()}] + pipeline)
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to run aggregation", collection=self.collection_name, pipeline=pipeline, error=str(e))
             return []
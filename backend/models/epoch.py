@@ -0,0 +1,241 @@
+"""
+Reset epochs.
+
+Game progress on pages and teams belongs to the epoch stamped on each document.
+A reset only bumps ``epoch`` on the game_state document; documents from an older
+epoch read as their defaults, are rolled over (archived, then reset) before they
+are next written, and are rolled over in bulk by a background sweep. Archived
+progress stays in ``epoch_archive`` for review.
+"""
+import copy
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from flask import g, has_app_context
+from pymongo import UpdateOne
+import structlog
+
+from ..services.circuit_breaker import circuit_breaker
+from ..utils.constants import GAME_STATUS_WAITING
+
+logger = structlog.get_logger()
+
+EPOCH_ARCHIVE_COLLECTION = 'epoch_archive'
+
+# Game state fields a reset restores; everything else (word, team counters) survives resets
+STATE_RESET_FIELDS = {
+    'current_page': 1,
+    'revealed_letters': {},
+    'game_status': GAME_STATUS_WAITING,
+    'game_start_time': None,
+    'game_end_time': None,
+    'page_started_at': None
+}
+
+# Number of past epochs summarized on the game_state document
+EPOCH_HISTORY_LIMIT = 50
+
+# Copied next to archived progress so an archive entry can be read on its own
+IDENTITY_FIELDS = ('number', 'code', 'name')
+
+
+def current_epoch(db_manager, game_id: str) -> int:
+    """Epoch of a game, read once per request"""
+    cache = g.setdefault('game_epochs', {}) if has_app_context() else {}
+    if game_id not in cache:
+        collection = db_manager.get_collection('game_state')
+        state = circuit_breaker.call(lambda: collection.find_one({'game_id': game_id, 'type': 'current'}, {'epoch': 1}))
+        cache[game_id] = (state or {}).get('epoch', 0)
+    return cache[game_id]
+
+
+def remember_epoch(game_id: str, epoch: int):
+    if has_app_context():
+        g.setdefault('game_epochs', {})[game_id] = epoch
+
+
+def next_epoch_state(state: Dict[str, Any], now: datetime = None) -> Dict[str, Any]:
+    """Absolute `$set` that resets a game state into a new epoch, keeping a summary of the one that ended"""
+    now = now or datetime.utcnow()
+    epoch = state.get('epoch', 0)
+    history = list(state.get('epochs', []))
+    history.append({
+        'epoch': epoch,
+        'started_at': state.get('epoch_started_at') or state.get('created_at'),
+        'ended_at': now,
+        'game_status': state.get('game_status'),
+        'current_page': state.get('current_page'),
+        'revealed_letters': state.get('revealed_letters', {})
+    })
+    return dict(
+        copy.deepcopy(STATE_RESET_FIELDS),
+        epoch=epoch + 1,
+        epoch_started_at=now,
+        epochs=history[-EPOCH_HISTORY_LIMIT:],
+        updated_at=now
+    )
+
+
+def fresh_view(document: Optional[Dict[str, Any]], epoch: int, defaults: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """A document as it reads in `epoch`: progress from an older epoch is replaced by defaults"""
+    if document is None or document.get('epoch', 0) >= epoch:
+        return document
+    return dict(document, **copy.deepcopy(defaults), epoch=epoch)
+
+
+def identity_query(query: Dict[str, Any], defaults: Dict[str, Any]) -> Dict[str, Any]:
+    """`query` without its conditions on progress fields, which describe an epoch rather than a document.
+
+    `$and` clauses are merged in; `$or`/`$nor` and other operators are dropped, since
+    they may test progress. The result can match more documents, never fewer.
+    """
+    identity = {}
+    for key, condition in query.items():
+        if key == '$and':
+            for clause in condition:
+                identity.update(identity_query(clause, defaults))
+        elif not key.startswith('$') and key.split('.')[0] not in defaults:
+            identity[key] = condition
+    return identity
+
+
+def rollover(db_manager, collection_name: str, query: Dict[str, Any], epoch: int, defaults: Dict[str, Any]) -> int:
+    """Archive the progress of stale documents `query` identifies, then reset them into `epoch`.
+
+    Conditions on progress fields are ignored: a write guarded by one (`is_solved: False`)
+    is about the document's progress in `epoch`, which is the defaults until it rolls over.
+    Archiving is an idempotent upsert, so concurrent rollovers of the same document are harmless.
+    """
+    collection = db_manager.get_collection(collection_name)
+    stale_query = dict(identity_query(query, defaults), epoch={'$lt': epoch})
+    projection = dict.fromkeys(list(defaults) + list(IDENTITY_FIELDS) + ['game_id', 'epoch'], 1)
+    stale = list(collection.find(stale_query, projection))
+    if not stale:
+        return 0
+    now = datetime.utcnow()
+    db_manager.get_collection(EPOCH_ARCHIVE_COLLECTION).bulk_write([
+        UpdateOne(
+            {'game_id': doc['game_id'], 'collection': collection_name, 'doc_id': doc['_id'], 'epoch': doc.get('epoch', 0)},
+            {'$setOnInsert': {
+                'ref': {field: doc[field] for field in IDENTITY_FIELDS if field in doc},
+                'progress': {field: doc.get(field) for field in defaults},
+                'archived_at': now
+            }},
+            upsert=True
+        )
+        for doc in stale
+    ], ordered=False)
+    result = collection.update_many(
+        {'_id': {'$in': [doc['_id'] for doc in stale]}, 'epoch': {'$lt': epoch}},
+        {'$set': dict(copy.deepcopy(defaults), epoch=epoch, updated_at=now)}
+    )
+    return result.modified_count
+
+
+class EpochScoped:
+    """Mixin for models whose progress fields (`PROGRESS_DEFAULTS`) are scoped by the game's epoch.
+
+    Hooks the BaseModel chokepoints: reads return fresh views, inserts are stamped
+    with the current epoch and updates only touch current documents, rolling a
+    stale document over first.
+    """
+
+    PROGRESS_DEFAULTS: Dict[str, Any] = {}
+
+    def current_epoch(self) -> int:
+        return current_epoch(self.db_manager, self.game_id)
+
+    def current(self, query: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Restrict a query on progress fields to documents of the current epoch"""
+        return dict(query or {}, epoch=self.current_epoch())
+
+    def fresh(self, document: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        return fresh_view(document, self.current_epoch(), self.PROGRESS_DEFAULTS)
+
+    def rollover(self, query: Dict[str, Any] = None) -> int:
+        return rollover(self.db_manager, self.collection_name, self.scoped(query), self.current_epoch(),
+                        self.PROGRESS_DEFAULTS)
+
+    @staticmethod
+    def _with_epoch(projection):
+        # Views need the epoch of projected documents too
+        if projection and all(projection.values()):
+            return dict(projection, epoch=1)
+        return projection
+
+    def _find_one(self, query, projection=None, collection=None, session=None):
+        return self.fresh(super()._find_one(query, self._with_epoch(projection), collection=collection, session=session))
+
+    def _find(self, query, sort=None, skip=None, limit=None, projection=None, collection=None, session=None):
+        documents = super()._find(query, sort=sort, skip=skip, limit=limit, projection=self._with_epoch(projection),
+                                  collection=collection, session=session)
+        return [self.fresh(document) for document in documents]
+
+    def _insert_one(self, document):
+        document.setdefault('epoch', self.current_epoch())
+        return super()._insert_one(document)
+
+    def _insert_many(self, documents, **kwargs):
+        epoch = self.current_epoch()
+        for document in documents:
+            document.setdefault('epoch', epoch)
+        return super()._insert_many(documents, **kwargs)
+
+    def _update_one(self, query, update, **kwargs):
+        epoch = self.current_epoch()
+        result = super()._update_one(dict(query, epoch=epoch), update, **kwargs)
+        if result.matched_count == 0:
+            # The document may be stale; retried even if nothing rolled here, since the sweep may have just done it
+            rollover(self.db_manager, self.collection_name, query, epoch, self.PROGRESS_DEFAULTS)
+            result = super()._update_one(dict(query, epoch=epoch), update, **kwargs)
+        return result
+
+    def _update_many(self, query, update, **kwargs):
+        epoch = self.current_epoch()
+        rollover(self.db_manager, self.collection_name, query, epoch, self.PROGRESS_DEFAULTS)
+        return super()._update_many(dict(query, epoch=epoch), update, **kwargs)
+
+
+def sweep_game(db_manager, game_id: str, epoch: int, batch_size: int = 500) -> int:
+    """Roll every stale page and team of a game over into `epoch`"""
+    from .page import SOLVE_STATE_DEFAULTS
+    from .team import TEAM_PROGRESS_DEFAULTS
+
+    rolled = 0
+    for collection_name, defaults in (('pages', SOLVE_STATE_DEFAULTS), ('teams', TEAM_PROGRESS_DEFAULTS)):
+        collection = db_manager.get_collection(collection_name)
+        while True:
+            batch = [doc['_id'] for doc in
+                     collection.find({'game_id': game_id, 'epoch': {'$lt': epoch}}, {'_id': 1}).limit(batch_size)]
+            if not batch:
+                break
+            rolled += rollover(db_manager, collection_name, {'game_id': game_id, '_id': {'$in': batch}}, epoch, defaults)
+    return rolled
+
+
+def schedule_sweep(db_manager, game_id: str, epoch: int):
+    """Sweep stale documents of a game on a background thread"""
+    def run():
+        try:
+            rolled = sweep_game(db_manager, game_id, epoch)
+            logger.info("Epoch sweep finished", game_id=game_id, epoch=epoch, rolled=rolled)
+        except Exception as e:
+            # Nothing is lost: stale documents still read as defaults and roll over (by identity) on write
+            logger.error("Epoch sweep failed", game_id=game_id, epoch=epoch, error=str(e))
+    threading.Thread(target=run, name=f'epoch-sweep-{game_id}', daemon=True).start()
+
+
+def ensure_archive_indexes(db_manager):
+    archive = db_manager.get_collection(EPOCH_ARCHIVE_COLLECTION)
+    archive.create_index([('game_id', 1), ('epoch', 1), ('collection', 1), ('doc_id', 1)], unique=True)
+
+
+def archived_progress(db_manager, game_id: str, epoch: int, read_route: str = None) -> List[Dict[str, Any]]:
+    archive = db_manager.get_collection(EPOCH_ARCHIVE_COLLECTION, read_route)
+    return list(archive.find({'game_id': game_id, 'epoch': epoch}).sort([('collection', 1), ('doc_id', 1)]))
+
+
+def stamp_legacy_epochs(db_manager):
+    """Documents from before epochs belong to epoch 0"""
+    for name in ('pages', 'teams', 'game_state'):
+        db_manager.get_collection(name).update_many({'epoch': {'$exists': False}}, {'$set': {'epoch': 0}})
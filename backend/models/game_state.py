@@ -1,43 +1,57 @@
 from datetime import datetime
 from typing import Any, Dict, List, Optional
 from .base import BaseModel
-from ..utils.constants import GAME_WORD, GAME_STATUS_WAITING, GAME_STATUS_ACTIVE, GAME_STATUS_COMPLETED, TOTAL_PAGES
+from .epoch import next_epoch_state, remember_epoch, schedule_sweep
+from ..services.circuit_breaker import UNAVAILABLE_ERRORS
+from ..utils.constants import DEFAULT_GAME_ID, GAME_WORD, GAME_STATUS_WAITING, GAME_STATUS_ACTIVE, GAME_STATUS_COMPLETED, TOTAL_PAGES
 import structlog
 
 logger = structlog.get_logger()
 
+class GameNotFoundError(LookupError):
+    """The game has no state document"""
+
+
 class GameState(BaseModel):
-    def __init__(self, db_manager):
-        super().__init__('game_state', db_manager)
-        self._create_indexes()
+    def __init__(self, db_manager, game_id=DEFAULT_GAME_ID):
+        super().__init__('game_state', db_manager, game_id)
     
-    def _create_indexes(self):
+    def ensure_indexes(self):
         """Create database indexes for game_state collection"""
         try:
-            self.create_index('type', unique=True)
-            self.create_index('game_status')
-            self.create_index('current_page')
+            self.create_index([('game_id', 1), ('type', 1)], unique=True)
         except Exception as e:
             logger.warning("Failed to create some indexes", collection='game_state', error=str(e))
     
     def get_current(self) -> Dict[str, Any]:
-        """Get current game state"""
+        """Get current game state; only the default game is created on first use"""
         state = self.find_one({'type': 'current'})
         if not state:
+            if self.game_id != DEFAULT_GAME_ID:
+                # Other games exist only once provisioned (POST /api/admin/games)
+                raise GameNotFoundError(self.game_id)
             state = self._create_default_state()
         return state
     
-    def _create_default_state(self) -> Dict[str, Any]:
+    def get_word(self) -> str:
+        """Target word of this game"""
+        return self.get_current().get('word') or GAME_WORD
+    
+    def _create_default_state(self, word: str = None) -> Dict[str, Any]:
         """Create default game state"""
         state = {
             'type': 'current',
+            'word': word or GAME_WORD,
             'current_page': 1,
             'revealed_letters': {},
             'game_status': GAME_STATUS_WAITING,
             'game_start_time': None,
             'game_end_time': None,
+            'page_started_at': None,
             'total_teams': 0,
             'active_teams': 0,
+            'epoch': 0,
+            'epoch_started_at': datetime.utcnow(),
             'created_at': datetime.utcnow(),
             'updated_at': datetime.utcnow()
         }
@@ -45,6 +59,8 @@ class GameState(BaseModel):
         try:
             self.create(state)
             logger.info("Default game state created")
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to create default game state", error=str(e))
         
@@ -54,16 +70,21 @@ class GameState(BaseModel):
         """Update game state"""
         try:
             data['updated_at'] = datetime.utcnow()
-            result = self.collection.update_one(
-                {'type': 'current'},
+            if 'current_page' in data:
+                # Page analytics time solves from the moment a page becomes current
+                data.setdefault('page_started_at', data['updated_at'])
+            result = self._update_one(
+                self.scoped({'type': 'current'}),
                 {'$set': data}
             )
             success = result.modified_count > 0
             if success:
-                logger.info("Game state updated", data=data)
+                logger.info("Game state updated", game_id=self.game_id, fields=sorted(data))
             return success
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
-            logger.error("Failed to update game state", data=data, error=str(e))
+            logger.error("Failed to update game state", game_id=self.game_id, fields=sorted(data), error=str(e))
             return False
     
     def advance_page(self) -> bool:
@@ -94,6 +115,8 @@ class GameState(BaseModel):
             revealed[letter].sort()
             
             return self.update_state({'revealed_letters': revealed})
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to reveal letter", letter=letter, positions=positions, error=str(e))
             return False
@@ -120,7 +143,7 @@ class GameState(BaseModel):
         update_data = {'game_status': status}
         
         if status == GAME_STATUS_ACTIVE and not self.get_current().get('game_start_time'):
-            update_data['game_start_time'] = datetime.utcnow()
+            update_data['game_start_time'] = update_data['page_started_at'] = datetime.utcnow()
         elif status == GAME_STATUS_COMPLETED and not self.get_current().get('game_end_time'):
             update_data['game_end_time'] = datetime.utcnow()
         
@@ -143,26 +166,38 @@ class GameState(BaseModel):
         return self.set_game_status(GAME_STATUS_ACTIVE)
     
     def reset_game(self) -> bool:
-        """Reset game to initial state"""
+        """Reset the game by starting a new epoch: O(1), earlier progress is archived lazily"""
         try:
-            reset_data = {
-                'current_page': 1,
-                'revealed_letters': {},
-                'game_status': GAME_STATUS_WAITING,
-                'game_start_time': None,
-                'game_end_time': None,
-                'total_teams': 0,
-                'active_teams': 0
-            }
-            
-            success = self.update_state(reset_data)
-            if success:
-                logger.info("Game reset successfully")
-            return success
+            state = self.get_current()
+            epoch = state.get('epoch', 0)
+            reset = next_epoch_state(state)
+            result = self._update_one(
+                self.scoped({'type': 'current', 'epoch': epoch if 'epoch' in state else {'$exists': False}}),
+                {'$set': reset}
+            )
+            if result.modified_count == 0:
+                # Another reset won the race; that one's epoch stands
+                logger.warning("Concurrent game reset ignored", game_id=self.game_id, epoch=epoch)
+                return True
+            remember_epoch(self.game_id, reset['epoch'])
+            schedule_sweep(self.db_manager, self.game_id, reset['epoch'])
+            logger.info("Game reset successfully", game_id=self.game_id, epoch=reset['epoch'])
+            return True
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to reset game", error=str(e))
             return False
     
+    def get_epoch_history(self) -> Dict[str, Any]:
+        """Current epoch and summaries of the earlier ones"""
+        state = self.get_current()
+        return {
+            'epoch': state.get('epoch', 0),
+            'epoch_started_at': state.get('epoch_started_at'),
+            'history': state.get('epochs', [])
+        }
+    
     def get_game_progress(self) -> Dict[str, Any]:
         """Get game progress information"""
         current = self.get_current()
@@ -170,7 +205,7 @@ class GameState(BaseModel):
         
         # Calculate revealed positions
         total_revealed = sum(len(positions) for positions in revealed_letters.values())
-        total_positions = len(GAME_WORD)
+        total_positions = len(current.get('word') or GAME_WORD)
         
         progress_percentage = (total_revealed / total_positions * 100) if total_positions > 0 else 0
         
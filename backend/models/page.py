@@ -1,23 +1,107 @@
+import hashlib
+import hmac
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional
 from .base import BaseModel
-from ..utils.constants import TOTAL_PAGES
+from .epoch import EpochScoped
+from ..services.circuit_breaker import UNAVAILABLE_ERRORS
+from ..utils.constants import DEFAULT_GAME_ID, TOTAL_PAGES
+from ..utils.helpers import normalize_answer
 import structlog
 
 logger = structlog.get_logger()
 
-class Page(BaseModel):
-    def __init__(self, db_manager):
-        super().__init__('pages', db_manager)
-        self._create_indexes()
+DEFAULT_PAGES = [
+    {
+        'number': 1,
+        'letter': 'P',
+        'puzzle': 'I have cities, but no houses. I have mountains, but no trees. I have water, but no fish. What am I?',
+        'solution': 'MAP'
+    },
+    {
+        'number': 2,
+        'letter': 'O',
+        'puzzle': 'What has an eye, but cannot see?',
+        'solution': 'NEEDLE'
+    },
+    {
+        'number': 3,
+        'letter': 'W',
+        'puzzle': 'What is so fragile that saying its name breaks it?',
+        'solution': 'SILENCE'
+    },
+    {
+        'number': 4,
+        'letter': 'E',
+        'puzzle': 'What comes once in a minute, twice in a moment, but never in a thousand years?',
+        'solution': 'M'
+    },
+    {
+        'number': 5,
+        'letter': 'R',
+        'puzzle': 'I’m tall when I’m young, and I’m short when I’m old. What am I?',
+        'solution': 'CANDLE'
+    },
+    {
+        'number': 6,
+        'letter': 'H',
+        'puzzle': "What has many keys but can't open a single lock?",
+        'solution': 'PIANO'
+    },
+    {
+        'number': 7,
+        'letter': 'O',
+        'puzzle': 'What can you hold in your left hand but not in your right?',
+        'solution': 'RIGHT ELBOW'
+    },
+    {
+        'number': 8,
+        'letter': 'U',
+        'puzzle': 'What is always in front of you but can’t be seen?',
+        'solution': 'FUTURE'
+    },
+    {
+        'number': 9,
+        'letter': 'S',
+        'puzzle': 'What has hands but cannot clap?',
+        'solution': 'CLOCK'
+    },
+    {
+        'number': 10,
+        'letter': 'E',
+        'puzzle': 'What gets wetter the more it dries?',
+        'solution': 'TOWEL'
+    }
+]
+
+# Mutable per-page fields; everything else on a page document is static content
+SOLVE_STATE_DEFAULTS = {
+    'is_solved': False,
+    'solved_by': None,
+    'solved_at': None,
+    'first_solver_team_code': None,
+    'solution_used': None,
+    'letter_guessed': False
+}
+
+
+class Page(EpochScoped, BaseModel):
+    PROGRESS_DEFAULTS = SOLVE_STATE_DEFAULTS
     
-    def _create_indexes(self):
+    def __init__(self, db_manager, game_id=DEFAULT_GAME_ID):
+        super().__init__('pages', db_manager, game_id)
+    
+    def ensure_indexes(self):
         """Create database indexes for pages collection"""
         try:
-            self.create_index('number', unique=True)
-            self.create_index('is_solved')
-            self.create_index('solved_by')
-            self.create_index('solved_at')
+            self.create_index([('game_id', 1), ('number', 1)], unique=True)
+            # Solved/unsolved listings, each in the order they are read
+            self.create_index([('game_id', 1), ('is_solved', 1), ('solved_at', 1)])
+            self.create_index([('game_id', 1), ('is_solved', 1), ('number', 1)])
+            # Pages solved by a team
+            self.create_index([('game_id', 1), ('solved_by', 1), ('solved_at', 1)])
         except Exception as e:
             logger.warning("Failed to create some indexes", collection='pages', error=str(e))
     
@@ -25,25 +109,37 @@ class Page(BaseModel):
         """Get page by number"""
         return self.find_one({'number': number})
     
+    def get_solve_state(self, number: int) -> Optional[Dict[str, Any]]:
+        """Get only the mutable solve-state fields of a page"""
+        projection = {field: 1 for field in SOLVE_STATE_DEFAULTS}
+        try:
+            return self._find_one(self.scoped({'number': number}), projection)
+        except UNAVAILABLE_ERRORS:
+            raise
+        except Exception as e:
+            logger.error("Failed to get page solve state", page_number=number, error=str(e))
+            return None
+    
     def get_all(self, include_solved: bool = True) -> List[Dict[str, Any]]:
         """Get all pages with optional filtering"""
-        query = {} if include_solved else {'is_solved': False}
-        return self.find_many(query, sort=[('number', 1)])
+        pages = self.find_many(sort=[('number', 1)])
+        # Filtered on the epoch views: pages of an older epoch are unsolved
+        return pages if include_solved else [page for page in pages if not page.get('is_solved')]
     
     def get_solved_pages(self) -> List[Dict[str, Any]]:
         """Get all solved pages"""
-        return self.find_many({'is_solved': True}, sort=[('solved_at', 1)])
+        return self.find_many(self.current({'is_solved': True}), sort=[('solved_at', 1)])
     
     def get_unsolved_pages(self) -> List[Dict[str, Any]]:
         """Get all unsolved pages"""
-        return self.find_many({'is_solved': False}, sort=[('number', 1)])
+        return self.get_all(include_solved=False)
     
     def mark_solved(self, page_number: int, team_code: str, solution: str = None) -> bool:
         """Mark page as solved by team"""
         try:
             # Atomic update: only mark as solved if not already solved
-            result = self.collection.update_one(
-                {'number': page_number, 'is_solved': False},
+            result = self._update_one(
+                self.scoped({'number': page_number, 'is_solved': False}),
                 {
                     '$set': {
                 'is_solved': True,
@@ -59,10 +155,17 @@ class Page(BaseModel):
             if success:
                 logger.info("Page marked as solved", page_number=page_number, team_code=team_code)
             return success
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to mark page as solved", page_number=page_number, team_code=team_code, error=str(e))
             return False
     
+    def mark_letter_guessed(self, page_number: int) -> bool:
+        """Record that the letter guess of a page has been used"""
+        result = self._update_one(self.scoped({'number': page_number}), {'$set': {'letter_guessed': True}})
+        return result.modified_count > 0
+    
     def is_solved(self, page_number: int) -> bool:
         """Check if page is solved"""
         page = self.get_by_number(page_number)
@@ -86,7 +189,7 @@ class Page(BaseModel):
     def get_page_stats(self) -> Dict[str, Any]:
         """Get comprehensive page statistics"""
         total_pages = self.count()
-        solved_pages = self.count({'is_solved': True})
+        solved_pages = self.count(self.current({'is_solved': True}))
         unsolved_pages = total_pages - solved_pages
         
         # Get solving teams
@@ -104,7 +207,7 @@ class Page(BaseModel):
     
     def get_team_solved_pages(self, team_code: str) -> List[Dict[str, Any]]:
         """Get pages solved by specific team"""
-        return self.find_many({'solved_by': team_code}, sort=[('solved_at', 1)])
+        return self.find_many(self.current({'solved_by': team_code}), sort=[('solved_at', 1)])
     
     def get_next_unsolved_page(self) -> Optional[Dict[str, Any]]:
         """Get the next unsolved page in sequence"""
@@ -114,23 +217,16 @@ class Page(BaseModel):
     def reset_page(self, page_number: int) -> bool:
         """Reset page to unsolved state"""
         try:
-            result = self.collection.update_one(
-                {'number': page_number},
-                {
-                    '$set': {
-                        'is_solved': False,
-                        'solved_by': None,
-                        'solved_at': None,
-                        'first_solver_team_code': None,
-                        'solution_used': None,
-                        'updated_at': datetime.utcnow()
-                    }
-                }
+            result = self._update_one(
+                self.scoped({'number': page_number}),
+                {'$set': dict(SOLVE_STATE_DEFAULTS, updated_at=datetime.utcnow())}
             )
             success = result.modified_count > 0
             if success:
                 logger.info("Page reset", page_number=page_number)
             return success
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to reset page", page_number=page_number, error=str(e))
             return False
@@ -138,149 +234,32 @@ class Page(BaseModel):
     def reset_all_pages(self) -> int:
         """Reset all pages to unsolved state"""
         try:
-            result = self.collection.update_many(
-                {},
-                {
-                    '$set': {
-                        'is_solved': False,
-                        'solved_by': None,
-                        'solved_at': None,
-                        'first_solver_team_code': None,
-                        'solution_used': None,
-                        'updated_at': datetime.utcnow()
-                    }
-                }
+            result = self._update_many(
+                self.scoped(),
+                {'$set': dict(SOLVE_STATE_DEFAULTS, updated_at=datetime.utcnow())}
             )
             logger.info("All pages reset", count=result.modified_count)
             return result.modified_count
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to reset all pages", error=str(e))
             return 0
     
     def create_default_pages(self) -> List[str]:
         """Create default pages for the game. Aligned with current frontend riddles and POWERHOUSE letters."""
-        pages_data = [
-            {
-                'number': 1,
-                'letter': 'P',
-                'puzzle': 'I have cities, but no houses. I have mountains, but no trees. I have water, but no fish. What am I?',
-                'solution': 'MAP',
-                'is_solved': False,
-                'solved_by': None,
-                'solved_at': None,
-                'first_solver_team_code': None,
-                'solution_used': None
-            },
-            {
-                'number': 2,
-                'letter': 'O',
-                'puzzle': 'What has an eye, but cannot see?',
-                'solution': 'NEEDLE',
-                'is_solved': False,
-                'solved_by': None,
-                'solved_at': None,
-                'first_solver_team_code': None,
-                'solution_used': None
-            },
-            {
-                'number': 3,
-                'letter': 'W',
-                'puzzle': 'What is so fragile that saying its name breaks it?',
-                'solution': 'SILENCE',
-                'is_solved': False,
-                'solved_by': None,
-                'solved_at': None,
-                'first_solver_team_code': None,
-                'solution_used': None
-            },
-            {
-                'number': 4,
-                'letter': 'E',
-                'puzzle': 'What comes once in a minute, twice in a moment, but never in a thousand years?',
-                'solution': 'M',
-                'is_solved': False,
-                'solved_by': None,
-                'solved_at': None,
-                'first_solver_team_code': None,
-                'solution_used': None
-            },
-            {
-                'number': 5,
-                'letter': 'R',
-                'puzzle': 'I’m tall when I’m young, and I’m short when I’m old. What am I?',
-                'solution': 'CANDLE',
-                'is_solved': False,
-                'solved_by': None,
-                'solved_at': None,
-                'first_solver_team_code': None,
-                'solution_used': None
-            },
-            {
-                'number': 6,
-                'letter': 'H',
-                'puzzle': "What has many keys but can't open a single lock?",
-                'solution': 'PIANO',
-                'is_solved': False,
-                'solved_by': None,
-                'solved_at': None,
-                'first_solver_team_code': None,
-                'solution_used': None
-            },
-            {
-                'number': 7,
-                'letter': 'O',
-                'puzzle': 'What can you hold in your left hand but not in your right?',
-                'solution': 'RIGHT ELBOW',
-                'is_solved': False,
-                'solved_by': None,
-                'solved_at': None,
-                'first_solver_team_code': None,
-                'solution_used': None
-            },
-            {
-                'number': 8,
-                'letter': 'U',
-                'puzzle': 'What is always in front of you but can’t be seen?',
-                'solution': 'FUTURE',
-                'is_solved': False,
-                'solved_by': None,
-                'solved_at': None,
-                'first_solver_team_code': None,
-                'solution_used': None
-            }
-            ,
-            {
-                'number': 9,
-                'letter': 'S',
-                'puzzle': 'What has hands but cannot clap?',
-                'solution': 'CLOCK',
-                'is_solved': False,
-                'solved_by': None,
-                'solved_at': None,
-                'first_solver_team_code': None,
-                'solution_used': None
-            },
-            {
-                'number': 10,
-                'letter': 'E',
-                'puzzle': 'What gets wetter the more it dries?',
-                'solution': 'TOWEL',
-                'is_solved': False,
-                'solved_by': None,
-                'solved_at': None,
-                'first_solver_team_code': None,
-                'solution_used': None
-            }
-        ]
+        pages_data = [{**content, **SOLVE_STATE_DEFAULTS} for content in DEFAULT_PAGES]
         
         try:
             # Clear existing pages
-            self.collection.delete_many({})
+            self._delete_many(self.scoped())
             
             # Insert new pages
             page_ids = self.bulk_create(pages_data)
-            logger.info("Default pages created", count=len(page_ids))
+            logger.info("Default pages created", game_id=self.game_id, count=len(page_ids))
             return page_ids
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error("Failed to create default pages", error=str(e))
             return []
@@ -297,4 +276,88 @@ class Page(BaseModel):
             'total_pages': stats['total_pages'],
             'progress_percentage': stats['completion_percentage'],
             'is_complete': stats['solved_pages'] >= stats['total_pages']
-        }
\ No newline at end of file
+        }
+
+
+@dataclass(frozen=True)
+class PageContent:
+    number: int
+    letter: str
+    puzzle: str
+    solution_key: str
+
+    def public(self) -> Dict[str, Any]:
+        """Page fields that are safe to send to clients"""
+        return {'number': self.number, 'letter': self.letter, 'puzzle': self.puzzle}
+
+
+class PageTable:
+    """Immutable, preloaded page content used for answer checks without DB reads.
+
+    Solutions are stored normalized, or as an HMAC digest when a hash key is given,
+    so the table never needs the raw solution after loading.
+    """
+
+    def __init__(self, pages: Mapping[int, PageContent], hash_key: Optional[bytes] = None):
+        self._pages = MappingProxyType(dict(pages))
+        self._hash_key = hash_key
+
+    @classmethod
+    def from_documents(cls, documents: List[Dict[str, Any]], hash_key: Optional[bytes] = None) -> 'PageTable':
+        pages = {}
+        for doc in documents:
+            solution = normalize_answer(doc.get('solution', ''))
+            pages[doc['number']] = PageContent(
+                number=doc['number'],
+                letter=doc.get('letter', ''),
+                puzzle=doc.get('puzzle', ''),
+                solution_key=cls._digest(solution, hash_key) if hash_key else solution
+            )
+        return cls(pages, hash_key)
+
+    @staticmethod
+    def _digest(answer: str, hash_key: bytes) -> str:
+        return hmac.new(hash_key, answer.encode('utf-8'), hashlib.sha256).hexdigest()
+
+    def get(self, number: int) -> Optional[PageContent]:
+        return self._pages.get(number)
+
+    def public(self, number: int) -> Optional[Dict[str, Any]]:
+        page = self._pages.get(number)
+        return page.public() if page else None
+
+    def check_answer(self, number: int, answer: str) -> bool:
+        page = self._pages.get(number)
+        if not page:
+            return False
+        answer = normalize_answer(answer)
+        expected = self._digest(answer, self._hash_key) if self._hash_key else answer
+        # compare_digest only accepts ASCII str, so answers are compared as UTF-8 bytes
+        return hmac.compare_digest(page.solution_key.encode('utf-8'), expected.encode('utf-8'))
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+
+_page_tables: Dict[str, PageTable] = {}
+_hash_key: Optional[bytes] = None
+
+
+def configure_page_tables(hash_key: Optional[bytes] = None):
+    """Set the solution hash key used for every page table loaded from now on"""
+    global _hash_key
+    _hash_key = hash_key
+
+
+def load_page_table(page_model: Page) -> PageTable:
+    """Build the page table of the model's game from the pages collection and make it the active one"""
+    table = PageTable.from_documents(page_model.get_all(), _hash_key)
+    _page_tables[page_model.game_id] = table
+    logger.info("Page table loaded", game_id=page_model.game_id, pages=len(table), hashed=bool(_hash_key))
+    return table
+
+
+def get_page_table(page_model: Page) -> PageTable:
+    """Return the page table of the model's game, loading it on first use"""
+    table = _page_tables.get(page_model.game_id)
+    return table if table is not None else load_page_table(page_model)
@@ -0,0 +1,108 @@
+import threading
+from typing import Any, Dict, List, NamedTuple
+import structlog
+
+from .team import Team
+from .page import Page
+from .game_state import GameState
+from ..utils.constants import DEFAULT_GAME_ID
+from ..utils.helpers import current_game_id
+from ..services.circuit_breaker import circuit_breaker
+
+logger = structlog.get_logger()
+
+
+class GameModels(NamedTuple):
+    team: Team
+    page: Page
+    game_state: GameState
+
+
+_models: Dict[str, GameModels] = {}
+_models_lock = threading.Lock()
+
+
+def get_game_models(db_manager, game_id: str) -> GameModels:
+    """Models bound to one game, built once per game and reused"""
+    models = _models.get(game_id)
+    if models is None:
+        with _models_lock:
+            models = _models.get(game_id)
+            if models is None:
+                models = GameModels(Team(db_manager, game_id), Page(db_manager, game_id), GameState(db_manager, game_id))
+                _models[game_id] = models
+    return models
+
+
+class GameScoped:
+    """Controller mixin resolving models for the game of the current request"""
+
+    @property
+    def models(self) -> GameModels:
+        return get_game_models(self.db_manager, current_game_id())
+
+    @property
+    def team_model(self) -> Team:
+        return self.models.team
+
+    @property
+    def page_model(self) -> Page:
+        return self.models.page
+
+    @property
+    def game_state_model(self) -> GameState:
+        return self.models.game_state
+
+
+def game_exists(db_manager, game_id: str) -> bool:
+    collection = db_manager.get_collection('game_state')
+    return circuit_breaker.call(lambda: collection.count_documents({'game_id': game_id, 'type': 'current'}, limit=1)) > 0
+
+
+def list_games(db_manager) -> List[Dict[str, Any]]:
+    projection = {'game_id': 1, 'word': 1, 'game_status': 1, 'current_page': 1, 'created_at': 1}
+    collection = db_manager.get_collection('game_state')
+    return circuit_breaker.call(lambda: list(collection.find({'type': 'current'}, projection).sort('created_at', 1)))
+
+
+def provision_game(db_manager, game_id: str, word: str = None) -> GameModels:
+    """Create the game state and default pages of a new game"""
+    models = get_game_models(db_manager, game_id)
+    if models.page.count() == 0:
+        models.page.create_default_pages()
+    if not models.game_state.find_one({'type': 'current'}):
+        models.game_state._create_default_state(word)
+    logger.info("Game provisioned", game_id=game_id)
+    return models
+
+
+# Indexes no query uses any more (see `flask check-indexes`)
+OBSOLETE_INDEXES = (
+    ('teams', 'NOMs_-1_last_activity_-1'),
+    ('pages', 'is_solved_1'), ('pages', 'solved_by_1'), ('pages', 'solved_at_1'),
+    ('game_state', 'game_status_1'), ('game_state', 'current_page_1')
+)
+
+
+def migrate_legacy_documents(db_manager):
+    """Assign documents created before multi-game support to the default game"""
+    for name in ('teams', 'pages', 'game_state'):
+        collection = db_manager.get_collection(name)
+        result = collection.update_many({'game_id': {'$exists': False}}, {'$set': {'game_id': DEFAULT_GAME_ID}})
+        if result.modified_count:
+            logger.info("Legacy documents migrated", collection=name, count=result.modified_count)
+    # Single-field unique indexes would stop two games from sharing a team name or page number
+    for name, index in (('teams', 'code_1'), ('teams', 'name_1'), ('pages', 'number_1'), ('game_state', 'type_1')) + OBSOLETE_INDEXES:
+        try:
+            db_manager.get_collection(name).drop_index(index)
+        except Exception:
+            pass
+    counters = db_manager.get_collection('counters')
+    legacy = counters.find_one({'_id': 'team_count'})
+    if legacy:
+        counters.update_one(
+            {'_id': f'team_count:{DEFAULT_GAME_ID}'},
+            {'$setOnInsert': {'count': legacy.get('count', 0)}},
+            upsert=True
+        )
+        counters.delete_one({'_id': 'team_count'})
@@ -1,43 +1,58 @@
+import copy
 from datetime import datetime, timedelta
 from bson import ObjectId
 from .base import BaseModel
+from .epoch import EpochScoped
+from ..services.circuit_breaker import UNAVAILABLE_ERRORS, circuit_breaker
 from ..services.game_service import GameManager
+from ..utils.constants import DEFAULT_GAME_ID
 import structlog
 
 logger = structlog.get_logger()
 
-class Team(BaseModel):
-    def __init__(self, db_manager):
-        super().__init__('teams', db_manager)
-        self._create_indexes()
+# Gameplay fields of a team; they belong to the game's reset epoch (see models/epoch.py)
+TEAM_PROGRESS_DEFAULTS = {
+    'word_guesses': [],
+    'guesses_left': 3,
+    'NOMs': 0,
+    'solved_pages': [],
+    'letter_guesses': []
+}
+
+class Team(EpochScoped, BaseModel):
+    PROGRESS_DEFAULTS = TEAM_PROGRESS_DEFAULTS
     
-    def _create_indexes(self):
+    def __init__(self, db_manager, game_id=DEFAULT_GAME_ID):
+        super().__init__('teams', db_manager, game_id)
+    
+    def ensure_indexes(self):
         """Create database indexes for performance"""
         try:
-            # Index on team code for fast lookups
-            self.collection.create_index('code', unique=True)
+            # Index on team code for fast lookups (codes and names are unique per game)
+            self.create_index([('game_id', 1), ('code', 1)], unique=True)
             # Index on team name for fast lookups
-            self.collection.create_index('name', unique=True)
+            self.create_index([('game_id', 1), ('name', 1)], unique=True)
             # Index on last_activity for active team queries
-            self.collection.create_index('last_activity')
-            # Compound index for leaderboard queries
-            self.collection.create_index([('NOMs', -1), ('last_activity', -1)])
+            self.create_index([('game_id', 1), ('last_activity', 1)])
+            # Admin team listing, newest first
+            self.create_index([('game_id', 1), ('created_at', -1)])
             logger.info("Team indexes created successfully")
         except Exception as e:
             logger.warning("Failed to create team indexes", error=str(e))
     
     def get_by_code(self, code):
-        return self.collection.find_one({'code': code})
+        return self._find_one(self.scoped({'code': code}))
     
     def get_by_name(self, name):
-        return self.collection.find_one({'name': name})
+        return self._find_one(self.scoped({'name': name}))
     
-    def get_all(self):
-        return list(self.collection.find())
+    def get_all(self, read_route=None):
+        collection, session = self.routed(read_route)
+        return self._find(self.scoped(), collection=collection, session=session)
     
     def add_guess(self, team_id, word_guess):
-        result = self.collection.update_one(
-            {'_id': ObjectId(team_id)},
+        result = self._update_one(
+            self.scoped({'_id': ObjectId(team_id)}),
             {
                 '$push': {'word_guesses': word_guess},
                 '$set': {'last_activity': datetime.utcnow()}
@@ -48,8 +63,8 @@ class Team(BaseModel):
         return result.modified_count > 0
     
     def increment_noms(self, team_id):
-        result = self.collection.update_one(
-            {'_id': ObjectId(team_id)}, 
+        result = self._update_one(
+            self.scoped({'_id': ObjectId(team_id)}),
             {
                 '$inc': {'NOMs': 1},
                 '$set': {'last_activity': datetime.utcnow()}
@@ -61,8 +76,8 @@ class Team(BaseModel):
 
     def add_letter_guess(self, team_id, letter, page_number):
         """Track a letter guess by this team"""
-        result = self.collection.update_one(
-            {'_id': ObjectId(team_id)},
+        result = self._update_one(
+            self.scoped({'_id': ObjectId(team_id)}),
             {
                 '$push': {'letter_guesses': {
                     'letter': letter,
@@ -76,6 +91,17 @@ class Team(BaseModel):
             logger.info("Team letter guess added", team_id=team_id, letter=letter, page=page_number)
         return result.modified_count > 0
 
+    def add_solved_page(self, team_id, page_number):
+        """Record a page solved by this team"""
+        result = self._update_one(
+            self.scoped({'_id': ObjectId(team_id)}),
+            {
+                '$addToSet': {'solved_pages': page_number},
+                '$set': {'last_activity': datetime.utcnow()}
+            }
+        )
+        return result.modified_count > 0
+
     def has_guessed_letter(self, team_id, letter, page_number=None):
         """Check if team has already guessed this letter; optionally scoped to a page"""
         team = self.get_by_id(team_id)
@@ -92,9 +118,15 @@ class Team(BaseModel):
         new_val = max(0, current - 1)
         return self.update(team_id, {'guesses_left': new_val})
     
+    def word(self):
+        """Target word of this team's game"""
+        collection = self.db_manager.get_collection('game_state')
+        state = circuit_breaker.call(lambda: collection.find_one({'game_id': self.game_id, 'type': 'current'}, {'word': 1}))
+        return (state or {}).get('word') or GameManager.WORD
+    
     def calculate_score(self, team, revealed_letters):
         # Use best guess against the target word to compute greens/yellows
-        greens, yellows = GameManager.best_team_scores(team)
+        greens, yellows = GameManager.best_team_scores(team, self.word())
         return {
             'greens': greens,
             'yellows': yellows,
@@ -126,17 +158,24 @@ class Team(BaseModel):
         if len(password) < min_length:
             return False, None, {'password': f'Password must be at least {min_length} characters'}
 
-        # Check team cap atomically
+        # Check team cap atomically (shared with bulk imports, see services/team_import.py)
         from pymongo import ReturnDocument
+        from pymongo.errors import DuplicateKeyError
+        max_teams = config['default'].MAX_TEAMS
         counters = self.db_manager.get_collection('counters')
-        cap_doc = counters.find_one_and_update(
-            {'_id': 'team_count', 'count': {'$lt': 20}},
-            {'$inc': {'count': 1}},
-            upsert=True,
-            return_document=ReturnDocument.AFTER
-        )
-        if not cap_doc or cap_doc.get('count', 0) > 20:
-            return False, None, {'error': 'Maximum number of teams (20) reached'}
+        counter_id = f'team_count:{self.game_id}'
+        try:
+            cap_doc = circuit_breaker.call(lambda: counters.find_one_and_update(
+                {'_id': counter_id, 'count': {'$lt': max_teams}},
+                {'$inc': {'count': 1}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            ))
+        except DuplicateKeyError:
+            # The counter exists but is at the cap, so the upsert collided with it
+            cap_doc = None
+        if not cap_doc or cap_doc.get('count', 0) > max_teams:
+            return False, None, {'error': f'Maximum number of teams ({max_teams}) reached'}
 
         if self.get_by_name(name):
             return False, None, {'name': 'Name already exists'}
@@ -150,11 +189,7 @@ class Team(BaseModel):
             'name': name,
             'code': code,
             'password_hash': AuthService.hash_password(password),
-            'word_guesses': [],
-            'guesses_left': 3,
-            'NOMs': 0,
-            'solved_pages': [],
-            'letter_guesses': [],  # Track letters guessed by this team
+            **copy.deepcopy(TEAM_PROGRESS_DEFAULTS),
             'last_activity': datetime.utcnow()
         }
 
@@ -164,8 +199,10 @@ class Team(BaseModel):
             return True, team_id, None
         except Exception as e:
             logger.error("Failed to create team", error=str(e), name=name)
-            # roll back counter if create failed
-            counters.update_one({'_id': 'team_count'}, {'$inc': {'count': -1}})
+            # roll back counter if create failed (also when the circuit refused the insert)
+            counters.update_one({'_id': counter_id}, {'$inc': {'count': -1}})
+            if isinstance(e, UNAVAILABLE_ERRORS):
+                raise
             return False, None, {'error': str(e)}
 
     def get_team_stats(self, team_id):
@@ -1,9 +1,17 @@
-from flask import Blueprint
+from flask import Blueprint, jsonify
 from flask_jwt_extended import jwt_required
 from .controllers.auth_controller import AuthController
 from .controllers.game_controller import GameController
 from .controllers.admin_controller import AdminController
 from .database import db_manager
+from .services.circuit_breaker import circuit_breaker
+from .services.token_revocation import revocation_store
+from .middleware.security import rate_limit
+from .middleware.load_shedding import load_shed
+from .middleware.idempotency import idempotent
+from .models.game_state import GameNotFoundError
+from .models.scope import game_exists
+from .utils.helpers import requested_game_id
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
@@ -11,68 +19,106 @@ auth_controller = AuthController(db_manager)
 game_controller = GameController(db_manager)
 admin_controller = AdminController(db_manager)
 
+@api_bp.before_request
+def reject_unknown_game():
+    # Checked before any controller builds per-game models or state for the id
+    game_id = requested_game_id()
+    if game_id and not game_exists(db_manager, game_id):
+        return jsonify({'success': False, 'error': 'Game not found'}), 404
+
+@api_bp.errorhandler(GameNotFoundError)
+def game_not_found(error):
+    return jsonify({'success': False, 'error': 'Game not found'}), 404
+
 # Auth routes
 @api_bp.route('/teams/register', methods=['POST'])
+@load_shed('auth')
 def register():
     return auth_controller.register()
 
 @api_bp.route('/teams/login', methods=['POST'])
+@load_shed('auth')
 def login():
     return auth_controller.login()
 
 @api_bp.route('/teams/profile', methods=['GET'])
+@load_shed('read')
 @jwt_required()
 def profile():
     return auth_controller.profile()
 
+# Spectator stream (Server-Sent Events, no authentication)
+@api_bp.route('/stream', methods=['GET'])
+@load_shed('read')
+def stream():
+    return game_controller.stream()
+
 # Game routes (JWT protected)
 @api_bp.route('/game/status', methods=['GET'])
+@load_shed('read')
 @jwt_required()
 def game_status():
     return game_controller.status()
 
 @api_bp.route('/game/solve', methods=['POST'])
+@load_shed('gameplay')
 @jwt_required()
+@rate_limit('gameplay')
+@idempotent
 def solve_page():
     return game_controller.solve_page()
 
 @api_bp.route('/game/guess-letter', methods=['POST'])
+@load_shed('gameplay')
 @jwt_required()
+@rate_limit('gameplay')
+@idempotent
 def guess_letter():
     return game_controller.guess_letter()
 
 @api_bp.route('/game/guess-word', methods=['POST'])
+@load_shed('gameplay')
 @jwt_required()
+@rate_limit('gameplay')
+@idempotent
 def guess_word():
     return game_controller.guess_word()
 
 @api_bp.route('/leaderboard', methods=['GET'])
+@load_shed('read')
 @jwt_required()
 def leaderboard():
     return game_controller.leaderboard()
 
 @api_bp.route('/game/start', methods=['POST'])
+@load_shed('admin')
 @jwt_required()
+@idempotent
 def start_game():
     return game_controller.start_game()
 
 @api_bp.route('/game/reset', methods=['POST'])
+@load_shed('admin')
 @jwt_required()
+@idempotent
 def reset_game():
     return game_controller.reset_game()
 
 # Admin routes
 @api_bp.route('/admin/stats', methods=['GET'])
+@load_shed('admin')
 @jwt_required()
 def admin_stats():
     return admin_controller.get_dashboard_stats()
 
 @api_bp.route('/admin/teams', methods=['GET'])
+@load_shed('admin')
 @jwt_required()
 def admin_teams():
     return admin_controller.get_teams()
 
 @api_bp.route('/admin/teams/<team_id>', methods=['GET'])
+@load_shed('admin')
 @jwt_required()
 def admin_team_details(team_id):
     return admin_controller.get_team_details(team_id)
@@ -81,61 +127,133 @@ def admin_team_details(team_id):
 
 
 @api_bp.route('/admin/letters/reveal/<letter>', methods=['POST'])
+@load_shed('admin')
 @jwt_required()
+@idempotent
 def admin_reveal_letter(letter):
     return admin_controller.reveal_letter(letter)
 
 # Additional admin routes for missing methods
 @api_bp.route('/admin/teams', methods=['POST'])
+@load_shed('admin')
 @jwt_required()
+@idempotent
 def admin_create_team():
     return admin_controller.create_team()
 
+@api_bp.route('/admin/teams/import', methods=['POST'])
+@load_shed('admin')
+@jwt_required()
+@idempotent
+def admin_import_teams():
+    return admin_controller.import_teams()
+
 @api_bp.route('/admin/teams/<team_id>', methods=['DELETE'])
+@load_shed('admin')
 @jwt_required()
+@idempotent
 def admin_delete_team(team_id):
     return admin_controller.delete_team(team_id)
 
 @api_bp.route('/admin/pages', methods=['GET'])
+@load_shed('admin')
 @jwt_required()
 def admin_get_pages():
     return admin_controller.get_pages()
 
 @api_bp.route('/admin/pages/<int:page_number>/reset', methods=['POST'])
+@load_shed('admin')
 @jwt_required()
+@idempotent
 def admin_reset_page(page_number):
     return admin_controller.reset_page(page_number)
 
 @api_bp.route('/admin/pages/reset-all', methods=['POST'])
+@load_shed('admin')
 @jwt_required()
+@idempotent
 def admin_reset_all_pages():
     return admin_controller.reset_all_pages()
 
 @api_bp.route('/admin/game/state', methods=['GET'])
+@load_shed('admin')
 @jwt_required()
 def admin_get_game_state():
     return admin_controller.get_game_state()
 
 @api_bp.route('/admin/game/control', methods=['POST'])
+@load_shed('admin')
 @jwt_required()
+@idempotent
 def admin_control_game():
     return admin_controller.control_game()
 
 @api_bp.route('/admin/game/page/<int:page_number>', methods=['POST'])
+@load_shed('admin')
 @jwt_required()
+@idempotent
 def admin_set_current_page(page_number):
     return admin_controller.set_current_page(page_number)
 
 @api_bp.route('/admin/leaderboard', methods=['GET'])
+@load_shed('admin')
 @jwt_required()
 def admin_leaderboard():
     return admin_controller.get_leaderboard()
 
+@api_bp.route('/admin/games', methods=['GET'])
+@load_shed('admin')
+@jwt_required()
+def admin_get_games():
+    return admin_controller.get_games()
+
+@api_bp.route('/admin/games', methods=['POST'])
+@load_shed('admin')
+@jwt_required()
+@idempotent
+def admin_create_game():
+    return admin_controller.create_game()
+
+@api_bp.route('/admin/epochs', methods=['GET'])
+@load_shed('admin')
+@jwt_required()
+def admin_epochs():
+    return admin_controller.get_epochs()
+
+@api_bp.route('/admin/epochs/<int:epoch>', methods=['GET'])
+@load_shed('admin')
+@jwt_required()
+def admin_epoch_archive(epoch):
+    return admin_controller.get_epoch_archive(epoch)
+
+@api_bp.route('/admin/profile', methods=['GET'])
+@load_shed('admin')
+@jwt_required()
+def admin_profile():
+    return admin_controller.profile_sampling()
+
+@api_bp.route('/admin/slow-queries', methods=['GET'])
+@load_shed('admin')
+@jwt_required()
+def admin_slow_queries():
+    return admin_controller.get_slow_queries()
+
+@api_bp.route('/admin/analytics/pages', methods=['GET'])
+@load_shed('admin')
+@jwt_required()
+def admin_page_analytics():
+    return admin_controller.get_page_analytics()
+
+@api_bp.route('/admin/export/<entity>', methods=['GET'])
+@load_shed('admin')
+@jwt_required()
+def admin_export(entity):
+    return admin_controller.export(entity)
+
 @api_bp.route('/health', methods=['GET'])
 def health():
-    try:
-        # Ping DB to ensure connectivity
-        db_manager.client.admin.command('ping')
-        return {'status': 'healthy', 'db': 'ok'}, 200
-    except Exception:
-        return {'status': 'degraded', 'db': 'error'}, 500
+    # Served from the cached background probe so health checks never wait on MongoDB
+    status = db_manager.health()
+    status['circuit'] = circuit_breaker.stats()
+    status['token_revocation'] = revocation_store.stats()
+    return status, 200 if status['db'] == 'ok' else 500
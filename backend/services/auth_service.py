@@ -2,11 +2,12 @@ import bcrypt
 import secrets
 import string
 
+from .password_hashing import hash_password
+
 class AuthService:
     @staticmethod
     def hash_password(password):
-        salt = bcrypt.gensalt()
-        return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+        return hash_password(password)
     
     @staticmethod
     def verify_password(password, hashed):
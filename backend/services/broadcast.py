@@ -0,0 +1,286 @@
+"""
+Serialize-once game payloads.
+
+Status and leaderboard bodies are built and JSON-encoded once per state version
+and shared by HTTP responses, Socket.IO replies and room broadcasts. Versions
+come from the game itself (engine sequence, game state `updated_at`) plus a
+per-game counter bumped by every model write, with a short TTL bounding how long
+another process's writes can go unseen.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from flask import current_app
+import structlog
+
+from ..database import db_manager
+from ..middleware import compression
+from ..models.base import operation_observers
+from ..models.page import get_page_table
+from ..models.scope import get_game_models
+from ..utils.helpers import game_room
+from . import socket_codec
+from .circuit_breaker import CircuitOpenError, circuit_breaker
+from .event_stream import event_streams
+from .game_engine import get_game_engine, has_running_engine
+from .game_service import GameManager
+
+logger = structlog.get_logger()
+
+KIND_STATUS = 'status'
+KIND_LEADERBOARD = 'leaderboard'
+KIND_PAGE_INFO = 'page_info'
+
+# Collections whose writes change a cached payload
+PAYLOAD_COLLECTIONS = ('teams', 'pages', 'game_state')
+WRITE_OPERATIONS = ('update_one', 'update_many', 'find_one_and_update', 'delete_one', 'delete_many',
+                    'insert_one', 'insert_many')
+
+
+def _encode_default(value: Any) -> Any:
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+class Encoded:
+    """A payload together with its JSON text, encoded once"""
+
+    __slots__ = ('data', 'text', '_body', '_packed', '_compressed')
+
+    def __init__(self, data: Any):
+        self.data = data
+        self.text = json.dumps(data, separators=(',', ':'), sort_keys=True, default=_encode_default)
+        self._body: Optional[bytes] = None
+        self._packed: Optional[bytes] = None
+        self._compressed: Dict[Tuple[str, int], bytes] = {}
+
+    @property
+    def body(self) -> bytes:
+        if self._body is None:
+            self._body = self.text.encode('utf-8')
+        return self._body
+
+    @property
+    def packed(self) -> bytes:
+        """Compact MessagePack form for clients that negotiated it"""
+        if self._packed is None:
+            self._packed = socket_codec.pack(self.data)
+        return self._packed
+
+    def compressed(self, encoding: str, level: int) -> bytes:
+        """HTTP body compressed once per content coding, shared by every response of this version"""
+        key = (encoding, level)
+        if key not in self._compressed:
+            self._compressed[key] = compression.compress(self.body, encoding, level)
+        return self._compressed[key]
+
+    @property
+    def prefers_packed(self) -> bool:
+        return len(self.packed) + socket_codec.BINARY_OVERHEAD < len(self.body)
+
+    def for_encoding(self, encoding: str):
+        if encoding == socket_codec.ENCODING_MSGPACK and self.prefers_packed:
+            return self.packed
+        return self
+
+
+class PayloadJSON:
+    """`json` module for Socket.IO packets: pre-encoded payloads are spliced in as-is"""
+
+    @staticmethod
+    def dumps(obj, **kwargs):
+        if isinstance(obj, list) and any(isinstance(item, Encoded) for item in obj):
+            return '[' + ','.join(item.text if isinstance(item, Encoded) else PayloadJSON.dumps(item, **kwargs)
+                                  for item in obj) + ']'
+        if isinstance(obj, Encoded):
+            return obj.text
+        return json.dumps(obj, default=_encode_default, **kwargs)
+
+    @staticmethod
+    def loads(*args, **kwargs):
+        return json.loads(*args, **kwargs)
+
+
+class PayloadCache:
+    """Latest encoded payload per (game, kind), valid while its version matches"""
+
+    def __init__(self, ttl: float = 1.0, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[Tuple[str, str], Tuple[Hashable, float, Encoded, datetime]]' = OrderedDict()
+        self._stale: Dict[Tuple[str, str], Tuple[Encoded, Encoded]] = {}
+        self._generations: Dict[str, int] = {}
+        self._global_generation = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def configure(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def generation(self, game_id: str) -> Tuple[int, int]:
+        return self._global_generation, self._generations.get(game_id, 0)
+
+    def invalidate(self, game_id: Optional[str] = None):
+        """Bump a game's generation (all games when `game_id` is None)"""
+        with self._lock:
+            if game_id is None:
+                # Entries stay (outdated by version) as stale snapshots for when the database circuit is open
+                self._global_generation += 1
+            else:
+                self._generations[game_id] = self._generations.get(game_id, 0) + 1
+
+    def get(self, game_id: str, kind: str, stamp: Hashable, build: Callable[[], Any]) -> Encoded:
+        version = (stamp, self.generation(game_id))
+        key = (game_id, kind)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == version and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+        # Built outside the lock; concurrent misses build the same payload and the last one is kept
+        failures = circuit_breaker.failures
+        encoded = Encoded(build())
+        if circuit_breaker.failures != failures:
+            # Possibly built from fallback values of failed reads: keep the last good payload cached instead
+            return encoded
+        with self._lock:
+            self._entries[key] = (version, now + self.ttl, encoded, datetime.utcnow())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return encoded
+
+    def stale(self, game_id: str, kind: str) -> Optional[Encoded]:
+        """Last payload built for (game, kind) whatever its version, flagged `stale` with its build time"""
+        key = (game_id, kind)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            _, _, encoded, built_at = entry
+            source, flagged = self._stale.get(key, (None, None))
+            if source is not encoded:
+                flagged = Encoded({**encoded.data, 'stale': True, 'as_of': built_at})
+                self._stale[key] = (encoded, flagged)
+            return flagged
+
+    def stats(self) -> Dict[str, Any]:
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+payload_cache = PayloadCache()
+
+
+def _invalidate_on_write(collection: str, operation: str, query: Dict[str, Any], details: Dict[str, Any]):
+    if collection not in PAYLOAD_COLLECTIONS or operation not in WRITE_OPERATIONS:
+        return
+    game_id = query.get('game_id') if isinstance(query, dict) else None
+    payload_cache.invalidate(game_id if isinstance(game_id, str) else None)
+
+
+operation_observers.append(_invalidate_on_write)
+
+
+def page_info_payload(game_id: str, number: int, page_table=None) -> Encoded:
+    page_table = page_table or get_page_table(get_game_models(db_manager, game_id).page)
+    return payload_cache.get(game_id, f'{KIND_PAGE_INFO}:{number}', id(page_table), lambda: page_table.public(number))
+
+
+def _stale_payload(game_id: str, kind: str) -> Optional[Encoded]:
+    """While the database circuit is open, the last snapshot instead of a rebuild (engines serve from memory)"""
+    if not circuit_breaker.is_open or has_running_engine(game_id):
+        return None
+    stale = payload_cache.stale(game_id, kind)
+    if stale is None:
+        raise CircuitOpenError(circuit_breaker.retry_after)
+    return stale
+
+
+def status_payload(game_id: str) -> Encoded:
+    stale = _stale_payload(game_id, KIND_STATUS)
+    if stale is not None:
+        return stale
+    models = get_game_models(db_manager, game_id)
+    page_table = get_page_table(models.page)
+    engine = get_game_engine(game_id)
+    if engine:
+        # The snapshot is only copied when the engine has moved on since the cached payload
+        state, stamp = None, ('engine', engine.version)
+    else:
+        state = models.game_state.get_current()
+        stamp = (state.get('epoch', 0), state.get('updated_at'))
+
+    def build():
+        current = state or engine.status_snapshot()
+        return {
+            'current_page': current['current_page'],
+            'game_status': current['game_status'],
+            'revealed_letters': current.get('revealed_letters', {}),
+            'page_info': page_info_payload(game_id, current['current_page'], page_table).data,
+            'word': current.get('word') or GameManager.WORD
+        }
+    return payload_cache.get(game_id, KIND_STATUS, (stamp, id(page_table)), build)
+
+
+def leaderboard_payload(game_id: str) -> Encoded:
+    stale = _stale_payload(game_id, KIND_LEADERBOARD)
+    if stale is not None:
+        return stale
+    engine = get_game_engine(game_id)
+    stamp = ('engine', engine.version) if engine else None
+
+    def build():
+        models = get_game_models(db_manager, game_id)
+        teams = engine.teams_snapshot() if engine else models.team.get_all(read_route='leaderboard')
+        word = engine.status_snapshot().get('word') if engine else models.game_state.get_word()
+        rankings = []
+        for team, (greens, yellows) in zip(teams, GameManager.best_scores(teams, word)):
+            rankings.append({
+                'name': team.get('name'),
+                'code': team.get('code'),
+                'greens': greens,
+                'yellows': yellows,
+                'NOMs': team.get('NOMs', 0),
+                'word_guesses_count': len(team.get('word_guesses', [])),
+                'guesses_left': team.get('guesses_left', 3)
+            })
+        rankings.sort(key=lambda x: (-x['greens'], -x['NOMs'], -x['yellows']))
+        return {'rankings': rankings}
+    return payload_cache.get(game_id, KIND_LEADERBOARD, stamp, build)
+
+
+def json_response(encoded: Encoded, status: int = 200):
+    """HTTP response carrying pre-encoded JSON bytes"""
+    response = current_app.response_class(encoded.body, status=status, mimetype='application/json')
+    # Lets response compression reuse the payload's compressed bytes
+    response.encoded = encoded
+    return response
+
+
+def emit(event: str, payload: Any, game_id: str, room: str = 'updates'):
+    """Broadcast an event to a game's socket room and its SSE stream, encoding the payload once"""
+    encoded = payload if isinstance(payload, Encoded) else Encoded(payload)
+    event_streams.publish(game_id, event, encoded.text)
+    try:
+        socketio = current_app.extensions.get('socketio')
+        if socketio:
+            json_room = game_room(game_id, room)
+            binary_room = socket_codec.room_for(json_room, socket_codec.ENCODING_MSGPACK)
+            # Packed only when a MessagePack client is listening; one packet per encoding either way
+            if socket_codec.available() and socketio.server.manager.rooms.get('/', {}).get(binary_room):
+                if encoded.prefers_packed:
+                    socketio.emit(event, encoded, room=json_room)
+                    socketio.emit(event, encoded.packed, room=binary_room)
+                    return
+                json_room = [json_room, binary_room]
+            socketio.emit(event, encoded, room=json_room)
+    except Exception as emit_err:
+        logger.error("Socket emit failed", event=event, game_id=game_id, error=str(emit_err))
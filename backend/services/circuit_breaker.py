@@ -0,0 +1,202 @@
+"""
+Circuit breaker for MongoDB.
+
+Every model operation reports its latency and outcome. When, over the last
+`window_seconds`, at least `min_calls` operations were seen and the share that
+failed with a connection-level error or ran longer than `slow_call_ms` reaches
+`failure_ratio`, the circuit opens. For `open_seconds` no operation reaches
+pymongo: reads of status and leaderboard are answered from the last payload
+built (flagged stale), and writes fail fast with 503. After that a single
+trial operation is let through (half-open); it closes the circuit again or
+re-opens it.
+"""
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+from pymongo.errors import ConnectionFailure, ExecutionTimeout
+from werkzeug.exceptions import ServiceUnavailable
+import structlog
+
+logger = structlog.get_logger()
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+# Errors that say the database (not the request) is in trouble
+FAILURE_ERRORS = (ConnectionFailure, ExecutionTimeout)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of running a database operation while the circuit is open"""
+
+    def __init__(self, retry_after: float):
+        super().__init__('Database circuit open')
+        self.retry_after = retry_after
+
+
+# Errors meaning the database cannot be used right now; catch-all handlers re-raise them so callers get 503
+UNAVAILABLE_ERRORS = (CircuitOpenError, ServiceUnavailable) + FAILURE_ERRORS
+
+
+class CircuitBreaker:
+    def __init__(self):
+        self.enabled = False
+        self.window_seconds = 10
+        self.min_calls = 20
+        self.failure_ratio = 0.5
+        self.slow_call_ms = 1000.0
+        self.open_seconds = 5.0
+        self.state = STATE_CLOSED
+        self.opened_at: Optional[float] = None
+        self.trips = 0
+        # Failed operations ever seen; lets callers tell whether a failure happened while they worked
+        self.failures = 0
+        self._open_until = 0.0
+        self._trial_in_flight = False
+        # Per-second [second, calls, failures] buckets of the rolling window
+        self._buckets: List[List[int]] = []
+        self._lock = threading.Lock()
+
+    def configure(self, enabled: bool, window_seconds: int, min_calls: int, failure_ratio: float,
+                  slow_call_ms: float, open_seconds: float):
+        self.enabled = enabled
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.slow_call_ms = slow_call_ms
+        self.open_seconds = open_seconds
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.state = STATE_CLOSED
+            self.opened_at = None
+            self._trial_in_flight = False
+            self._buckets = [[0, 0, 0] for _ in range(max(1, self.window_seconds))]
+
+    @property
+    def is_open(self) -> bool:
+        """True while operations are being refused (open, or half-open with its trial running)"""
+        if not self.enabled or self.state == STATE_CLOSED:
+            return False
+        if self.state == STATE_OPEN:
+            # Once the open period is over the next operation becomes the trial
+            return time.monotonic() < self._open_until
+        return self._trial_in_flight
+
+    @property
+    def retry_after(self) -> float:
+        return max(0.0, self._open_until - time.monotonic())
+
+    def allow(self) -> bool:
+        """Whether an operation may run now; in half-open state only one trial at a time"""
+        if not self.enabled or self.state == STATE_CLOSED:
+            return True
+        with self._lock:
+            if self.state == STATE_OPEN and time.monotonic() >= self._open_until:
+                self.state = STATE_HALF_OPEN
+            if self.state == STATE_HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return self.state == STATE_CLOSED
+
+    def call(self, operation: Callable[[], Any]) -> Any:
+        """Run a database operation made outside the models: refused while open, recorded otherwise"""
+        if not self.allow():
+            raise CircuitOpenError(self.retry_after)
+        started = time.perf_counter()
+        error = None
+        try:
+            return operation()
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.record((time.perf_counter() - started) * 1000, error)
+
+    def record(self, elapsed_ms: float, error: BaseException = None):
+        if not self.enabled:
+            return
+        failed = isinstance(error, FAILURE_ERRORS) or elapsed_ms >= self.slow_call_ms
+        now = time.monotonic()
+        with self._lock:
+            self.failures += failed
+            if self.state == STATE_HALF_OPEN:
+                self._trial_in_flight = False
+                if failed:
+                    self._trip(now, 'trial operation failed')
+                else:
+                    self.state = STATE_CLOSED
+                    self.opened_at = None
+                    self._buckets = [[0, 0, 0] for _ in self._buckets]
+                    logger.warning("Database circuit closed")
+                return
+            if self.state == STATE_OPEN:
+                # Operations that were already running when the circuit opened
+                return
+            second = int(now)
+            bucket = self._buckets[second % len(self._buckets)]
+            if bucket[0] != second:
+                bucket[:] = [second, 0, 0]
+            bucket[1] += 1
+            bucket[2] += failed
+            calls = failures = 0
+            for bucket_second, bucket_calls, bucket_failures in self._buckets:
+                if second - bucket_second < len(self._buckets):
+                    calls += bucket_calls
+                    failures += bucket_failures
+            if calls >= self.min_calls and failures / calls >= self.failure_ratio:
+                self._trip(now, f'{failures} of {calls} operations failed or were slow')
+
+    def _trip(self, now: float, reason: str):
+        self.state = STATE_OPEN
+        self.opened_at = self.opened_at or time.time()
+        self._open_until = now + self.open_seconds
+        self.trips += 1
+        logger.error("Database circuit opened", reason=reason, open_seconds=self.open_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {'state': self.state if self.enabled else 'disabled', 'opened_at': self.opened_at,
+                'retry_after': round(self.retry_after, 2) if self.is_open else 0, 'trips': self.trips}
+
+
+circuit_breaker = CircuitBreaker()
+
+
+# Gameplay writes an in-memory engine takes without waiting on MongoDB
+ENGINE_ENDPOINTS = ('api.solve_page', 'api.guess_letter', 'api.guess_word')
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+def init_circuit_breaker(app):
+    """Fail writes fast while the circuit is open, and answer refused operations with 503"""
+    from flask import jsonify, request
+    from .game_engine import has_running_engine
+    from ..utils.helpers import current_game_id
+
+    def unavailable(retry_after: float):
+        response = jsonify({'success': False, 'error': 'Database unavailable, try again shortly',
+                            'retry_after': round(retry_after, 2)})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response
+
+    @app.before_request
+    def fail_writes_fast():
+        if request.method not in WRITE_METHODS or not circuit_breaker.is_open:
+            return None
+        if request.endpoint in ENGINE_ENDPOINTS and has_running_engine(current_game_id()):
+            return None
+        return unavailable(circuit_breaker.retry_after)
+
+    @app.errorhandler(CircuitOpenError)
+    def circuit_open(error: CircuitOpenError):
+        return unavailable(error.retry_after)
+
+    @app.errorhandler(ConnectionFailure)
+    @app.errorhandler(ExecutionTimeout)
+    def database_failed(error: Exception):
+        logger.error("Database operation failed", path=request.path, error=str(error))
+        return unavailable(1)
@@ -0,0 +1,139 @@
+"""
+Server-Sent Events for spectators.
+
+Every broadcast event of a game is encoded once into an SSE frame and appended
+to that game's ring buffer. A connection only keeps the id of the last frame it
+sent and waits on the ring's condition (cooperative under gevent), so thousands of read-only screens cost
+little more than their sockets. Ids carry a per-process prefix; a client
+resuming with a `Last-Event-ID` the ring no longer holds (or from another
+process) gets a `reset` event and a fresh snapshot.
+"""
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from ..utils.cooperative import Condition
+
+# Distinguishes ids of this process from ids handed out before a restart
+STREAM_PREFIX = f'{int(time.time()):x}{os.getpid():x}'
+
+
+def sse_frame(event: str, data: str, event_id: Optional[str] = None) -> bytes:
+    lines = [f'id: {event_id}'] if event_id else []
+    lines.append(f'event: {event}')
+    lines.extend(f'data: {line}' for line in data.split('\n'))
+    return ('\n'.join(lines) + '\n\n').encode('utf-8')
+
+
+class EventRing:
+    """Last `size` frames of one game, each encoded once"""
+
+    def __init__(self, size: int):
+        self.frames: Deque[Tuple[int, bytes]] = deque(maxlen=size)
+        self.seq = 0
+        self.condition = Condition()
+
+    def publish(self, event: str, data: str):
+        with self.condition:
+            self.seq += 1
+            self.frames.append((self.seq, sse_frame(event, data, f'{STREAM_PREFIX}-{self.seq}')))
+            self.condition.notify_all()
+
+    def since(self, seq: int) -> Optional[List[bytes]]:
+        """Frames after `seq`, or None when some of them have already left the ring"""
+        with self.condition:
+            if seq > self.seq:
+                return None
+            if seq == self.seq:
+                return []
+            if not self.frames or self.frames[0][0] > seq + 1:
+                return None
+            return [frame for frame_seq, frame in self.frames if frame_seq > seq]
+
+    def wait(self, seq: int, timeout: float) -> bool:
+        with self.condition:
+            return self.condition.wait_for(lambda: self.seq > seq, timeout)
+
+
+class EventStreams:
+    def __init__(self, ring_size: int = 256, heartbeat_seconds: float = 15.0, retry_ms: int = 3000,
+                 max_connections: int = 5000):
+        self.ring_size = ring_size
+        self.heartbeat_seconds = heartbeat_seconds
+        self.retry_ms = retry_ms
+        self.max_connections = max_connections
+        self.connections = 0
+        self._rings: Dict[str, EventRing] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, ring_size: int, heartbeat_seconds: float, retry_ms: int, max_connections: int):
+        self.ring_size = ring_size
+        self.heartbeat_seconds = heartbeat_seconds
+        self.retry_ms = retry_ms
+        self.max_connections = max_connections
+
+    def ring(self, game_id: str) -> EventRing:
+        ring = self._rings.get(game_id)
+        if ring is None:
+            with self._lock:
+                ring = self._rings.setdefault(game_id, EventRing(self.ring_size))
+        return ring
+
+    def publish(self, game_id: str, event: str, data: str):
+        self.ring(game_id).publish(event, data)
+
+    def open(self) -> bool:
+        """Claim a connection slot"""
+        with self._lock:
+            if self.connections >= self.max_connections:
+                return False
+            self.connections += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.connections -= 1
+
+    @staticmethod
+    def _resume_seq(last_event_id: Optional[str]) -> Optional[int]:
+        prefix, _, seq = (last_event_id or '').rpartition('-')
+        if prefix != STREAM_PREFIX or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def stream(self, game_id: str, last_event_id: Optional[str],
+               snapshot: Callable[[], List[Tuple[str, str]]]) -> Iterator[bytes]:
+        """Frames for one connection (release its slot when the response closes)"""
+        ring = self.ring(game_id)
+        yield f'retry: {self.retry_ms}\n\n'.encode('utf-8')
+        seq = self._resume_seq(last_event_id)
+        backlog = ring.since(seq) if seq is not None else None
+        if backlog is None:
+            # Fresh connection, or a resume the ring cannot serve: start from the current state
+            seq = ring.seq
+            if last_event_id:
+                yield sse_frame('reset', '{}')
+            for event, data in snapshot():
+                yield sse_frame(event, data)
+        else:
+            seq += len(backlog)
+            yield from backlog
+        while True:
+            if not ring.wait(seq, self.heartbeat_seconds):
+                yield b': keepalive\n\n'
+                continue
+            frames = ring.since(seq)
+            if frames is None:
+                # Fell behind by more than the ring holds
+                seq = ring.seq
+                yield sse_frame('reset', '{}')
+                for event, data in snapshot():
+                    yield sse_frame(event, data)
+                continue
+            seq += len(frames)
+            yield b''.join(frames)
+
+
+event_streams = EventStreams()
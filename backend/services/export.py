@@ -0,0 +1,156 @@
+"""
+Streaming exports of game data as NDJSON or CSV.
+
+Rows come straight off batched MongoDB cursors and are written out in ~64KB
+chunks, optionally gzip-compressed on the fly, so memory stays constant no
+matter how large the history is.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple
+from bson import ObjectId
+
+from ..models.epoch import current_epoch, fresh_view
+from ..models.team import TEAM_PROGRESS_DEFAULTS
+from ..models.page import SOLVE_STATE_DEFAULTS
+
+CHUNK_SIZE = 64 * 1024
+BATCH_SIZE = 500
+FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+class ExportSpec(NamedTuple):
+    columns: List[str]
+    rows: Callable[[Any, str, int, int], Iterable[Dict[str, Any]]]
+
+
+def _teams(db_manager, game_id: str, epoch: int, batch_size: int) -> Iterator[Dict[str, Any]]:
+    projection = {'password_hash': 0, 'word_guesses': 0, 'letter_guesses': 0}
+    cursor = db_manager.get_collection('teams', 'admin').find({'game_id': game_id}, projection,
+                                                               batch_size=batch_size).sort('_id', 1)
+    for team in cursor:
+        team = fresh_view(team, epoch, TEAM_PROGRESS_DEFAULTS)
+        yield {
+            'code': team.get('code'),
+            'name': team.get('name'),
+            'NOMs': team.get('NOMs', 0),
+            'guesses_left': team.get('guesses_left'),
+            'solved_pages': list(team.get('solved_pages', [])),
+            'created_at': team.get('created_at'),
+            'last_activity': team.get('last_activity'),
+            'epoch': team.get('epoch', 0)
+        }
+
+
+def _unwound_guesses(field: str, columns: List[str]):
+    def rows(db_manager, game_id: str, epoch: int, batch_size: int) -> Iterator[Dict[str, Any]]:
+        # Guesses stamped with an older epoch belong to an archived round
+        pipeline = [
+            {'$match': {'game_id': game_id, 'epoch': epoch}},
+            {'$sort': {'_id': 1}},
+            {'$project': {'code': 1, 'name': 1, field: 1}},
+            {'$unwind': f'${field}'}
+        ]
+        cursor = db_manager.get_collection('teams', 'admin').aggregate(pipeline, batchSize=batch_size, allowDiskUse=True)
+        for doc in cursor:
+            guess = doc[field]
+            yield dict({'team_code': doc.get('code'), 'team_name': doc.get('name')},
+                       **{column: guess.get(column) for column in columns})
+    return rows
+
+
+def _page_solves(db_manager, game_id: str, epoch: int, batch_size: int) -> Iterator[Dict[str, Any]]:
+    projection = {'number': 1, 'letter': 1, 'epoch': 1, **dict.fromkeys(SOLVE_STATE_DEFAULTS, 1)}
+    projection.pop('solution_used')
+    cursor = db_manager.get_collection('pages', 'admin').find({'game_id': game_id}, projection,
+                                                               batch_size=batch_size).sort('number', 1)
+    for page in cursor:
+        page = fresh_view(page, epoch, SOLVE_STATE_DEFAULTS)
+        yield {field: page.get(field) for field in EXPORTS['page_solves'].columns}
+
+
+EXPORTS: Dict[str, ExportSpec] = {
+    'teams': ExportSpec(
+        ['code', 'name', 'NOMs', 'guesses_left', 'solved_pages', 'created_at', 'last_activity', 'epoch'], _teams
+    ),
+    'word_guesses': ExportSpec(
+        ['team_code', 'team_name', 'guess', 'correct', 'timestamp'],
+        _unwound_guesses('word_guesses', ['guess', 'correct', 'timestamp'])
+    ),
+    'letter_guesses': ExportSpec(
+        ['team_code', 'team_name', 'letter', 'page_number', 'timestamp'],
+        _unwound_guesses('letter_guesses', ['letter', 'page_number', 'timestamp'])
+    ),
+    'page_solves': ExportSpec(
+        ['number', 'letter', 'is_solved', 'solved_by', 'solved_at', 'first_solver_team_code', 'letter_guessed', 'epoch'],
+        _page_solves
+    )
+}
+
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat() + 'Z'
+    if isinstance(value, ObjectId):
+        return str(value)
+    return value
+
+
+def _csv_cell(value: Any) -> Any:
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        # Arrays stay arrays in NDJSON; a CSV cell holds them space-separated
+        return ' '.join(str(_plain(item)) for item in value)
+    return _plain(value)
+
+
+def _ndjson_lines(rows: Iterable[Dict[str, Any]], columns: List[str]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps({column: _plain(row.get(column)) for column in columns}, default=str) + '\n'
+
+
+def _csv_lines(rows: Iterable[Dict[str, Any]], columns: List[str]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([_csv_cell(row.get(column)) for column in columns])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    yield buffer.getvalue()
+
+
+def _chunked(lines: Iterable[str], compress: bool) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None  # wbits 31: gzip container
+    pending: List[bytes] = []
+    size = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        pending.append(data)
+        size += len(data)
+        if size >= CHUNK_SIZE:
+            chunk = b''.join(pending)
+            pending, size = [], 0
+            chunk = compressor.compress(chunk) if compressor else chunk
+            if chunk:
+                yield chunk
+    chunk = b''.join(pending)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def stream_export(db_manager, game_id: str, entity: str, fmt: str, compress: bool = False,
+                  batch_size: int = BATCH_SIZE) -> Iterator[bytes]:
+    """Byte chunks of an export; the cursor is only opened once iteration starts"""
+    spec = EXPORTS[entity]
+    epoch = current_epoch(db_manager, game_id)
+    rows = spec.rows(db_manager, game_id, epoch, batch_size)
+    lines = _csv_lines(rows, spec.columns) if fmt == 'csv' else _ndjson_lines(rows, spec.columns)
+    return _chunked(lines, compress)
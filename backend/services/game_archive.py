@@ -0,0 +1,259 @@
+"""
+Offline archives of finished games.
+
+A game is streamed off batched cursors into one column-oriented file per entity:
+rows are grouped (`ROW_GROUP_SIZE`) and each column of a group is stored as its
+own zlib-compressed JSON array. `manifest.json` records where every column chunk
+lives, so `ArchiveReader` can memory-map an entity file and decompress only the
+columns it is asked for. After the archive is written and read back, the game's
+documents are pruned from the live collections (`flask archive-game`).
+"""
+import json
+import mmap
+import os
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List
+from bson import ObjectId
+import structlog
+
+from ..models.epoch import EPOCH_ARCHIVE_COLLECTION
+from .page_analytics import PAGE_STATS_COLLECTION
+from .token_revocation import revocation_store
+
+logger = structlog.get_logger()
+
+ARCHIVE_FORMAT = 'wordgame-columnar/1'
+MANIFEST_FILE = 'manifest.json'
+ROW_GROUP_SIZE = 10000
+BATCH_SIZE = 1000
+
+# Entity -> (collection, pipeline stages after the game match); guesses are flattened out of team documents
+ENTITIES = {
+    'game_state': ('game_state', []),
+    'pages': ('pages', [{'$sort': {'number': 1}}]),
+    'teams': ('teams', [{'$sort': {'_id': 1}}, {'$project': {'password_hash': 0, 'word_guesses': 0, 'letter_guesses': 0}}]),
+    'word_guesses': ('teams', [
+        {'$sort': {'_id': 1}},
+        {'$project': {'team_code': '$code', 'epoch': 1, 'guess': '$word_guesses'}},
+        {'$unwind': '$guess'},
+        {'$project': {'_id': 0, 'team_code': 1, 'epoch': 1, 'guess': '$guess.guess', 'correct': '$guess.correct',
+                      'timestamp': '$guess.timestamp'}}
+    ]),
+    'letter_guesses': ('teams', [
+        {'$sort': {'_id': 1}},
+        {'$project': {'team_code': '$code', 'epoch': 1, 'guess': '$letter_guesses'}},
+        {'$unwind': '$guess'},
+        {'$project': {'_id': 0, 'team_code': 1, 'epoch': 1, 'letter': '$guess.letter',
+                      'page_number': '$guess.page_number', 'timestamp': '$guess.timestamp'}}
+    ]),
+    'epoch_archive': (EPOCH_ARCHIVE_COLLECTION, [{'$sort': {'epoch': 1, 'collection': 1, 'doc_id': 1}}]),
+    'page_stats': (PAGE_STATS_COLLECTION, [{'$sort': {'epoch': 1, 'page': 1, 'bucket': 1}}])
+}
+
+# Collections a game is pruned from once archived
+LIVE_COLLECTIONS = ('teams', 'pages', 'game_state', EPOCH_ARCHIVE_COLLECTION, PAGE_STATS_COLLECTION)
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {'$date': value.isoformat() + 'Z'}
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f'Cannot archive value of type {type(value).__name__}')
+
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, dict) and set(value) == {'$date'}:
+        return datetime.fromisoformat(value['$date'].rstrip('Z'))
+    return value
+
+
+class ColumnWriter:
+    """Writes rows of one entity as compressed column chunks, a row group at a time"""
+
+    def __init__(self, path: str, row_group_size: int = ROW_GROUP_SIZE):
+        self.path = path
+        self.row_group_size = row_group_size
+        self.columns: List[str] = []
+        self.row_groups: List[Dict[str, Any]] = []
+        self.rows = 0
+        self._pending: List[Dict[str, Any]] = []
+        self._file = open(path, 'wb')
+
+    def write(self, row: Dict[str, Any]):
+        for column in row:
+            if column not in self.columns:
+                self.columns.append(column)
+        self._pending.append(row)
+        if len(self._pending) >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        chunks = {}
+        for column in self.columns:
+            data = zlib.compress(json.dumps([row.get(column) for row in self._pending], default=_encode,
+                                            separators=(',', ':')).encode('utf-8'), 6)
+            chunks[column] = {'offset': self._file.tell(), 'length': len(data)}
+            self._file.write(data)
+        self.row_groups.append({'rows': len(self._pending), 'columns': chunks})
+        self.rows += len(self._pending)
+        self._pending = []
+
+    def close(self) -> Dict[str, Any]:
+        self._flush()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        return {
+            'file': os.path.basename(self.path),
+            'rows': self.rows,
+            'bytes': os.path.getsize(self.path),
+            'columns': self.columns,
+            'row_groups': self.row_groups
+        }
+
+
+class ArchiveReader:
+    """Memory-mapped access to an archive directory.
+
+    Columns are decompressed on demand, one row group at a time; a column missing
+    from an older row group reads as None.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get('format') != ARCHIVE_FORMAT:
+            raise ArchiveError(f"Unsupported archive format: {self.manifest.get('format')}")
+        self._maps: Dict[str, mmap.mmap] = {}
+        self._files = []
+
+    @property
+    def entities(self) -> List[str]:
+        return list(self.manifest['entities'])
+
+    def columns(self, entity: str) -> List[str]:
+        return self._entity(entity)['columns']
+
+    def count(self, entity: str) -> int:
+        return self._entity(entity)['rows']
+
+    def _entity(self, entity: str) -> Dict[str, Any]:
+        try:
+            return self.manifest['entities'][entity]
+        except KeyError:
+            raise ArchiveError(f'Unknown entity: {entity}')
+
+    def _map(self, entity: str) -> mmap.mmap:
+        if entity not in self._maps:
+            f = open(os.path.join(self.directory, self._entity(entity)['file']), 'rb')
+            self._files.append(f)
+            self._maps[entity] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._maps[entity]
+
+    def _chunk(self, entity: str, row_group: Dict[str, Any], column: str) -> List[Any]:
+        location = row_group['columns'].get(column)
+        if location is None:
+            return [None] * row_group['rows']
+        view = self._map(entity)[location['offset']:location['offset'] + location['length']]
+        return [_decode(value) for value in json.loads(zlib.decompress(view))]
+
+    def column(self, entity: str, name: str) -> Iterator[Any]:
+        for row_group in self._entity(entity)['row_groups']:
+            yield from self._chunk(entity, row_group, name)
+
+    def rows(self, entity: str, columns: Iterable[str] = None) -> Iterator[Dict[str, Any]]:
+        columns = list(columns or self.columns(entity))
+        for row_group in self._entity(entity)['row_groups']:
+            values = [self._chunk(entity, row_group, column) for column in columns]
+            for row in zip(*values):
+                yield dict(zip(columns, row))
+
+    def close(self):
+        for mapped in self._maps.values():
+            mapped.close()
+        for f in self._files:
+            f.close()
+        self._maps, self._files = {}, []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_archive(db_manager, game_id: str, directory: str, row_group_size: int = ROW_GROUP_SIZE,
+                  batch_size: int = BATCH_SIZE) -> Dict[str, Any]:
+    """Stream every entity of a game into `directory` and write its manifest"""
+    os.makedirs(directory, exist_ok=True)
+    if os.path.exists(os.path.join(directory, MANIFEST_FILE)):
+        raise ArchiveError(f'{directory} already holds an archive')
+    entities = {}
+    for entity, (collection_name, stages) in ENTITIES.items():
+        writer = ColumnWriter(os.path.join(directory, f'{entity}.col'), row_group_size)
+        try:
+            cursor = db_manager.get_collection(collection_name).aggregate(
+                [{'$match': {'game_id': game_id}}] + stages, batchSize=batch_size, allowDiskUse=True
+            )
+            for document in cursor:
+                writer.write(document)
+        finally:
+            entities[entity] = writer.close()
+    manifest = {
+        'format': ARCHIVE_FORMAT,
+        'game_id': game_id,
+        'created_at': datetime.utcnow().isoformat() + 'Z',
+        'compression': 'zlib',
+        'encoding': 'json',
+        'entities': entities
+    }
+    # Written last: an archive directory without a manifest is incomplete
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return manifest
+
+
+def verify_archive(directory: str, manifest: Dict[str, Any]):
+    """Read every column back and check the row counts against the manifest"""
+    with ArchiveReader(directory) as reader:
+        for entity, details in manifest['entities'].items():
+            for column in details['columns']:
+                read = sum(1 for _ in reader.column(entity, column))
+                if read != details['rows']:
+                    raise ArchiveError(f'{entity}.{column}: read {read} values, expected {details["rows"]}')
+
+
+def prune_game(db_manager, game_id: str) -> Dict[str, int]:
+    """Delete an archived game from the live collections"""
+    deleted = {}
+    if revocation_store.enabled:
+        # Tokens of pruned teams must not outlive them
+        for team in db_manager.get_collection('teams').find({'game_id': game_id}, {'_id': 1}):
+            revocation_store.revoke_subject(team['_id'], 'game_pruned')
+    for name in LIVE_COLLECTIONS:
+        deleted[name] = db_manager.get_collection(name).delete_many({'game_id': game_id}).deleted_count
+    db_manager.get_collection('counters').delete_one({'_id': f'team_count:{game_id}'})
+    return deleted
+
+
+def archive_game(db_manager, game_id: str, directory: str, prune: bool = True,
+                 row_group_size: int = ROW_GROUP_SIZE) -> Dict[str, Any]:
+    manifest = write_archive(db_manager, game_id, directory, row_group_size)
+    verify_archive(directory, manifest)
+    rows = {entity: details['rows'] for entity, details in manifest['entities'].items()}
+    logger.info("Game archived", game_id=game_id, directory=directory, rows=rows)
+    if prune:
+        manifest['pruned'] = prune_game(db_manager, game_id)
+        logger.info("Archived game pruned", game_id=game_id, deleted=manifest['pruned'])
+    return manifest
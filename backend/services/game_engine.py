@@ -0,0 +1,525 @@
+"""
+Single-writer, in-memory game engine.
+
+Holds the authoritative game_state, page solve state and team gameplay fields in
+memory. Commands are serialized through one writer thread; every mutation is
+appended to a write-ahead journal before it is applied, then persisted to MongoDB
+asynchronously as absolute ``$set`` writes so journal replay is idempotent.
+"""
+import copy
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from bson import ObjectId, json_util
+from werkzeug.exceptions import ServiceUnavailable
+import structlog
+
+from .game_service import GameManager
+from .page_analytics import OUTCOME_CONFLICT, OUTCOME_CORRECT, OUTCOME_WRONG, page_analytics
+from ..models.epoch import fresh_view, next_epoch_state, rollover, schedule_sweep
+from ..models.page import SOLVE_STATE_DEFAULTS, Page, get_page_table
+from ..models.team import TEAM_PROGRESS_DEFAULTS
+from ..utils.constants import DEFAULT_GAME_ID, GAME_STATUS_ACTIVE, GAME_STATUS_COMPLETED, GAME_STATUS_WAITING, TOTAL_PAGES
+from ..utils.helpers import current_game_id
+
+logger = structlog.get_logger()
+
+Write = Tuple[str, Dict[str, Any], Dict[str, Any]]
+
+# Progress defaults of the epoch-scoped collections
+PROGRESS_DEFAULTS = {'pages': SOLVE_STATE_DEFAULTS, 'teams': TEAM_PROGRESS_DEFAULTS}
+
+
+class EngineResult(NamedTuple):
+    body: Dict[str, Any]
+    status: int
+    events: List[Tuple[str, Dict[str, Any]]] = []
+
+
+class GameEngine:
+    IDLE_COMPACT_SECONDS = 1.0
+
+    def __init__(self, db_manager, page_table, journal_path: str, fsync: bool = True, game_id: str = DEFAULT_GAME_ID):
+        self.db_manager = db_manager
+        self.game_id = game_id
+        self.page_table = page_table
+        self.journal_path = journal_path
+        self.fsync = fsync
+        self.game_state: Dict[str, Any] = {}
+        self.pages: Dict[int, Dict[str, Any]] = {}
+        self.teams: Dict[str, Dict[str, Any]] = {}
+        self._seq = 0
+        self._persisted_seq = 0
+        self._lock = threading.RLock()
+        self._commands: queue.Queue = queue.Queue()
+        self._persist_queue: queue.Queue = queue.Queue()
+        self._journal = None
+        self._threads: List[threading.Thread] = []
+
+    # Lifecycle
+
+    def start(self):
+        self._load()
+        self._recover()
+        directory = os.path.dirname(self.journal_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        for target, name in ((self._run_writer, 'game-engine-writer'), (self._run_persister, 'game-engine-persister')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info("Game engine started", game_id=self.game_id, seq=self._seq, teams=len(self.teams), pages=len(self.pages))
+
+    def stop(self, timeout: float = 5.0):
+        self.flush(timeout)
+        self._commands.put(None)
+        self._persist_queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        if self._journal:
+            self._journal.close()
+
+    def _load(self):
+        game_state = self.db_manager.get_collection('game_state').find_one(self._state_filter()) or {
+            'game_id': self.game_id,
+            'type': 'current',
+            'current_page': 1,
+            'revealed_letters': {},
+            'game_status': GAME_STATUS_WAITING
+        }
+        epoch = game_state.get('epoch', 0)
+        with self._lock:
+            self.game_state = game_state
+            self.pages = {
+                p['number']: fresh_view(p, epoch, SOLVE_STATE_DEFAULTS)
+                for p in self.db_manager.get_collection('pages').find({'game_id': self.game_id})
+            }
+            self.teams = {
+                str(t['_id']): fresh_view(t, epoch, TEAM_PROGRESS_DEFAULTS)
+                for t in self.db_manager.get_collection('teams').find({'game_id': self.game_id})
+            }
+            self._seq = self._persisted_seq = game_state.get('engine_seq', 0)
+
+    def _recover(self):
+        """Replay journal entries that never reached MongoDB, then start a fresh journal"""
+        if not os.path.exists(self.journal_path):
+            return
+        replayed = 0
+        with open(self.journal_path, 'r', encoding='utf-8') as journal:
+            for line in journal:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json_util.loads(line)
+                except ValueError:
+                    # A torn final write means the command was never acknowledged
+                    logger.warning("Skipping unreadable journal entry", path=self.journal_path)
+                    break
+                if entry['seq'] <= self._seq:
+                    continue
+                self._apply_writes(entry['writes'])
+                self._persist_entry(entry)
+                self._seq = self._persisted_seq = entry['seq']
+                replayed += 1
+        open(self.journal_path, 'w').close()
+        if replayed:
+            logger.info("Game engine journal replayed", entries=replayed, seq=self._seq)
+
+    # Command pipeline
+
+    def execute(self, command: str, timeout: float = 5.0, **kwargs) -> EngineResult:
+        """Run a command on the writer thread and wait for its result.
+
+        On timeout a command still queued is cancelled and never runs. One the
+        writer had already started cannot be stopped: a `TimeoutError` then means
+        the command may still apply.
+        """
+        future: Future = Future()
+        self._commands.put((command, kwargs, future))
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                logger.warning("Game engine command cancelled after timeout", command=command, timeout=timeout)
+            else:
+                logger.warning("Game engine command timed out while running", command=command, timeout=timeout)
+            raise
+
+    def _run_writer(self):
+        while True:
+            try:
+                item = self._commands.get(timeout=self.IDLE_COMPACT_SECONDS)
+            except queue.Empty:
+                self._compact_journal()
+                continue
+            if item is None:
+                return
+            command, kwargs, future = item
+            if not future.set_running_or_notify_cancel():
+                # The caller gave up waiting before this command started
+                continue
+            try:
+                with self._lock:
+                    result, writes = getattr(self, f'_cmd_{command}')(**kwargs)
+                    if writes:
+                        self._commit(command, writes)
+                future.set_result(result)
+            except Exception as e:
+                logger.error("Game engine command failed", command=command, error=str(e))
+                future.set_exception(e)
+
+    def _commit(self, command: str, writes: List[Write]):
+        self._seq += 1
+        epoch = self.game_state.get('epoch', 0)
+        for collection, _, fields in writes:
+            if collection in PROGRESS_DEFAULTS:
+                fields['epoch'] = epoch
+        writes.append(('game_state', self._state_filter(), {'engine_seq': self._seq}))
+        entry = {
+            'seq': self._seq,
+            'command': command,
+            'ts': datetime.utcnow(),
+            'writes': [{'collection': c, 'filter': f, 'set': s} for c, f, s in writes]
+        }
+        self._journal.write(json_util.dumps(entry) + '\n')
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+        self._apply_writes(entry['writes'])
+        self._persist_queue.put(entry)
+
+    def _apply_writes(self, writes: List[Dict[str, Any]]):
+        for write in writes:
+            doc = self._resolve(write['collection'], write['filter'])
+            if doc is not None:
+                doc.update(copy.deepcopy(write['set']))
+            if write['collection'] == 'game_state' and 'epoch' in write['set']:
+                self._roll_epoch(write['set']['epoch'])
+
+    def _roll_epoch(self, epoch: int):
+        for number, page in self.pages.items():
+            self.pages[number] = fresh_view(page, epoch, SOLVE_STATE_DEFAULTS)
+        for team_id, team in self.teams.items():
+            self.teams[team_id] = fresh_view(team, epoch, TEAM_PROGRESS_DEFAULTS)
+
+    def _resolve(self, collection: str, filter: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if collection == 'game_state':
+            return self.game_state
+        if collection == 'pages':
+            return self.pages.get(filter['number'])
+        if collection == 'teams':
+            return self.teams.get(str(filter['_id']))
+        return None
+
+    def _state_filter(self) -> Dict[str, Any]:
+        return {'game_id': self.game_id, 'type': 'current'}
+
+    def _page_filter(self, number: int) -> Dict[str, Any]:
+        return {'game_id': self.game_id, 'number': number}
+
+    def _team_filter(self, team: Dict[str, Any]) -> Dict[str, Any]:
+        return {'game_id': self.game_id, '_id': team['_id']}
+
+    def _word(self) -> str:
+        return self.game_state.get('word') or GameManager.WORD
+
+    def _compact_journal(self):
+        with self._lock:
+            if self._persisted_seq == self._seq and self._journal and self._journal.tell() > 0:
+                self._journal.truncate(0)
+                self._journal.seek(0)
+
+    # Persistence
+
+    def _run_persister(self):
+        while True:
+            entry = self._persist_queue.get()
+            if entry is None:
+                return
+            delay = 0.1
+            while True:
+                try:
+                    self._persist_entry(entry)
+                    break
+                except Exception as e:
+                    # Order matters, so keep retrying this entry; the journal covers a crash meanwhile
+                    logger.error("Game engine persistence failed", seq=entry['seq'], error=str(e))
+                    time.sleep(delay)
+                    delay = min(delay * 2, 5.0)
+            # Plain assignment: the writer may hold the lock while flush() waits on this
+            self._persisted_seq = entry['seq']
+
+    def _persist_entry(self, entry: Dict[str, Any]):
+        for write in entry['writes']:
+            collection = self.db_manager.get_collection(write['collection'])
+            defaults = PROGRESS_DEFAULTS.get(write['collection'])
+            if defaults is None:
+                collection.update_one(write['filter'], {'$set': write['set']})
+                if write['collection'] == 'game_state' and 'epoch' in write['set']:
+                    schedule_sweep(self.db_manager, self.game_id, write['set']['epoch'])
+                continue
+            # Progress of an older epoch is archived before it is overwritten
+            epoch = write['set'].get('epoch', 0)
+            current = dict(write['filter'], epoch=epoch)
+            if collection.update_one(current, {'$set': write['set']}).matched_count == 0:
+                rollover(self.db_manager, write['collection'], write['filter'], epoch, defaults)
+                collection.update_one(current, {'$set': write['set']})
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until every committed command has been written to MongoDB"""
+        deadline = time.monotonic() + timeout
+        while self._persisted_seq < self._seq:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    # Reads
+
+    @property
+    def version(self) -> int:
+        """Sequence number of the last committed command"""
+        return self._seq
+
+    def status_snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return copy.deepcopy(self.game_state)
+
+    def teams_snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return copy.deepcopy(list(self.teams.values()))
+
+    # Commands
+
+    def _team(self, team_id: str) -> Optional[Dict[str, Any]]:
+        team = self.teams.get(team_id)
+        if team is None and ObjectId.is_valid(team_id):
+            # Teams registered after startup are picked up on first use
+            team = self.db_manager.get_collection('teams').find_one({'game_id': self.game_id, '_id': ObjectId(team_id)})
+            team = fresh_view(team, self.game_state.get('epoch', 0), TEAM_PROGRESS_DEFAULTS)
+            if team:
+                self.teams[team_id] = team
+        return team
+
+    def _cmd_reload(self):
+        # Queued persists would otherwise land on top of the reloaded state and out of step with engine_seq
+        if not self.flush():
+            logger.error("Game engine reload aborted, writes still pending", game_id=self.game_id,
+                         seq=self._seq, persisted_seq=self._persisted_seq)
+            return EngineResult({'error': 'Game engine has unpersisted writes; reload aborted'}, 503), []
+        self._load()
+        return EngineResult({'message': 'Game engine reloaded'}, 200), []
+
+    def _cmd_start_game(self):
+        if self.game_state['game_status'] != GAME_STATUS_WAITING:
+            return EngineResult({'error': 'Game is not in waiting state'}, 400), []
+        now = datetime.utcnow()
+        writes = [('game_state', self._state_filter(), {'game_status': GAME_STATUS_ACTIVE, 'page_started_at': now,
+                                                         'updated_at': now})]
+        return EngineResult({'message': 'Game started successfully'}, 200), writes
+
+    def _cmd_solve_page(self, team_id: str, answer: str):
+        team = self._team(team_id)
+        if not team:
+            return EngineResult({'error': 'Team not found'}, 404), []
+        if self.game_state['game_status'] != GAME_STATUS_ACTIVE:
+            return EngineResult({'error': 'Game is not in progress'}, 400), []
+
+        number = self.game_state['current_page']
+        if not self.page_table.check_answer(number, answer):
+            self._record_attempt(number, OUTCOME_WRONG, answer=answer)
+            return EngineResult({'error': 'Incorrect answer'}, 400), []
+        page = self.pages.get(number)
+        if not page or page.get('is_solved'):
+            self._record_attempt(number, OUTCOME_CONFLICT)
+            return EngineResult({'error': 'Page was solved by another team'}, 409), []
+        self._record_attempt(number, OUTCOME_CORRECT, team_code=team['code'])
+
+        now = datetime.utcnow()
+        writes = [('pages', self._page_filter(number), {
+            'is_solved': True,
+            'solved_by': team['code'],
+            'solved_at': now,
+            'first_solver_team_code': team['code'],
+            'solution_used': answer,
+            'updated_at': now
+        })]
+        if number < TOTAL_PAGES:
+            new_page = number + 1
+            writes.append(('game_state', self._state_filter(), {'current_page': new_page, 'page_started_at': now,
+                                                                'updated_at': now}))
+        else:
+            new_page = number
+            writes.append(('game_state', self._state_filter(), {'game_status': GAME_STATUS_COMPLETED, 'updated_at': now}))
+        solved_pages = list(team.get('solved_pages', []))
+        if number not in solved_pages:
+            solved_pages.append(number)
+        writes.append(('teams', self._team_filter(team), {
+            'NOMs': team.get('NOMs', 0) + 1,
+            'solved_pages': solved_pages,
+            'last_activity': now
+        }))
+
+        events = [
+            ('page_solved', {'page': number, 'team_code': team.get('code')}),
+            ('advance_page', {'current_page': new_page})
+        ]
+        body = {
+            'message': 'Page solved successfully! You can now guess a letter.',
+            'can_guess_letter': True,
+            'first_solver': True
+        }
+        return EngineResult(body, 200, events), writes
+
+    def _record_attempt(self, number: int, outcome: str, **details):
+        page_analytics.record_attempt(self.game_id, self.game_state.get('epoch', 0), number, outcome,
+                                      page_started_at=self.game_state.get('page_started_at'), **details)
+
+    def _cmd_guess_letter(self, team_id: str, letter: str):
+        team = self._team(team_id)
+        if not team:
+            return EngineResult({'error': 'Team not found'}, 404), []
+        if self.game_state['game_status'] != GAME_STATUS_ACTIVE:
+            return EngineResult({'error': 'Game is not in progress'}, 400), []
+
+        number = self.game_state['current_page']
+        if number > TOTAL_PAGES:
+            return EngineResult({'error': 'All pages have been solved'}, 400), []
+        page = self.pages.get(number)
+        if not page:
+            return EngineResult({'error': 'Invalid page'}, 400), []
+        if page.get('first_solver_team_code') != team['code']:
+            return EngineResult({'error': 'Only the first solver can guess a letter'}, 403), []
+        if page.get('letter_guessed'):
+            return EngineResult({'error': 'Letter already guessed for this page'}, 400), []
+        if any(g.get('letter') == letter and g.get('page_number') == number for g in team.get('letter_guesses', [])):
+            return EngineResult({'error': 'You have already guessed this letter on this page'}, 400), []
+        revealed = self.game_state.get('revealed_letters', {})
+        if letter in revealed:
+            return EngineResult({'error': 'Letter already revealed'}, 400), []
+
+        now = datetime.utcnow()
+        positions = GameManager.get_letter_positions(letter, self._word())
+        letter_guesses = list(team.get('letter_guesses', []))
+        letter_guesses.append({'letter': letter, 'page_number': number, 'timestamp': now})
+        writes = [
+            ('pages', self._page_filter(number), {'letter_guessed': True}),
+            ('teams', self._team_filter(team), {'letter_guesses': letter_guesses, 'last_activity': now})
+        ]
+        if not positions:
+            return EngineResult({
+                'correct': False,
+                'letter': letter,
+                'message': f'Letter {letter} not found in the word'
+            }, 200), writes
+
+        revealed = {k: list(v) for k, v in revealed.items()}
+        revealed[letter] = sorted(positions)
+        writes.append(('game_state', self._state_filter(), {'revealed_letters': revealed, 'updated_at': now}))
+        return EngineResult({
+            'correct': True,
+            'letter': letter,
+            'positions': positions,
+            'message': f'Letter {letter} revealed in positions {positions}'
+        }, 200, [('letter_guessed', {'letter': letter, 'positions': positions})]), writes
+
+    def _cmd_guess_word(self, team_id: str, guess: str):
+        team = self._team(team_id)
+        if not team:
+            return EngineResult({'error': 'Team not found'}, 404), []
+        if self.game_state['game_status'] not in [GAME_STATUS_ACTIVE, GAME_STATUS_COMPLETED]:
+            return EngineResult({'error': 'Game is not in progress or completed'}, 400), []
+        if len(team.get('word_guesses', [])) >= 3:
+            return EngineResult({'error': 'No more word guesses remaining'}, 400), []
+
+        now = datetime.utcnow()
+        is_correct = GameManager.validate_word_guess(guess, self._word())
+        word_guesses = list(team.get('word_guesses', []))
+        word_guesses.append({'guess': guess, 'correct': is_correct, 'timestamp': now})
+        team_set = {'word_guesses': word_guesses, 'last_activity': now}
+        writes = [('teams', self._team_filter(team), team_set)]
+        events = [('word_guessed', {'team_code': team.get('code'), 'correct': is_correct})]
+
+        if is_correct:
+            writes.append(('game_state', self._state_filter(), {'game_status': GAME_STATUS_COMPLETED, 'updated_at': now}))
+            return EngineResult({
+                'correct': True,
+                'message': 'Congratulations! You guessed the word correctly!'
+            }, 200, events), writes
+
+        remaining = max(0, team.get('guesses_left', 3) - 1)
+        team_set['guesses_left'] = remaining
+        return EngineResult({
+            'correct': False,
+            'message': f'Incorrect guess. {remaining} guesses remaining.',
+            'remaining_guesses': remaining
+        }, 200, events), writes
+
+    def _cmd_reset_game(self):
+        # A new epoch: one game_state write, pages and teams roll over in memory and lazily in MongoDB
+        writes = [('game_state', self._state_filter(), next_epoch_state(self.game_state))]
+        return EngineResult({'message': 'Game reset successfully'}, 200), writes
+
+
+_engines: Dict[str, GameEngine] = {}
+_engines_lock = threading.Lock()
+_settings: Dict[str, Any] = {}
+
+
+def configure_game_engine(app, db_manager):
+    """Enable per-game engines; each game's engine starts on first use"""
+    _settings.update(
+        db_manager=db_manager,
+        journal=app.config['GAME_ENGINE_JOURNAL'],
+        fsync=app.config.get('GAME_ENGINE_FSYNC', True)
+    )
+
+
+def _journal_path(template: str, game_id: str) -> str:
+    # Every game needs its own journal
+    return template.format(game_id=game_id) if '{game_id}' in template else f'{template}.{game_id}'
+
+
+def get_game_engine(game_id: Optional[str] = None) -> Optional[GameEngine]:
+    """Return the engine of a game (default: the request's), or None when gameplay goes straight to MongoDB"""
+    if not _settings:
+        return None
+    game_id = game_id or current_game_id()
+    engine = _engines.get(game_id)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(game_id)
+            if engine is None:
+                db_manager = _settings['db_manager']
+                page_table = get_page_table(Page(db_manager, game_id))
+                engine = GameEngine(
+                    db_manager,
+                    page_table,
+                    _journal_path(_settings['journal'], game_id),
+                    fsync=_settings['fsync'],
+                    game_id=game_id
+                )
+                engine.start()
+                _engines[game_id] = engine
+    return engine
+
+
+def has_running_engine(game_id: str) -> bool:
+    """Whether a game is already served by an engine (never starts one)"""
+    return game_id in _engines
+
+
+def reload_game_engine(game_id: Optional[str] = None):
+    """Resynchronize a running engine after state was changed outside of it (admin actions)"""
+    engine = _engines.get(game_id or current_game_id()) if _settings else None
+    if engine is not None:
+        result = engine.execute('reload', timeout=10.0)
+        if result.status != 200:
+            raise ServiceUnavailable(result.body['error'])
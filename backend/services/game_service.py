@@ -1,83 +1,162 @@
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Tuple
 from ..utils.constants import GAME_WORD
 
+_numpy = None
+
+
+def _load_numpy():
+    """Import numpy on first batch call so it stays off the startup path"""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:  # batch scoring falls back to the memoized scalar path
+            _numpy = False
+    return _numpy or None
+
 
 class GameManager:
     WORD = GAME_WORD
 
     @staticmethod
-    def unique_letters():
-        letters = set([c for c in GameManager.WORD if c.isalpha()])
+    def unique_letters(word=None):
+        letters = set([c for c in (word or GameManager.WORD) if c.isalpha()])
         return sorted(list(letters))
 
     @staticmethod
-    def get_letter_positions(letter):
+    def get_letter_positions(letter, word=None):
         positions = []
-        for i, char in enumerate(GameManager.WORD):
+        for i, char in enumerate(word or GameManager.WORD):
             if char == letter:
                 positions.append(i)
         return positions
 
     @staticmethod
-    def validate_word_guess(guess):
-        return guess.upper().strip() == GameManager.WORD
+    def validate_word_guess(guess, word=None):
+        return guess.upper().strip() == (word or GameManager.WORD)
 
     @staticmethod
-    def evaluate_guess(guess):
+    def evaluate_guess(guess, target=None):
         # Returns greens (correct position) and yellows (wrong position but present)
-        guess = guess.upper().strip()
-        target = GameManager.WORD
-
-        # Align lengths by padding/truncation for safety
-        n = min(len(guess), len(target))
-        greens = 0
-        yellows = 0
-
-        # Track which positions are already green
-        green_positions = set()
-        
-        # First pass: identify greens
-        for i in range(n):
-            if guess[i] == target[i]:
-                greens += 1
-                green_positions.add(i)
-
-        # Count remaining letters in target (excluding greens)
-        target_remaining = {}
-        for i, char in enumerate(target):
-            if i not in green_positions and char.isalpha():
-                target_remaining[char] = target_remaining.get(char, 0) + 1
-
-        # Count remaining letters in guess (excluding greens)
-        guess_remaining = {}
-        for i, char in enumerate(guess):
-            if i not in green_positions and char.isalpha():
-                guess_remaining[char] = guess_remaining.get(char, 0) + 1
-
-        # Calculate yellows: for each letter in guess, count how many can be yellow
-        for char, guess_count in guess_remaining.items():
-            if char in target_remaining:
-                yellows += min(guess_count, target_remaining[char])
-
-        return greens, yellows
+        return _score_guess(guess.upper().strip(), target or GameManager.WORD)
+
+    @staticmethod
+    def evaluate_guesses(guesses, target=None):
+        """Score many guesses at once; each distinct guess is scored only once"""
+        target = target or GameManager.WORD
+        normalized = [g.upper().strip() for g in guesses]
+        distinct = list(dict.fromkeys(normalized))
+        if distinct and _load_numpy() is not None and target.isascii() and all(g.isascii() for g in distinct):
+            scores = dict(zip(distinct, _score_batch(distinct, target)))
+        else:
+            scores = {g: _score_guess(g, target) for g in distinct}
+        return [scores[g] for g in normalized]
 
     @staticmethod
-    def best_team_scores(team_doc):
+    def best_team_scores(team_doc, target=None):
         # Compute best greens/yellows across this team's word guesses
         best_g = 0
         best_y = 0
         for g in team_doc.get('word_guesses', []):
             guess = g.get('guess', '')
-            greens, yellows = GameManager.evaluate_guess(guess)
+            greens, yellows = GameManager.evaluate_guess(guess, target)
             if (greens > best_g) or (greens == best_g and yellows > best_y):
                 best_g, best_y = greens, yellows
         return best_g, best_y
 
     @staticmethod
-    def calculate_team_rankings(teams):
+    def best_scores(teams, target=None):
+        """Best (greens, yellows) per team, scoring all guesses of all teams in one batch"""
+        guesses = [[g.get('guess', '') for g in team.get('word_guesses', [])] for team in teams]
+        flat = GameManager.evaluate_guesses([g for team_guesses in guesses for g in team_guesses], target)
+        results = []
+        offset = 0
+        for team_guesses in guesses:
+            team_scores = flat[offset:offset + len(team_guesses)]
+            offset += len(team_guesses)
+            results.append(max(team_scores, default=(0, 0)))
+        return results
+
+    @staticmethod
+    def calculate_team_rankings(teams, target=None):
         # Sort by greens desc, NOMs desc, yellows desc
-        def ranking_key(team):
-            g, y = GameManager.best_team_scores(team)
-            noms = team.get('NOMs', 0)
-            return (-g, -noms, -y)
+        scores = GameManager.best_scores(teams, target)
+        ranked = sorted(zip(teams, scores), key=lambda pair: (-pair[1][0], -pair[0].get('NOMs', 0), -pair[1][1]))
+        return [team for team, _ in ranked]
+
+
+class TargetProfile(NamedTuple):
+    word: str
+    letter_counts: Dict[str, int]
+
+
+@lru_cache(maxsize=64)
+def target_profile(target: str) -> TargetProfile:
+    """Letter histogram of the target, built once per word"""
+    counts: Dict[str, int] = {}
+    for char in target:
+        if char.isalpha():
+            counts[char] = counts.get(char, 0) + 1
+    return TargetProfile(target, counts)
+
+
+@lru_cache(maxsize=65536)
+def _score_guess(guess: str, target: str) -> Tuple[int, int]:
+    profile = target_profile(target)
+    n = min(len(guess), len(target))
+
+    # Greens, and the target letters they consume
+    greens = 0
+    green_positions = set()
+    target_remaining = dict(profile.letter_counts)
+    for i in range(n):
+        if guess[i] == target[i]:
+            greens += 1
+            green_positions.add(i)
+            if guess[i] in target_remaining:
+                target_remaining[guess[i]] -= 1
+
+    # Yellows: remaining guess letters matched against remaining target letters
+    guess_remaining: Dict[str, int] = {}
+    for i, char in enumerate(guess):
+        if i not in green_positions and char.isalpha():
+            guess_remaining[char] = guess_remaining.get(char, 0) + 1
+    yellows = sum(min(count, target_remaining.get(char, 0)) for char, count in guess_remaining.items())
+    return greens, yellows
+
+
+def _score_batch(guesses: List[str], target: str) -> List[Tuple[int, int]]:
+    """Vectorized scoring of ASCII guesses; same rules as _score_guess"""
+    np = _load_numpy()
+    width = max(max(len(g) for g in guesses), len(target))
+    rows = np.zeros((len(guesses), width), dtype=np.uint8)
+    lengths = np.array([len(g) for g in guesses])
+    for i, guess in enumerate(guesses):
+        rows[i, :len(guess)] = np.frombuffer(guess.encode('ascii'), dtype=np.uint8)
+    target_row = np.zeros(width, dtype=np.uint8)
+    target_row[:len(target)] = np.frombuffer(target.encode('ascii'), dtype=np.uint8)
+
+    columns = np.arange(width)
+    in_guess = columns[None, :] < lengths[:, None]
+    green = (rows == target_row) & in_guess & (columns < len(target))[None, :]
+    alpha = (rows >= ord('A')) & (rows <= ord('Z'))
+    letters = np.where(alpha, rows - ord('A'), 0)
+
+    target_counts = np.zeros(26, dtype=np.int64)
+    for char, count in target_profile(target).letter_counts.items():
+        if 'A' <= char <= 'Z':
+            target_counts[ord(char) - ord('A')] = count
+
+    row_index = np.broadcast_to(np.arange(len(guesses))[:, None], rows.shape)
+    green_counts = np.zeros((len(guesses), 26), dtype=np.int64)
+    green_alpha = green & alpha
+    np.add.at(green_counts, (row_index[green_alpha], letters[green_alpha]), 1)
+    guess_counts = np.zeros((len(guesses), 26), dtype=np.int64)
+    remaining = ~green & alpha & in_guess
+    np.add.at(guess_counts, (row_index[remaining], letters[remaining]), 1)
 
-        return sorted(teams, key=ranking_key)
\ No newline at end of file
+    greens = green.sum(axis=1)
+    yellows = np.minimum(guess_counts, target_counts[None, :] - green_counts).sum(axis=1)
+    return list(zip(greens.tolist(), yellows.tolist()))
\ No newline at end of file
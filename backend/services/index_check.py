@@ -0,0 +1,149 @@
+"""
+Index coverage check: replay the app's query shapes against the database and flag plans
+that scan a whole collection or sort in memory (run with `flask check-indexes`, and by
+tests/test_index_check.py).
+"""
+import os
+from contextlib import contextmanager
+from typing import Any, Dict, List, NamedTuple, Optional
+import structlog
+
+from .slow_query_log import explain_command, query_shape, shape_key, summarize_plan
+
+logger = structlog.get_logger()
+
+CHECK_GAME_ID = '__index_check__'
+
+# Plan stages that mean an index is missing: a full scan, or a sort the index order does not provide
+FAILING_STAGES = ('COLLSCAN', 'SORT')
+
+
+class RecordedQuery(NamedTuple):
+    collection: str
+    operation: str
+    query: Dict[str, Any]
+    details: Dict[str, Any]
+
+    @property
+    def key(self) -> str:
+        sort = self.details.get('sort')
+        return f"{self.collection}.{self.operation} {shape_key(query_shape(self.query))} sort={sort}"
+
+
+class QueryRecorder:
+    """Collects one example query per distinct (collection, operation, shape, sort)"""
+
+    EXPLAINABLE = ('find_one', 'find', 'count', 'update_one', 'update_many', 'delete_one', 'delete_many', 'aggregate')
+
+    def __init__(self):
+        self.queries: Dict[str, RecordedQuery] = {}
+
+    def __call__(self, collection: str, operation: str, query: Dict[str, Any], details: Dict[str, Any]):
+        if operation not in self.EXPLAINABLE:
+            return
+        recorded = RecordedQuery(collection, operation, query, dict(details))
+        self.queries.setdefault(recorded.key, recorded)
+
+    @contextmanager
+    def recording(self):
+        from ..models.base import operation_observers
+        operation_observers.append(self)
+        try:
+            yield self
+        finally:
+            operation_observers.remove(self)
+
+
+class PlanCheck(NamedTuple):
+    key: str
+    plan_summary: Optional[str]
+    indexes: List[str]
+    failures: List[str]
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return not self.failures and self.error is None
+
+
+def check_plan(db, recorded: RecordedQuery) -> PlanCheck:
+    command = explain_command(recorded.collection, recorded.operation, recorded.query, **recorded.details)
+    try:
+        plan = summarize_plan(db.command('explain', command, verbosity='queryPlanner'))
+    except Exception as e:
+        return PlanCheck(recorded.key, None, [], [], error=str(e))
+    failures = [stage for stage in plan['stages'] if stage in FAILING_STAGES]
+    return PlanCheck(recorded.key, plan['plan_summary'], plan['indexes'], failures)
+
+
+def run_workload(app, db_manager, game_id: str = CHECK_GAME_ID):
+    """Drive every endpoint and model query path once for a throwaway game"""
+    from ..models.scope import provision_game
+    from ..models.page import DEFAULT_PAGES
+
+    models = provision_game(db_manager, game_id)
+    client = app.test_client()
+    game = {'X-Game-Id': game_id}
+
+    registered = client.post('/api/teams/register', json={'name': 'index-check', 'password': 'index-check-1'},
+                             headers=game).get_json() or {}
+    if 'access_token' not in registered:
+        raise RuntimeError(f"Could not register the check team: {registered}")
+    client.post('/api/teams/register', json={'name': 'index-check-2', 'password': 'index-check-2'}, headers=game)
+    team = dict(game, Authorization=f"Bearer {registered['access_token']}")
+    admin = dict(team, **{'X-Admin-Token': os.environ['ADMIN_TOKEN']})
+
+    client.post('/api/teams/login', json={'team_code': registered['team_code'], 'password': 'index-check-1'}, headers=game)
+    client.get('/api/teams/profile', headers=team)
+    client.post('/api/game/start', headers=team)
+    client.get('/api/game/status', headers=team)
+    client.post('/api/game/solve', json={'answer': 'wrong answer'}, headers=team)
+    client.post('/api/game/solve', json={'answer': DEFAULT_PAGES[0]['solution']}, headers=team)
+    client.post('/api/game/guess-letter', json={'letter': 'E'}, headers=team)
+    client.post('/api/game/guess-word', json={'guess': 'A' * len(models.game_state.get_word())}, headers=team)
+    client.get('/api/leaderboard', headers=team)
+
+    team_id = models.team.get_by_code(registered['team_code'])['_id']
+    for query in ('', '?search=index', '?status=active', '?status=inactive', '?page=2&per_page=1'):
+        client.get(f'/api/admin/teams{query}', headers=admin)
+    for path in ('/api/admin/stats', f'/api/admin/teams/{team_id}', '/api/admin/pages', '/api/admin/game/state',
+                 '/api/admin/leaderboard', '/api/admin/games'):
+        client.get(path, headers=admin)
+    client.post('/api/admin/letters/reveal/O', headers=admin)
+    client.post('/api/admin/game/page/2', headers=admin)
+    client.post('/api/admin/pages/1/reset', headers=admin)
+    client.post('/api/admin/pages/reset-all', headers=admin)
+    client.post('/api/admin/game/control', json={'action': 'reset'}, headers=admin)
+    client.post('/api/game/reset', headers=team)
+
+    # Model queries no endpoint reaches
+    models.page.get_solved_pages()
+    models.page.get_unsolved_pages()
+    models.page.get_team_solved_pages(registered['team_code'])
+    models.page.get_next_unsolved_page()
+    models.team.get_active_teams()
+    models.team.get_by_name('index-check')
+
+
+def remove_check_game(db_manager, game_id: str = CHECK_GAME_ID):
+    for name in ('teams', 'pages', 'game_state'):
+        db_manager.get_collection(name).delete_many({'game_id': game_id})
+    db_manager.get_collection('counters').delete_one({'_id': f'team_count:{game_id}'})
+
+
+def check_indexes(app, db_manager) -> List[PlanCheck]:
+    """Record the query shapes of a full workload and explain each of them"""
+    recorder = QueryRecorder()
+    # The workload needs admin access; a throwaway token is used when none is configured
+    previous_token = os.environ.get('ADMIN_TOKEN')
+    if not previous_token:
+        os.environ['ADMIN_TOKEN'] = os.urandom(16).hex()
+    try:
+        remove_check_game(db_manager)
+        with recorder.recording():
+            run_workload(app, db_manager)
+    finally:
+        if not previous_token:
+            os.environ.pop('ADMIN_TOKEN', None)
+        remove_check_game(db_manager)
+    return [check_plan(db_manager.db, recorded) for _, recorded in sorted(recorder.queries.items())]
@@ -0,0 +1,189 @@
+"""
+Per-page solve analytics.
+
+Every `/api/game/solve` attempt is counted into a time-bucketed document per
+(game, epoch, page): attempt and outcome counters, a histogram of wrong answers
+and the time from the page becoming current to its first solve. Attempts are
+queued and a background writer folds everything queued for a bucket into one
+upserted `$inc`, so the solve path never waits on it.
+"""
+import queue
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from pymongo import UpdateOne
+import structlog
+
+from .circuit_breaker import circuit_breaker
+
+logger = structlog.get_logger()
+
+PAGE_STATS_COLLECTION = 'page_stats'
+
+OUTCOME_WRONG = 'wrong'
+OUTCOME_CORRECT = 'correct'
+OUTCOME_CONFLICT = 'conflict'  # right answer, but another team solved the page first
+OUTCOMES = (OUTCOME_WRONG, OUTCOME_CORRECT, OUTCOME_CONFLICT)
+
+EPOCH = datetime(1970, 1, 1)
+
+# Wrong answers are histogram keys: bounded in length, without the characters field names cannot hold
+MAX_ANSWER_KEY_LENGTH = 64
+_KEY_ESCAPES = (('.', '．'), ('$', '＄'))
+
+
+def answer_key(answer: str) -> str:
+    key = (answer or '')[:MAX_ANSWER_KEY_LENGTH] or '(empty)'
+    for char, escaped in _KEY_ESCAPES:
+        key = key.replace(char, escaped)
+    return key
+
+
+def answer_from_key(key: str) -> str:
+    for char, escaped in _KEY_ESCAPES:
+        key = key.replace(escaped, char)
+    return key
+
+
+def bucket_start(at: datetime, bucket_seconds: int) -> datetime:
+    seconds = int((at - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=seconds - seconds % bucket_seconds)
+
+
+class PageAnalytics:
+    """Queue-backed recorder of solve attempts"""
+
+    QUEUE_SIZE = 10000
+    MAX_BATCH = 500
+
+    def __init__(self):
+        self.db_manager = None
+        self.bucket_seconds = 300
+        self._queue: queue.Queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+        self._writer: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def configure(self, db_manager, bucket_seconds: int = 300):
+        self.db_manager = db_manager
+        self.bucket_seconds = bucket_seconds
+
+    @property
+    def enabled(self) -> bool:
+        return self.db_manager is not None
+
+    def record_attempt(self, game_id: str, epoch: int, page: int, outcome: str, answer: str = None,
+                       team_code: str = None, page_started_at: datetime = None):
+        """Count a solve attempt; a correct one also records the time since the page became current"""
+        if not self.enabled:
+            return
+        now = datetime.utcnow()
+        key = (game_id, epoch, page, bucket_start(now, self.bucket_seconds))
+        inc = {'attempts': 1, f'outcomes.{outcome}': 1}
+        if outcome == OUTCOME_WRONG:
+            inc[f'wrong_answers.{answer_key(answer)}'] = 1
+        first_solve = None
+        if outcome == OUTCOME_CORRECT:
+            seconds = (now - page_started_at).total_seconds() if page_started_at else None
+            first_solve = {'at': now, 'team_code': team_code, 'seconds': seconds}
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait((key, inc, first_solve))
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_writer(self):
+        if self._writer is not None:
+            return
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name='page-analytics', daemon=True)
+                self._writer.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.MAX_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.warning("Failed to record page analytics", attempts=len(batch), error=str(e))
+
+    def _write(self, batch: List[Tuple]):
+        merged: Dict[Tuple, Dict[str, Any]] = {}
+        for key, inc, first_solve in batch:
+            entry = merged.setdefault(key, {'inc': {}, 'first_solve': None})
+            for field, amount in inc.items():
+                entry['inc'][field] = entry['inc'].get(field, 0) + amount
+            if first_solve and entry['first_solve'] is None:
+                entry['first_solve'] = first_solve
+        operations = []
+        for (game_id, epoch, page, bucket), entry in merged.items():
+            update = {'$inc': entry['inc'], '$set': {'updated_at': datetime.utcnow()}}
+            if entry['first_solve']:
+                # A page is only ever solved once per epoch
+                update['$set']['first_solve'] = entry['first_solve']
+            operations.append(UpdateOne(
+                {'game_id': game_id, 'epoch': epoch, 'page': page, 'bucket': bucket}, update, upsert=True
+            ))
+        collection = self.db_manager.get_collection(PAGE_STATS_COLLECTION)
+        circuit_breaker.call(lambda: collection.bulk_write(operations, ordered=False))
+
+
+page_analytics = PageAnalytics()
+
+
+def ensure_page_stats_indexes(db_manager):
+    collection = db_manager.get_collection(PAGE_STATS_COLLECTION)
+    collection.create_index([('game_id', 1), ('epoch', 1), ('page', 1), ('bucket', 1)], unique=True)
+
+
+def page_difficulty(db_manager, game_id: str, epoch: int, top_answers: int = 10, timeline: bool = False,
+                    read_route: str = None) -> List[Dict[str, Any]]:
+    """Per-page totals of an epoch, folded from its buckets (one small document per page and bucket)"""
+    collection = db_manager.get_collection(PAGE_STATS_COLLECTION, read_route)
+    pages: Dict[int, Dict[str, Any]] = {}
+    docs = circuit_breaker.call(
+        lambda: list(collection.find({'game_id': game_id, 'epoch': epoch}).sort([('page', 1), ('bucket', 1)]))
+    )
+    for doc in docs:
+        page = pages.setdefault(doc['page'], {
+            'page': doc['page'],
+            'attempts': 0,
+            'outcomes': dict.fromkeys(OUTCOMES, 0),
+            'wrong_answers': {},
+            'first_solve': None,
+            'timeline': []
+        })
+        page['attempts'] += doc.get('attempts', 0)
+        for outcome, count in doc.get('outcomes', {}).items():
+            page['outcomes'][outcome] = page['outcomes'].get(outcome, 0) + count
+        for key, count in doc.get('wrong_answers', {}).items():
+            answer = answer_from_key(key)
+            page['wrong_answers'][answer] = page['wrong_answers'].get(answer, 0) + count
+        if doc.get('first_solve') and page['first_solve'] is None:
+            page['first_solve'] = doc['first_solve']
+        if timeline:
+            page['timeline'].append({'bucket': doc['bucket'], 'attempts': doc.get('attempts', 0),
+                                     'outcomes': doc.get('outcomes', {})})
+
+    results = []
+    for page in pages.values():
+        histogram = sorted(page.pop('wrong_answers').items(), key=lambda item: (-item[1], item[0]))
+        first_solve = page.pop('first_solve') or {}
+        page.update({
+            'wrong_rate': round(page['outcomes'][OUTCOME_WRONG] / page['attempts'], 4) if page['attempts'] else 0.0,
+            'distinct_wrong_answers': len(histogram),
+            'top_wrong_answers': [{'answer': answer, 'count': count} for answer, count in histogram[:top_answers]],
+            'time_to_first_solve_seconds': first_solve.get('seconds'),
+            'first_solved_at': first_solve.get('at'),
+            'first_solver_team_code': first_solve.get('team_code')
+        })
+        if not timeline:
+            page.pop('timeline')
+        results.append(page)
+    return results
@@ -0,0 +1,27 @@
+"""
+bcrypt hashing, importable on its own.
+
+Bulk imports (see services/team_import.py) hash in worker processes started as
+`python -m backend.services.password_hashing`: a JSON list of passwords on stdin,
+a JSON list of hashes on stdout. Workers run nothing but this module, so it must
+not import the app, its config or the database.
+"""
+import json
+import signal
+import sys
+import bcrypt
+
+
+def hash_password(password: str) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+
+def main():
+    # Stopping is up to the parent; a Ctrl-C sent to the process group must not kill workers mid-batch
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    passwords = json.load(sys.stdin)
+    json.dump([hash_password(password) for password in passwords], sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
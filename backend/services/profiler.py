@@ -0,0 +1,164 @@
+import _thread
+import cProfile
+import gc
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+from flask import g, request, current_app
+import structlog
+
+from ..utils import cooperative
+from ..utils.helpers import is_admin_request
+
+logger = structlog.get_logger()
+
+
+class ProfilerBusy(Exception):
+    """Raised when a sampling run is requested while another one is in progress"""
+
+
+def _native_primitives():
+    """OS-level thread start, sleep and ident, even when gevent has monkey-patched the stdlib.
+
+    The sampler must run on a real thread: a greenlet could not interrupt a
+    greenlet that is hogging the CPU, which is exactly what we want to see.
+    """
+    try:
+        from gevent import monkey
+        return (monkey.get_original('_thread', 'start_new_thread'), monkey.get_original('time', 'sleep'),
+                monkey.get_original('_thread', 'get_ident'))
+    except ImportError:
+        return _thread.start_new_thread, time.sleep, _thread.get_ident
+
+
+def _live_greenlets() -> List:
+    try:
+        from greenlet import greenlet
+    except ImportError:
+        return []
+    return [obj for obj in gc.get_objects() if isinstance(obj, greenlet) and not obj.dead]
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame, root: str) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(root)
+    return ';'.join(reversed(labels))
+
+
+class SamplingProfiler:
+    """Statistical profiler sampling the stacks of every thread and greenlet.
+
+    Results are collapsed stacks (``root;outer;...;inner count``), the input
+    format of flamegraph.pl and speedscope.
+    """
+
+    # Rescanning the heap for new greenlets is the expensive part of a sample
+    GREENLET_REFRESH_SECONDS = 1.0
+
+    def __init__(self):
+        self._running = threading.Lock()
+
+    def run(self, seconds: float, interval: float, include_idle: bool = True) -> Dict:
+        if not self._running.acquire(blocking=False):
+            raise ProfilerBusy()
+        try:
+            result = {'stacks': Counter(), 'samples': 0, 'done': False, 'error': None}
+            start_thread, native_sleep, native_ident = _native_primitives()
+            start_thread(self._sample, (result, seconds, interval, include_idle, native_sleep, native_ident))
+            # gevent.sleep when this thread runs a hub (time.sleep would stall every greenlet being sampled)
+            deadline = time.monotonic() + seconds + 5
+            while not result['done'] and time.monotonic() < deadline:
+                cooperative.sleep(min(0.1, seconds))
+            if result['error']:
+                raise RuntimeError(result['error'])
+            return {
+                'samples': result['samples'],
+                'seconds': seconds,
+                'interval_ms': round(interval * 1000, 3),
+                'stacks': dict(result['stacks'])
+            }
+        finally:
+            self._running.release()
+
+    def _sample(self, result, seconds, interval, include_idle, native_sleep, native_ident):
+        own_id = native_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        greenlets, refreshed_at = [], 0.0
+        stop_at = time.monotonic() + seconds
+        try:
+            while time.monotonic() < stop_at:
+                now = time.monotonic()
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id != own_id:
+                        result['stacks'][_collapse(frame, names.get(thread_id, f'thread-{thread_id}'))] += 1
+                if include_idle:
+                    if now - refreshed_at >= self.GREENLET_REFRESH_SECONDS:
+                        greenlets, refreshed_at = _live_greenlets(), now
+                    for glet in greenlets:
+                        # gr_frame is None for running greenlets, already covered above
+                        frame = getattr(glet, 'gr_frame', None)
+                        if frame is not None:
+                            result['stacks'][_collapse(frame, 'greenlet')] += 1
+                result['samples'] += 1
+                native_sleep(interval)
+        except Exception as e:
+            result['error'] = str(e)
+        finally:
+            result['done'] = True
+
+
+sampling_profiler = SamplingProfiler()
+
+REQUEST_PROFILE_SORTS = {'cumulative', 'tottime', 'calls', 'ncalls', 'time'}
+
+
+def format_collapsed(stacks: Dict[str, int]) -> str:
+    return ''.join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+
+
+def init_request_profiling(app):
+    """Per-request cProfile mode.
+
+    A request carrying ``X-Profile: cprofile`` and a valid ``X-Admin-Token`` is
+    run under cProfile and answered with the pstats report instead of its body;
+    the original status code is kept in ``X-Profiled-Status``.
+    """
+
+    def wants_profile() -> bool:
+        return request.headers.get('X-Profile') == 'cprofile' and is_admin_request()
+
+    @app.before_request
+    def start_request_profile():
+        if current_app.config.get('PROFILING_ENABLED', True) and wants_profile():
+            g.request_profile = cProfile.Profile()
+            g.request_profile.enable()
+
+    @app.after_request
+    def finish_request_profile(response):
+        profile: Optional[cProfile.Profile] = g.pop('request_profile', None)
+        if profile is None:
+            return response
+        profile.disable()
+        out = io.StringIO()
+        stats = pstats.Stats(profile, stream=out)
+        sort = request.headers.get('X-Profile-Sort', 'cumulative')
+        stats.sort_stats(sort if sort in REQUEST_PROFILE_SORTS else 'cumulative').print_stats(
+            current_app.config.get('PROFILER_REQUEST_TOP', 50)
+        )
+        logger.info("Request profiled", path=request.path, status=response.status_code)
+        profiled = app.response_class(out.getvalue(), mimetype='text/plain')
+        profiled.headers['X-Profiled-Status'] = str(response.status_code)
+        return profiled
@@ -0,0 +1,218 @@
+import queue
+import random
+import re
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import structlog
+
+logger = structlog.get_logger()
+
+SLOW_QUERIES_COLLECTION = 'slow_queries'
+
+
+def query_shape(value: Any) -> Any:
+    """Query with every literal replaced by a type placeholder.
+
+    Keys and operators are kept (sorted), so queries that differ only in their
+    values share a shape: ``{'code': 'AB12'}`` and ``{'code': 'ZZ99'}`` both
+    become ``{'code': '<str>'}``.
+    """
+    if isinstance(value, dict):
+        return {key: query_shape(value[key]) for key in sorted(value)}
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return []
+        # Pipelines keep every stage; value lists ($in, $nin) collapse to one element
+        if all(isinstance(item, dict) for item in value):
+            return [query_shape(item) for item in value]
+        return [query_shape(value[0])]
+    if isinstance(value, re.Pattern):
+        return '<regex>'
+    return f'<{type(value).__name__}>'
+
+
+def shape_key(shape: Any) -> str:
+    return repr(shape)
+
+
+def summarize_plan(explain: Dict[str, Any]) -> Dict[str, Any]:
+    """Stages and indexes of the winning plan of an `explain` result.
+
+    Only plain strings are kept: raw plans contain `$`-prefixed keys that
+    cannot be stored as document fields.
+    """
+    planner = explain.get('queryPlanner')
+    if planner is None and explain.get('stages'):
+        # Aggregations report the plan of their initial cursor stage
+        planner = explain['stages'][0].get('$cursor', {}).get('queryPlanner', {})
+    planner = planner or {}
+    stages, indexes = [], []
+    pending = [planner.get('winningPlan', {})]
+    while pending:
+        node = pending.pop()
+        if 'queryPlan' in node:
+            pending.append(node['queryPlan'])
+            continue
+        if 'stage' in node:
+            stages.append(node['stage'])
+        if 'indexName' in node:
+            indexes.append(node['indexName'])
+        if 'inputStage' in node:
+            pending.append(node['inputStage'])
+        pending.extend(node.get('inputStages', []))
+    return {
+        'namespace': planner.get('namespace'),
+        'stages': stages,
+        'indexes': indexes,
+        'plan_summary': ' <- '.join(stages) or None
+    }
+
+
+def explain_command(collection: str, operation: str, query: Dict[str, Any], sort=None, update=None,
+                    pipeline=None) -> Optional[Dict[str, Any]]:
+    """The command `explain` needs to plan `operation` again"""
+    if operation in ('find_one', 'find'):
+        command = {'find': collection, 'filter': query}
+        if sort:
+            command['sort'] = dict(sort)
+        if operation == 'find_one':
+            command['limit'] = 1
+        return command
+    if operation == 'count':
+        return {'count': collection, 'query': query}
+    if operation in ('update_one', 'update_many', 'find_one_and_update'):
+        return {'update': collection, 'updates': [{'q': query, 'u': update or {}, 'multi': operation == 'update_many'}]}
+    if operation in ('delete_one', 'delete_many'):
+        return {'delete': collection, 'deletes': [{'q': query, 'limit': 1 if operation == 'delete_one' else 0}]}
+    if operation == 'aggregate':
+        return {'aggregate': collection, 'pipeline': pipeline or [], 'cursor': {}}
+    return None
+
+
+class SlowQueryLog:
+    """Records operations slower than a threshold into a capped collection.
+
+    Recording happens on a background thread so a slow query does not get
+    slower by being logged; when the queue is full, records are dropped.
+    """
+
+    QUEUE_SIZE = 1000
+
+    def __init__(self):
+        self.db_manager = None
+        self.threshold_ms: Optional[float] = None
+        self.explain_sample_rate = 0.0
+        self._queue: queue.Queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+        self._writer: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def configure(self, db_manager, threshold_ms: Optional[float], explain_sample_rate: float = 0.0):
+        """Enable recording; a threshold of None disables it"""
+        self.db_manager = db_manager
+        self.threshold_ms = threshold_ms
+        self.explain_sample_rate = explain_sample_rate
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_ms is not None and self.db_manager is not None
+
+    def observe(self, collection: str, operation: str, query: Dict[str, Any], duration_ms: float, **details):
+        if not self.enabled or duration_ms < self.threshold_ms or collection == SLOW_QUERIES_COLLECTION:
+            return
+        record = {
+            'collection': collection,
+            'operation': operation,
+            'query': query,
+            'duration_ms': round(duration_ms, 3),
+            'at': datetime.utcnow(),
+            'explain': random.random() < self.explain_sample_rate,
+            'details': details
+        }
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_writer(self):
+        if self._writer is not None:
+            return
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name='slow-query-log', daemon=True)
+                self._writer.start()
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            try:
+                self._write(record)
+            except Exception as e:
+                logger.warning("Failed to record slow query", collection=record['collection'], error=str(e))
+
+    def _write(self, record: Dict[str, Any]):
+        details = record.pop('details')
+        query = record.pop('query')
+        shape = query_shape(query)
+        if details.get('pipeline'):
+            shape = query_shape(details['pipeline'])
+        record['game_id'] = query.get('game_id') if isinstance(query, dict) else None
+        # Shapes are stored as strings: they contain `$` operators that are not valid field names
+        record['shape_key'] = shape_key(shape)
+        if details.get('sort'):
+            record['sort'] = shape_key(list(details['sort']))
+        if record.pop('explain'):
+            record.update(self._explain(record['collection'], record['operation'], query, details))
+        logger.warning("Slow query", collection=record['collection'], operation=record['operation'],
+                       duration_ms=record['duration_ms'], shape=record['shape_key'])
+        self.db_manager.get_collection(SLOW_QUERIES_COLLECTION).insert_one(record)
+
+    def _explain(self, collection: str, operation: str, query: Dict[str, Any], details: Dict[str, Any]):
+        command = explain_command(collection, operation, query, **details)
+        if command is None:
+            return {}
+        try:
+            return summarize_plan(self.db_manager.db.command('explain', command, verbosity='queryPlanner'))
+        except Exception as e:
+            return {'explain_error': str(e)}
+
+
+slow_query_log = SlowQueryLog()
+
+
+def ensure_slow_query_collection(db_manager, size_bytes: int, max_documents: int):
+    """Create the capped `slow_queries` collection unless it exists"""
+    db = db_manager.db
+    if SLOW_QUERIES_COLLECTION in db.list_collection_names():
+        return
+    db.create_collection(SLOW_QUERIES_COLLECTION, capped=True, size=size_bytes, max=max_documents)
+    db[SLOW_QUERIES_COLLECTION].create_index([('shape_key', 1), ('at', -1)])
+    logger.info("Slow query collection created", size_bytes=size_bytes, max_documents=max_documents)
+
+
+def recent_slow_queries(db_manager, query: Dict[str, Any], limit: int, read_route: str = None) -> List[Dict[str, Any]]:
+    collection = db_manager.get_collection(SLOW_QUERIES_COLLECTION, read_route)
+    return list(collection.find(query).sort('$natural', -1).limit(limit))
+
+
+def slow_query_shapes(db_manager, query: Dict[str, Any], limit: int, read_route: str = None) -> List[Dict[str, Any]]:
+    """Slow operations grouped by collection, operation and shape, worst total time first"""
+    collection = db_manager.get_collection(SLOW_QUERIES_COLLECTION, read_route)
+    return list(collection.aggregate([
+        {'$match': query},
+        {'$sort': {'at': -1}},
+        {'$group': {
+            '_id': {'collection': '$collection', 'operation': '$operation', 'shape_key': '$shape_key'},
+            'count': {'$sum': 1},
+            'avg_ms': {'$avg': '$duration_ms'},
+            'max_ms': {'$max': '$duration_ms'},
+            'total_ms': {'$sum': '$duration_ms'},
+            'last_seen': {'$first': '$at'},
+            'plan_summary': {'$max': '$plan_summary'},
+            'indexes': {'$max': '$indexes'}
+        }},
+        {'$sort': {'total_ms': -1}},
+        {'$limit': limit}
+    ]))
@@ -0,0 +1,100 @@
+"""
+Opt-in MessagePack encoding of socket payloads.
+
+A client asks for it at connect (`auth={'encoding': 'msgpack'}` or
+`?encoding=msgpack`). Its broadcast and status payloads are then sent as one
+binary Socket.IO attachment, MessagePack with the long field names replaced by
+the short keys of `KEY_MAP` (handed to the client by the `connected` event),
+whenever that is smaller than the JSON text; tiny events stay JSON. Without the
+optional `msgpack` package every client gets JSON.
+"""
+from typing import Any, Dict, Optional
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+ENCODING_JSON = 'json'
+ENCODING_MSGPACK = 'msgpack'
+
+# Long field name -> compact key; stable, clients expand with the map sent on connect
+KEY_MAP = {
+    'current_page': 'cp',
+    'game_status': 'gs',
+    'revealed_letters': 'rl',
+    'page_info': 'pi',
+    'word': 'w',
+    'number': 'n',
+    'letter': 'l',
+    'puzzle': 'pz',
+    'rankings': 'r',
+    'name': 'nm',
+    'code': 'c',
+    'greens': 'g',
+    'yellows': 'y',
+    'NOMs': 'N',
+    'word_guesses_count': 'wc',
+    'guesses_left': 'gl',
+    'page': 'p',
+    'team_code': 'tc',
+    'positions': 'ps',
+    'correct': 'ok'
+}
+
+# Values whose keys are data (letters), not field names
+OPAQUE_FIELDS = ('revealed_letters',)
+
+# A binary event carries a placeholder where the payload would be, so tiny payloads are smaller as JSON
+BINARY_OVERHEAD = len('1-{"_placeholder":true,"num":0}')
+
+
+def available() -> bool:
+    return msgpack is not None
+
+
+def negotiate(requested: Optional[str]) -> str:
+    if (requested or '').lower() == ENCODING_MSGPACK and available():
+        return ENCODING_MSGPACK
+    return ENCODING_JSON
+
+
+def compact(value: Any) -> Any:
+    """Payload with field names replaced by their compact keys"""
+    if isinstance(value, dict):
+        return {KEY_MAP.get(key, key): value[key] if key in OPAQUE_FIELDS else compact(value[key]) for key in value}
+    if isinstance(value, list):
+        return [compact(item) for item in value]
+    return value
+
+
+def expand(value: Any, key_map: Dict[str, str] = None) -> Any:
+    """Inverse of `compact` (what clients do with the map from `connected`)"""
+    reverse = {short: long for long, short in (key_map or KEY_MAP).items()}
+    def walk(item):
+        if isinstance(item, dict):
+            return {reverse.get(key, key): item[key] if reverse.get(key) in OPAQUE_FIELDS else walk(item[key])
+                    for key in item}
+        if isinstance(item, list):
+            return [walk(element) for element in item]
+        return item
+    return walk(value)
+
+
+def _default(value: Any) -> Any:
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def pack(payload: Any) -> bytes:
+    return msgpack.packb(compact(payload), default=_default, use_bin_type=True)
+
+
+def unpack(data: bytes) -> Any:
+    return expand(msgpack.unpackb(data, raw=False))
+
+
+def room_for(room: str, encoding: str) -> str:
+    """Room carrying a given encoding: broadcasts are encoded once per encoding, not per client"""
+    return room if encoding == ENCODING_JSON else f'{room}:{encoding}'
@@ -0,0 +1,279 @@
+"""
+Bulk team provisioning from a CSV or JSON roster.
+
+The cost of creating teams one by one is bcrypt plus one round trip per check.
+An import instead:
+
+1. validates every row and rejects duplicates within the roster,
+2. finds every taken name and code (requested and freshly generated) in one query,
+3. reserves as many slots under the team cap as there are valid rows in one
+   atomic counter update,
+4. hashes the passwords of the admitted rows across worker processes (bcrypt
+   would otherwise hold the worker, and under gevent every greenlet, for
+   ~250 ms per team),
+5. inserts all teams with one unordered `insert_many`; rows that lose a race
+   on a unique index are reported, and generated codes that collided are
+   retried once with new codes.
+
+Unused reserved slots are handed back. The result is one report entry per row.
+"""
+import csv
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+from datetime import datetime
+from typing import Any, Dict, List, Sequence
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+import copy
+import structlog
+
+from . import password_hashing
+from .auth_service import AuthService
+from .circuit_breaker import circuit_breaker
+from ..models.team import TEAM_PROGRESS_DEFAULTS
+from ..utils import cooperative
+
+logger = structlog.get_logger()
+
+STATUS_CREATED = 'created'
+STATUS_FAILED = 'failed'
+
+FIELDS = ('name', 'password', 'code')
+MIN_NAME_LENGTH, MAX_NAME_LENGTH = 2, 50
+CODE_PATTERN = re.compile(r'^[A-Z0-9]{4,12}$')
+# Generated codes drawn per row; spares replace ones that turn out to be taken
+CODE_CANDIDATES_PER_ROW = 2
+# Directory holding the `backend` package, for the workers' import path
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class RosterError(ValueError):
+    """The roster as a whole cannot be read"""
+
+
+def parse_roster(data: bytes, fmt: str) -> List[Dict[str, str]]:
+    """Rows of a `csv` (header with name,password[,code]) or `json` (list, or {"teams": [...]}) roster"""
+    try:
+        text = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise RosterError('Roster must be UTF-8 encoded')
+    if fmt == 'json':
+        try:
+            parsed = json.loads(text)
+        except ValueError as e:
+            raise RosterError(f'Invalid JSON roster: {e}')
+        rows = parsed.get('teams') if isinstance(parsed, dict) else parsed
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise RosterError('JSON roster must be a list of teams or {"teams": [...]}')
+    elif fmt == 'csv':
+        reader = csv.DictReader(io.StringIO(text))
+        headers = [(header or '').strip().lower() for header in reader.fieldnames or []]
+        if 'name' not in headers or 'password' not in headers:
+            raise RosterError('CSV roster needs a header row with name and password columns')
+        reader.fieldnames = headers
+        rows = [row for row in reader if any((value or '').strip() for value in row.values() if isinstance(value, str))]
+    else:
+        raise RosterError(f'Unsupported roster format: {fmt}')
+    return [{field: str(row.get(field) or '') for field in FIELDS} for row in rows]
+
+
+def _start_worker(popen) -> subprocess.Popen:
+    """A process running only `password_hashing` (never the parent's `__main__`, unlike multiprocessing spawn)"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [PACKAGE_ROOT, os.environ.get('PYTHONPATH')])))
+    return popen([sys.executable, '-m', 'backend.services.password_hashing'], stdin=subprocess.PIPE,
+                 stdout=subprocess.PIPE, env=env)
+
+
+def _hash_in_workers(chunks: List[Sequence[str]]) -> List[str]:
+    # gevent's subprocess waits without blocking the hub when the caller runs in a greenlet
+    if cooperative.in_gevent():
+        from gevent import subprocess as gevent_subprocess
+        popen = gevent_subprocess.Popen
+    else:
+        popen = subprocess.Popen
+    processes = []
+    try:
+        # Every worker gets its input before any output is read, so they all hash at once
+        for chunk in chunks:
+            process = _start_worker(popen)
+            processes.append(process)
+            process.stdin.write(json.dumps(list(chunk)).encode('utf-8'))
+            process.stdin.close()
+        hashes = []
+        for process, chunk in zip(processes, chunks):
+            output = process.stdout.read()
+            if process.wait() != 0:
+                raise OSError(f'hashing worker exited with status {process.returncode}')
+            chunk_hashes = json.loads(output)
+            if len(chunk_hashes) != len(chunk):
+                raise OSError('hashing worker returned an incomplete batch')
+            hashes.extend(chunk_hashes)
+        return hashes
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+
+
+def hash_passwords(passwords: Sequence[str], workers: int) -> List[str]:
+    """bcrypt hashes of `passwords`, computed by `workers` processes (inline when workers < 1 or they fail)"""
+    if workers >= 1 and len(passwords) > 1:
+        size = -(-len(passwords) // min(workers, len(passwords)))
+        try:
+            return _hash_in_workers([passwords[start:start + size] for start in range(0, len(passwords), size)])
+        except (OSError, ValueError) as e:
+            logger.warning("Password hashing workers unavailable, hashing inline", error=str(e))
+    return [password_hashing.hash_password(password) for password in passwords]
+
+
+def _validate(rows: List[Dict[str, str]], min_password_length: int) -> List[Dict[str, Any]]:
+    """One report entry per row; valid rows get status None"""
+    entries = []
+    names, codes = set(), set()
+    for number, row in enumerate(rows, start=1):
+        name = row['name'].strip()
+        code = row['code'].strip().upper()
+        entry = {'row': number, 'name': name, 'code': code or None, 'status': None, 'password': row['password']}
+        if not MIN_NAME_LENGTH <= len(name) <= MAX_NAME_LENGTH:
+            entry['error'] = f'Team name must be {MIN_NAME_LENGTH}-{MAX_NAME_LENGTH} characters'
+        elif len(row['password']) < min_password_length:
+            entry['error'] = f'Password must be at least {min_password_length} characters'
+        elif code and not CODE_PATTERN.match(code):
+            entry['error'] = 'Code must be 4-12 letters or digits'
+        elif name in names:
+            entry['error'] = 'Name appears earlier in the roster'
+        elif code and code in codes:
+            entry['error'] = 'Code appears earlier in the roster'
+        if 'error' in entry:
+            entry['status'] = STATUS_FAILED
+        else:
+            names.add(name)
+            if code:
+                codes.add(code)
+        entries.append(entry)
+    return entries
+
+
+def _reserve_slots(team_model, wanted: int, max_teams: int) -> int:
+    """Atomically take up to `wanted` slots under the team cap; returns how many were granted"""
+    counters = team_model.db_manager.get_collection('counters')
+    before = circuit_breaker.call(lambda: counters.find_one_and_update(
+        {'_id': f'team_count:{team_model.game_id}'},
+        [{'$set': {'count': {'$max': [
+            {'$ifNull': ['$count', 0]},
+            {'$min': [max_teams, {'$add': [{'$ifNull': ['$count', 0]}, wanted]}]}
+        ]}}}],
+        upsert=True,
+        return_document=ReturnDocument.BEFORE
+    ))
+    taken = (before or {}).get('count', 0)
+    return max(0, min(max_teams, taken + wanted) - taken)
+
+
+def _release_slots(team_model, count: int):
+    if count > 0:
+        counters = team_model.db_manager.get_collection('counters')
+        circuit_breaker.call(lambda: counters.update_one(
+            {'_id': f'team_count:{team_model.game_id}'}, {'$inc': {'count': -count}}
+        ))
+
+
+def _generated_codes(count: int, taken: set) -> List[str]:
+    codes = []
+    while len(codes) < count:
+        code = AuthService.generate_team_code()
+        if code not in taken:
+            taken.add(code)
+            codes.append(code)
+    return codes
+
+
+def _insert(team_model, entries: List[Dict[str, Any]], documents: List[Dict[str, Any]]) -> List[int]:
+    """Insert documents unordered; fills in created entries and returns the positions that failed"""
+    failed = {}
+    try:
+        team_model.bulk_create(documents, ordered=False)
+    except BulkWriteError as e:
+        failed = {error['index']: error for error in e.details.get('writeErrors', [])}
+    for position, (entry, document) in enumerate(zip(entries, documents)):
+        error = failed.get(position)
+        if error is None:
+            entry.pop('error', None)
+            entry.update(status=STATUS_CREATED, team_id=str(document['_id']), code=document['code'])
+        else:
+            field = next(iter(error.get('keyValue') or {'': None}))
+            if field == 'game_id':
+                field = next((key for key in error['keyValue'] if key != 'game_id'), field)
+            entry.update(status=STATUS_FAILED, error=f'{field.capitalize() or "Team"} already exists'
+                         if error.get('code') == 11000 else error.get('errmsg', 'Insert failed'), conflict=field)
+    return sorted(failed)
+
+
+def import_teams(team_model, rows: List[Dict[str, str]], max_teams: int, min_password_length: int,
+                 hash_workers: int) -> Dict[str, Any]:
+    entries = _validate(rows, min_password_length)
+    valid = [entry for entry in entries if entry['status'] is None]
+
+    # One query for every name and code this import could collide with
+    candidates = _generated_codes(CODE_CANDIDATES_PER_ROW * sum(1 for entry in valid if not entry['code']), set())
+    requested = [entry['code'] for entry in valid if entry['code']]
+    taken_names, taken_codes = set(), set()
+    if valid:
+        for team in team_model.find_many({'$or': [{'name': {'$in': [entry['name'] for entry in valid]}},
+                                                  {'code': {'$in': requested + candidates}}]}):
+            taken_names.add(team.get('name'))
+            taken_codes.add(team.get('code'))
+    admitted = []
+    for entry in valid:
+        if entry['name'] in taken_names:
+            entry.update(status=STATUS_FAILED, error='Name already exists')
+        elif entry['code'] in taken_codes:
+            entry.update(status=STATUS_FAILED, error='Code already exists')
+        else:
+            admitted.append(entry)
+
+    granted = _reserve_slots(team_model, len(admitted), max_teams) if admitted else 0
+    for entry in admitted[granted:]:
+        entry.update(status=STATUS_FAILED, error=f'Maximum number of teams ({max_teams}) reached')
+    admitted = admitted[:granted]
+
+    spare = iter(code for code in candidates if code not in taken_codes and code not in set(requested))
+    hashes = hash_passwords([entry['password'] for entry in admitted], hash_workers)
+    documents = []
+    for entry, password_hash in zip(admitted, hashes):
+        entry['generated_code'] = not entry['code']
+        documents.append({
+            'name': entry['name'],
+            'code': entry['code'] or next(spare, None) or _generated_codes(1, taken_codes | set(requested))[0],
+            'password_hash': password_hash,
+            **copy.deepcopy(TEAM_PROGRESS_DEFAULTS),
+            'last_activity': datetime.utcnow()
+        })
+
+    failed = _insert(team_model, admitted, documents) if documents else []
+    # A generated code taken by a concurrent registration gets one more try with a new code
+    retry = [position for position in failed
+             if admitted[position]['generated_code'] and admitted[position].get('conflict') == 'code']
+    if retry:
+        fresh = _generated_codes(len(retry), taken_codes | {document['code'] for document in documents})
+        retry_documents = []
+        for position, code in zip(retry, fresh):
+            document = {key: value for key, value in documents[position].items() if key != '_id'}
+            document['code'] = code
+            retry_documents.append(document)
+        _insert(team_model, [admitted[position] for position in retry], retry_documents)
+
+    created = sum(1 for entry in entries if entry['status'] == STATUS_CREATED)
+    _release_slots(team_model, granted - created)
+    for entry in entries:
+        for private in ('password', 'generated_code', 'conflict'):
+            entry.pop(private, None)
+    logger.info("Teams imported", game_id=team_model.game_id, rows=len(entries), created=created,
+                failed=len(entries) - created)
+    return {'created': created, 'failed': len(entries) - created, 'rows': entries}
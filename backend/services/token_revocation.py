@@ -0,0 +1,263 @@
+"""
+JWT revocation.
+
+Revocations are records in the TTL-indexed `revoked_tokens` collection, one per
+revoked subject (team): every token of that subject issued up to the
+revocation is rejected, until the longest token lifetime has passed and the
+record expires. Each worker keeps a Bloom filter of revoked keys, so checking
+a token that was never revoked (nearly every request) costs a few hashes and no
+database round trip. A hit, which may be a false positive, is confirmed against
+the collection and remembered in a small LRU.
+
+A background thread keeps the filter current: it follows a change stream when
+MongoDB offers one (replica sets) and otherwise polls for new records every
+`refresh_seconds`. The filter is rebuilt from the collection every
+`reload_seconds`, dropping expired records. Until the first load completes,
+every check goes to the database.
+"""
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+import structlog
+
+from .circuit_breaker import circuit_breaker
+
+logger = structlog.get_logger()
+
+REVOCATION_COLLECTION = 'revoked_tokens'
+# Changes arriving out of timestamp order from other workers are caught by re-reading this far back
+POLL_OVERLAP = timedelta(seconds=5)
+
+
+def subject_key(subject: Any) -> str:
+    return f'sub:{subject}'
+
+
+class BloomFilter:
+    """Bit array with k hash positions per key; no false negatives, `error_rate` false positives at capacity"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = max(1, capacity)
+        self.size = max(8, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationStore:
+    def __init__(self):
+        self.db_manager = None
+        self.enabled = False
+        self.capacity = 10000
+        self.error_rate = 0.001
+        self.refresh_seconds = 2.0
+        self.reload_seconds = 600.0
+        self.retention = timedelta(days=30)
+        self.bloom = BloomFilter(self.capacity, self.error_rate)
+        self.ready = False
+        # Confirmed lookups: key -> `not_before` of its record, or None when not revoked
+        self._confirmed: 'OrderedDict[str, Optional[float]]' = OrderedDict()
+        self._confirmed_size = 1024
+        self._lock = threading.Lock()
+        self._refresher: Optional[threading.Thread] = None
+        self._since: Optional[datetime] = None
+        self._reloaded_at = 0.0
+        # Keys learned while a reload builds its filter, added to that filter once it is swapped in
+        self._learned_during_reload: Optional[list] = None
+        self._stats = {'checks': 0, 'filtered': 0, 'lookups': 0, 'revoked': 0}
+
+    def configure(self, db_manager, capacity: int, error_rate: float, refresh_seconds: float,
+                  reload_seconds: float, retention: timedelta):
+        self.db_manager = db_manager
+        self.enabled = True
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_seconds = refresh_seconds
+        self.reload_seconds = reload_seconds
+        self.retention = retention
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.ready = False
+
+    @property
+    def collection(self):
+        return self.db_manager.get_collection(REVOCATION_COLLECTION)
+
+    def revoke_subject(self, subject: Any, reason: str):
+        """Reject every token of `subject` issued up to now"""
+        key = subject_key(subject)
+        now = datetime.utcnow()
+        circuit_breaker.call(lambda: self.collection.update_one({'_id': key}, {'$set': {
+            'subject': str(subject),
+            'reason': reason,
+            'not_before': time.time(),
+            'revoked_at': now,
+            'expires_at': now + self.retention
+        }}, upsert=True))
+        self._learn(key)
+        logger.info("Tokens revoked", subject=str(subject), reason=reason)
+
+    def is_revoked(self, payload: Dict[str, Any]) -> bool:
+        if not self.enabled:
+            return False
+        if self._refresher is None:
+            self._start()
+        self._stats['checks'] += 1
+        key = subject_key(payload.get('sub'))
+        if self.ready and key not in self.bloom:
+            self._stats['filtered'] += 1
+            return False
+        with self._lock:
+            cached = self._confirmed.get(key, False)
+            if cached is not False:
+                self._confirmed.move_to_end(key)
+        if cached is False:
+            cached = self._lookup(key)
+        revoked = cached is not None and payload.get('iat', 0) <= cached
+        self._stats['revoked'] += revoked
+        return revoked
+
+    def _lookup(self, key: str) -> Optional[float]:
+        self._stats['lookups'] += 1
+        try:
+            record = circuit_breaker.call(lambda: self.collection.find_one(
+                {'_id': key, 'expires_at': {'$gt': datetime.utcnow()}}, {'not_before': 1}
+            ))
+        except Exception as e:
+            # Only keys the filter flagged get here: refuse them rather than let a revoked token through
+            logger.error("Token revocation lookup failed", error=str(e))
+            return math.inf
+        not_before = record['not_before'] if record else None
+        if not self.ready and not_before is None:
+            # Nothing would tell this worker about a later revocation of the key yet
+            return None
+        with self._lock:
+            self._confirmed[key] = not_before
+            while len(self._confirmed) > self._confirmed_size:
+                self._confirmed.popitem(last=False)
+        return not_before
+
+    def _learn(self, key: str):
+        """A revocation record for `key` was written or changed"""
+        with self._lock:
+            self.bloom.add(key)
+            self._confirmed.pop(key, None)
+            if self._learned_during_reload is not None:
+                self._learned_during_reload.append(key)
+
+    def _start(self):
+        with self._lock:
+            if self._refresher is not None:
+                return
+            self._refresher = threading.Thread(target=self._run, name='token-revocation-refresh', daemon=True)
+        self._refresher.start()
+
+    def _reload(self):
+        """Rebuild the filter from the live records, sized for twice their number"""
+        now = datetime.utcnow()
+        with self._lock:
+            self._learned_during_reload = []
+        try:
+            keys = circuit_breaker.call(
+                lambda: [record['_id'] for record in self.collection.find({'expires_at': {'$gt': now}}, {'_id': 1})]
+            )
+            bloom = BloomFilter(max(self.capacity, 2 * len(keys)), self.error_rate)
+            for key in keys:
+                bloom.add(key)
+            with self._lock:
+                for key in self._learned_during_reload:
+                    bloom.add(key)
+                self.bloom = bloom
+                self._confirmed.clear()
+        finally:
+            with self._lock:
+                self._learned_during_reload = None
+        self._since = now
+        self._reloaded_at = time.monotonic()
+        self.ready = True
+        logger.info("Token revocations loaded", revoked=len(keys), bits=bloom.size, hashes=bloom.hashes)
+
+    def _poll(self):
+        since, polled_at = self._since - POLL_OVERLAP, datetime.utcnow()
+        records = circuit_breaker.call(lambda: list(self.collection.find({'revoked_at': {'$gte': since}}, {'_id': 1})))
+        # Only moved on once the poll succeeded, so a refused poll is repeated rather than skipped
+        self._since = polled_at
+        for record in records:
+            self._learn(record['_id'])
+
+    def _reload_due(self) -> bool:
+        return time.monotonic() - self._reloaded_at >= self.reload_seconds
+
+    def _follow_changes(self):
+        pipeline = [{'$match': {'operationType': {'$in': ['insert', 'update', 'replace']}}}]
+        with self.collection.watch(pipeline, max_await_time_ms=int(self.refresh_seconds * 1000)) as stream:
+            # Loaded after the stream opened, so no revocation falls between the two
+            self._reload()
+            while True:
+                change = stream.try_next()
+                if change is not None:
+                    self._learn(change['documentKey']['_id'])
+                elif self._reload_due():
+                    self._reload()
+
+    def _run(self):
+        watching = True
+        while True:
+            try:
+                if watching:
+                    try:
+                        self._follow_changes()
+                    except Exception as e:
+                        # Standalone servers and the memory engine have no change streams
+                        watching = False
+                        logger.info("Token revocations polled instead of watched", reason=str(e))
+                if not self.ready or self._reload_due():
+                    self._reload()
+                else:
+                    self._poll()
+            except Exception as e:
+                logger.error("Token revocation refresh failed", error=str(e))
+            time.sleep(self.refresh_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self._stats, ready=self.ready, filter_adds=self.bloom.count, filter_bits=self.bloom.size)
+
+
+revocation_store = RevocationStore()
+
+
+def ensure_revocation_indexes(db_manager):
+    collection = db_manager.get_collection(REVOCATION_COLLECTION)
+    collection.create_index('expires_at', expireAfterSeconds=0)
+    collection.create_index('revoked_at')
+
+
+def init_token_revocation(app, jwt, db_manager):
+    """Check the JWT of every protected request against the revocation store"""
+    cfg = app.config
+    # Records must outlive every token they reject
+    retention = max(cfg['JWT_ACCESS_TOKEN_EXPIRES'], cfg['JWT_REFRESH_TOKEN_EXPIRES'])
+    revocation_store.configure(db_manager, cfg['JWT_REVOCATION_FILTER_CAPACITY'],
+                               cfg['JWT_REVOCATION_FILTER_ERROR_RATE'], cfg['JWT_REVOCATION_REFRESH_SECONDS'],
+                               cfg['JWT_REVOCATION_RELOAD_SECONDS'], retention)
+    checked_types = cfg.get('JWT_BLACKLIST_TOKEN_CHECKS', ['access', 'refresh'])
+
+    @jwt.token_in_blocklist_loader
+    def token_revoked(jwt_header, jwt_payload) -> bool:
+        return jwt_payload.get('type') in checked_types and revocation_store.is_revoked(jwt_payload)
@@ -0,0 +1,5 @@
+"""Storage engines that can stand in for MongoDB (selected by STORAGE_BACKEND)"""
+from .memory import MemoryClient
+from .persistence import Journal
+
+__all__ = ['MemoryClient', 'Journal']
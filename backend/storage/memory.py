@@ -0,0 +1,748 @@
+"""
+Embedded in-memory storage engine.
+
+`MemoryClient` stands in for a `pymongo.MongoClient`: databases, collections
+and cursors expose the slice of the pymongo API the backend calls, with the
+same result and error types, so models run unchanged. Documents live in
+insertion-ordered dicts keyed by `_id`; every index is a hash map from its key
+to the documents holding it, which enforces unique indexes and serves filters
+that pin all of an index's fields.
+
+Every write is reduced to a record of whole documents put or ids deleted,
+checked against unique indexes, handed to the journal and only then applied.
+Replaying the journal therefore applies exactly what ran, and replaying a
+record twice is harmless. One re-entrant lock per client serializes writes;
+there are no multi-document transactions, as with a standalone mongod.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import bson
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError, OperationFailure
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+import structlog
+
+from .planner import explain
+from .query import (MISSING, aggregate, apply_update, copy_document, equality_fields, get_path, matches,
+                    normalize_sort, project, set_path, sort_documents, _freeze)
+
+logger = structlog.get_logger()
+
+DUPLICATE_KEY = 11000
+# How often (seconds) a collection with a TTL index is swept for expired documents
+TTL_SWEEP_INTERVAL = 1.0
+
+
+def _id_key(value: Any):
+    return _freeze(value)
+
+
+def _normalize(document: Dict[str, Any]) -> Dict[str, Any]:
+    """Round-trip through BSON: what MongoDB would store (millisecond datetimes, lists for tuples)"""
+    return bson.decode(bson.encode(document))
+
+
+def index_name(keys: List[Tuple[str, Any]]) -> str:
+    return '_'.join(f'{field}_{direction}' for field, direction in keys)
+
+
+class _Index:
+    def __init__(self, name: str, keys: List[Tuple[str, Any]], unique: bool = False,
+                 expire_after: Optional[float] = None):
+        self.name = name
+        self.keys = keys
+        self.fields = [field for field, _ in keys]
+        self.unique = unique
+        self.expire_after = expire_after
+        # Arrays in an indexed field make lookups by element impossible; such indexes only enforce uniqueness
+        self.multikey = False
+        self.entries: Dict[Tuple, Dict[Any, None]] = {}
+
+    def key(self, document: Dict[str, Any]) -> Tuple:
+        values = []
+        for field in self.fields:
+            value = get_path(document, field)
+            if isinstance(value, list):
+                self.multikey = True
+            values.append(_freeze(None if value is MISSING else value))
+        return tuple(values)
+
+    def add(self, id_key, document: Dict[str, Any]):
+        self.entries.setdefault(self.key(document), {})[id_key] = None
+
+    def remove(self, id_key, document: Dict[str, Any]):
+        key = self.key(document)
+        bucket = self.entries.get(key)
+        if bucket is not None:
+            bucket.pop(id_key, None)
+            if not bucket:
+                del self.entries[key]
+
+    def info(self) -> Dict[str, Any]:
+        info = {'v': 2, 'key': list(self.keys)}
+        if self.unique:
+            info['unique'] = True
+        if self.expire_after is not None:
+            info['expireAfterSeconds'] = self.expire_after
+        return info
+
+
+class _CollectionState:
+    def __init__(self, capped_max: Optional[int] = None):
+        self.documents: Dict[Any, Dict[str, Any]] = {}
+        self.indexes: Dict[str, _Index] = {'_id_': _Index('_id_', [('_id', 1)], unique=True)}
+        self.capped_max = capped_max
+        self.swept_at = 0.0
+
+    def put(self, document: Dict[str, Any]):
+        id_key = _id_key(document['_id'])
+        previous = self.documents.get(id_key)
+        for index in self.indexes.values():
+            if previous is not None:
+                index.remove(id_key, previous)
+            index.add(id_key, document)
+        # Replacing keeps the document's natural position
+        self.documents[id_key] = document
+
+    def delete(self, id_key):
+        document = self.documents.pop(id_key, None)
+        if document is not None:
+            for index in self.indexes.values():
+                index.remove(id_key, document)
+
+    def add_index(self, index: _Index):
+        for id_key, document in self.documents.items():
+            index.add(id_key, document)
+        self.indexes[index.name] = index
+
+    def candidates(self, query: Optional[Dict[str, Any]]) -> Iterable[Dict[str, Any]]:
+        """Documents that may match `query`: one index bucket when an index is fully pinned, else all"""
+        pinned = equality_fields(query)
+        for index in self.indexes.values():
+            if index.multikey or not all(field in pinned for field in index.fields):
+                continue
+            if any(isinstance(pinned[field], (list, dict)) for field in index.fields):
+                continue
+            key = tuple(_freeze(pinned[field]) for field in index.fields)
+            return [self.documents[id_key] for id_key in list(self.entries_of(index, key))]
+        return list(self.documents.values())
+
+    @staticmethod
+    def entries_of(index: _Index, key: Tuple):
+        return index.entries.get(key, {})
+
+
+class _Batch:
+    """Documents to put and ids to delete in one collection, validated against its unique indexes"""
+
+    def __init__(self, state: _CollectionState, namespace: str):
+        self.state = state
+        self.namespace = namespace
+        self.puts: Dict[Any, Dict[str, Any]] = {}
+        self.deletes: Dict[Any, None] = {}
+        self._claimed: Dict[Tuple[str, Tuple], Any] = {}
+
+    def current(self, id_key) -> Optional[Dict[str, Any]]:
+        if id_key in self.deletes:
+            return None
+        if id_key in self.puts:
+            return self.puts[id_key]
+        return self.state.documents.get(id_key)
+
+    def put(self, document: Dict[str, Any]):
+        document = _normalize(document)
+        id_key = _id_key(document['_id'])
+        for index in self.state.indexes.values():
+            if not index.unique:
+                continue
+            key = index.key(document)
+            holders = [holder for holder in self.state.entries_of(index, key)
+                       if holder != id_key and holder not in self.deletes and holder not in self.puts]
+            claimed = self._claimed.get((index.name, key))
+            if claimed is not None and (claimed == id_key or claimed not in self.puts
+                                        or index.key(self.puts[claimed]) != key):
+                # Claimed by this document, or by one the batch has since rewritten or deleted
+                claimed = None
+            if holders or claimed is not None:
+                values = {field: get_path(document, field) for field in index.fields}
+                values = {field: (None if value is MISSING else value) for field, value in values.items()}
+                raise DuplicateKeyError(
+                    f'E11000 duplicate key error collection: {self.namespace} index: {index.name} dup key: {values}',
+                    DUPLICATE_KEY, {'index': 0, 'code': DUPLICATE_KEY, 'keyPattern': dict(index.keys),
+                                    'keyValue': values})
+        for index in self.state.indexes.values():
+            if index.unique:
+                self._claimed[(index.name, index.key(document))] = id_key
+        self.deletes.pop(id_key, None)
+        self.puts[id_key] = document
+        return document
+
+    def delete(self, id_key):
+        self.puts.pop(id_key, None)
+        self.deletes[id_key] = None
+
+    def matching(self, query: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Documents matching `query` as this batch leaves them"""
+        # Index buckets do not know about documents this batch rewrote
+        documents = self.state.documents.values() if self.puts else self.state.candidates(query)
+        found = []
+        for document in documents:
+            current = self.current(_id_key(document['_id']))
+            if current is not None and matches(current, query):
+                found.append(current)
+        for id_key, document in self.puts.items():
+            if id_key not in self.state.documents and matches(document, query):
+                found.append(document)
+        return found
+
+    def record(self) -> Optional[Dict[str, Any]]:
+        if not self.puts and not self.deletes:
+            return None
+        record = {'op': 'write'}
+        if self.puts:
+            record['put'] = list(self.puts.values())
+        if self.deletes:
+            record['del'] = [self.state.documents[id_key]['_id'] for id_key in self.deletes
+                             if id_key in self.state.documents]
+        return record
+
+
+class MemorySession:
+    """Session placeholder: the engine is a single node, so every read is causally consistent"""
+
+    def end_session(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.end_session()
+
+
+class MemoryCursor:
+    """Lazily evaluated find cursor supporting sort, skip and limit"""
+
+    def __init__(self, fetch: Callable[[List[Tuple[str, int]], int, int], List[Dict[str, Any]]]):
+        self._fetch = fetch
+        self._sort: List[Tuple[str, int]] = []
+        self._skip = 0
+        self._limit = 0
+        self._results: Optional[Iterator[Dict[str, Any]]] = None
+
+    def _check_unstarted(self):
+        if self._results is not None:
+            raise OperationFailure('Cannot modify a cursor after it has been iterated')
+
+    def sort(self, key_or_list, direction: int = None) -> 'MemoryCursor':
+        self._check_unstarted()
+        self._sort = normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, skip: int) -> 'MemoryCursor':
+        self._check_unstarted()
+        self._skip = skip
+        return self
+
+    def limit(self, limit: int) -> 'MemoryCursor':
+        self._check_unstarted()
+        self._limit = limit
+        return self
+
+    def batch_size(self, batch_size: int) -> 'MemoryCursor':
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Dict[str, Any]:
+        if self._results is None:
+            self._results = iter(self._fetch(self._sort, self._skip, self._limit))
+        return next(self._results)
+
+    def close(self):
+        self._results = iter(())
+
+
+class MemoryCollection:
+    def __init__(self, database: 'MemoryDatabase', name: str):
+        self.database = database
+        self.name = name
+        self.full_name = f'{database.name}.{name}'
+        self._client = database.client
+
+    @property
+    def _state(self) -> _CollectionState:
+        return self._client._state(self.database.name, self.name)
+
+    def with_options(self, **kwargs) -> 'MemoryCollection':
+        # Read preferences and concerns mean nothing on a single in-process node
+        return self
+
+    # -- reads ---------------------------------------------------------------
+
+    def _matching(self, query: Optional[Dict[str, Any]], limit: int = 0) -> List[Dict[str, Any]]:
+        """Stored documents matching `query` in natural order (the first `limit` of them, if set)"""
+        found = []
+        for document in self._sweep().candidates(query):
+            if matches(document, query):
+                found.append(document)
+                if len(found) == limit:
+                    break
+        return found
+
+    def find(self, filter: Dict[str, Any] = None, projection=None, skip: int = 0, limit: int = 0, sort=None,
+             session=None, **kwargs) -> MemoryCursor:
+        def fetch(sort_spec, skip_count, limit_count):
+            with self._client.lock:
+                # Without a sort the scan can stop once skip + limit documents matched
+                documents = self._matching(filter, 0 if sort_spec or not limit_count else skip_count + abs(limit_count))
+                if sort_spec:
+                    documents = sort_documents(documents, sort_spec)
+                if skip_count:
+                    documents = documents[skip_count:]
+                if limit_count:
+                    documents = documents[:abs(limit_count)]
+                return [project(document, projection) for document in documents]
+        cursor = MemoryCursor(fetch)
+        if sort:
+            cursor.sort(sort)
+        return cursor.skip(skip).limit(limit)
+
+    def find_one(self, filter=None, projection=None, *args, session=None, **kwargs) -> Optional[Dict[str, Any]]:
+        if filter is not None and not isinstance(filter, dict):
+            filter = {'_id': filter}
+        for document in self.find(filter, projection, *args, **kwargs).limit(1):
+            return document
+        return None
+
+    def count_documents(self, filter: Dict[str, Any], session=None, skip: int = 0, limit: int = 0, **kwargs) -> int:
+        with self._client.lock:
+            count = max(0, len(self._matching(filter)) - skip)
+        return min(count, limit) if limit else count
+
+    def estimated_document_count(self, **kwargs) -> int:
+        with self._client.lock:
+            return len(self._sweep().documents)
+
+    def distinct(self, key: str, filter: Dict[str, Any] = None, session=None, **kwargs) -> List[Any]:
+        values: List[Any] = []
+        seen = set()
+        with self._client.lock:
+            for document in self._matching(filter):
+                value = get_path(document, key)
+                for item in (value if isinstance(value, list) else [value]):
+                    frozen = _freeze(item)
+                    if item is not MISSING and frozen not in seen:
+                        seen.add(frozen)
+                        values.append(copy_document(item))
+        return values
+
+    def aggregate(self, pipeline: List[Dict[str, Any]], session=None, **kwargs) -> Iterator[Dict[str, Any]]:
+        with self._client.lock:
+            state = self._sweep()
+            documents: Iterable[Dict[str, Any]] = state.documents.values()
+            if pipeline and '$match' in pipeline[0]:
+                # The leading $match can use an index like a find does
+                documents = self._matching(pipeline[0]['$match'])
+                pipeline = pipeline[1:]
+            results = aggregate(list(documents), pipeline)
+        return iter(results)
+
+    # -- writes --------------------------------------------------------------
+
+    def _batch(self) -> _Batch:
+        return _Batch(self._sweep(), self.full_name)
+
+    def _commit(self, batch: _Batch):
+        record = batch.record()
+        if record is not None:
+            self._client._write(self.database.name, self.name, record)
+
+    def insert_one(self, document: Dict[str, Any], session=None, **kwargs) -> InsertOneResult:
+        document.setdefault('_id', ObjectId())
+        with self._client.lock:
+            batch = self._batch()
+            self._insert(batch, document)
+            self._commit(batch)
+        return InsertOneResult(document['_id'], True)
+
+    def _insert(self, batch: _Batch, document: Dict[str, Any]):
+        if batch.current(_id_key(document['_id'])) is not None:
+            raise DuplicateKeyError(
+                f"E11000 duplicate key error collection: {self.full_name} index: _id_ dup key: "
+                f"{{ _id: {document['_id']!r} }}", DUPLICATE_KEY,
+                {'index': 0, 'code': DUPLICATE_KEY, 'keyPattern': {'_id': 1}, 'keyValue': {'_id': document['_id']}})
+        batch.put(document)
+
+    def insert_many(self, documents: Iterable[Dict[str, Any]], ordered: bool = True, session=None,
+                    **kwargs) -> InsertManyResult:
+        documents = list(documents)
+        if not documents:
+            raise TypeError('documents must be a non-empty list')
+        write_errors = []
+        inserted = []
+        with self._client.lock:
+            batch = self._batch()
+            for position, document in enumerate(documents):
+                document.setdefault('_id', ObjectId())
+                try:
+                    self._insert(batch, document)
+                    inserted.append(document['_id'])
+                except DuplicateKeyError as e:
+                    write_errors.append({'index': position, 'code': DUPLICATE_KEY, 'errmsg': str(e),
+                                         'keyValue': e.details.get('keyValue'), 'op': document})
+                    if ordered:
+                        break
+            self._commit(batch)
+        if write_errors:
+            raise BulkWriteError({'writeErrors': write_errors, 'writeConcernErrors': [], 'nInserted': len(inserted),
+                                  'nUpserted': 0, 'nMatched': 0, 'nModified': 0, 'nRemoved': 0, 'upserted': []})
+        return InsertManyResult(inserted, True)
+
+    def _update(self, batch: _Batch, filter: Dict[str, Any], update: Any, multi: bool, upsert: bool,
+                replacement: bool = False, sort=None) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]],
+                                                                Optional[Dict[str, Any]]]:
+        """Apply one update statement to `batch`: (raw result, document before, document after)"""
+        if replacement and any(key.startswith('$') for key in update):
+            raise ValueError('replacement can not include $ operators')
+        if not replacement and isinstance(update, dict) and not all(key.startswith('$') for key in update):
+            raise ValueError('update only works with $ operators')
+        documents = batch.matching(filter)
+        if sort:
+            documents = sort_documents(documents, normalize_sort(sort))
+        if not multi:
+            documents = documents[:1]
+        before = after = None
+        modified = 0
+        for document in documents:
+            updated = apply_update(document, update)
+            if before is None:
+                before = document
+            if updated != document:
+                updated = batch.put(updated)
+                modified += 1
+            if after is None:
+                after = updated
+        if documents or not upsert:
+            return {'n': len(documents), 'nModified': modified, 'ok': 1.0}, before, after
+        seed: Dict[str, Any] = {}
+        for path, value in equality_fields(filter).items():
+            if not replacement or path == '_id':
+                set_path(seed, path, copy_document(value))
+        created = apply_update(seed, update, inserting=True)
+        if '_id' not in created:
+            created = dict({'_id': ObjectId()}, **created)
+        self._insert(batch, created)
+        created = batch.current(_id_key(created['_id']))
+        return {'n': 1, 'nModified': 0, 'upserted': created['_id'], 'ok': 1.0}, None, created
+
+    def update_one(self, filter: Dict[str, Any], update: Any, upsert: bool = False, session=None,
+                   **kwargs) -> UpdateResult:
+        return self._run_update(filter, update, False, upsert)
+
+    def update_many(self, filter: Dict[str, Any], update: Any, upsert: bool = False, session=None,
+                    **kwargs) -> UpdateResult:
+        return self._run_update(filter, update, True, upsert)
+
+    def replace_one(self, filter: Dict[str, Any], replacement: Dict[str, Any], upsert: bool = False, session=None,
+                    **kwargs) -> UpdateResult:
+        return self._run_update(filter, replacement, False, upsert, replacement=True)
+
+    def _run_update(self, filter, update, multi, upsert, replacement=False) -> UpdateResult:
+        with self._client.lock:
+            batch = self._batch()
+            raw, _, _ = self._update(batch, filter, update, multi, upsert, replacement)
+            self._commit(batch)
+        return UpdateResult(raw, True)
+
+    def find_one_and_update(self, filter: Dict[str, Any], update: Any, projection=None, sort=None,
+                            upsert: bool = False, return_document: bool = ReturnDocument.BEFORE, session=None,
+                            **kwargs) -> Optional[Dict[str, Any]]:
+        with self._client.lock:
+            batch = self._batch()
+            _, before, after = self._update(batch, filter, update, False, upsert, sort=sort)
+            self._commit(batch)
+        document = after if return_document == ReturnDocument.AFTER else before
+        return project(document, projection) if document is not None else None
+
+    def find_one_and_delete(self, filter: Dict[str, Any], projection=None, sort=None, session=None,
+                            **kwargs) -> Optional[Dict[str, Any]]:
+        with self._client.lock:
+            documents = self._matching(filter)
+            if sort:
+                documents = sort_documents(documents, normalize_sort(sort))
+            if not documents:
+                return None
+            batch = self._batch()
+            batch.delete(_id_key(documents[0]['_id']))
+            self._commit(batch)
+        return project(documents[0], projection)
+
+    def _delete(self, batch: _Batch, filter: Dict[str, Any], multi: bool) -> int:
+        deleted = 0
+        for document in batch.matching(filter):
+            batch.delete(_id_key(document['_id']))
+            deleted += 1
+            if not multi:
+                break
+        return deleted
+
+    def delete_one(self, filter: Dict[str, Any], session=None, **kwargs) -> DeleteResult:
+        with self._client.lock:
+            batch = self._batch()
+            deleted = self._delete(batch, filter, False)
+            self._commit(batch)
+        return DeleteResult({'n': deleted, 'ok': 1.0}, True)
+
+    def delete_many(self, filter: Dict[str, Any], session=None, **kwargs) -> DeleteResult:
+        with self._client.lock:
+            batch = self._batch()
+            deleted = self._delete(batch, filter, True)
+            self._commit(batch)
+        return DeleteResult({'n': deleted, 'ok': 1.0}, True)
+
+    def bulk_write(self, requests: List[Any], ordered: bool = True, session=None, **kwargs) -> BulkWriteResult:
+        """InsertOne, UpdateOne/Many, ReplaceOne and DeleteOne/Many requests, applied as one journal record"""
+        result = {'writeErrors': [], 'writeConcernErrors': [], 'nInserted': 0, 'nUpserted': 0, 'nMatched': 0,
+                  'nModified': 0, 'nRemoved': 0, 'upserted': []}
+        with self._client.lock:
+            batch = self._batch()
+            for position, operation in enumerate(requests):
+                kind = type(operation).__name__
+                try:
+                    if kind == 'InsertOne':
+                        operation._doc.setdefault('_id', ObjectId())
+                        self._insert(batch, operation._doc)
+                        result['nInserted'] += 1
+                    elif kind in ('UpdateOne', 'UpdateMany', 'ReplaceOne'):
+                        raw, _, _ = self._update(batch, operation._filter, operation._doc, kind == 'UpdateMany',
+                                                 operation._upsert, replacement=kind == 'ReplaceOne')
+                        if 'upserted' in raw:
+                            result['nUpserted'] += 1
+                            result['upserted'].append({'index': position, '_id': raw['upserted']})
+                        else:
+                            result['nMatched'] += raw['n']
+                            result['nModified'] += raw['nModified']
+                    elif kind in ('DeleteOne', 'DeleteMany'):
+                        result['nRemoved'] += self._delete(batch, operation._filter, kind == 'DeleteMany')
+                    else:
+                        raise TypeError(f'{operation!r} is not a valid request')
+                except DuplicateKeyError as e:
+                    result['writeErrors'].append({'index': position, 'code': DUPLICATE_KEY, 'errmsg': str(e),
+                                                  'keyValue': e.details.get('keyValue')})
+                    if ordered:
+                        break
+            self._commit(batch)
+        if result['writeErrors']:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    # -- indexes and lifecycle -------------------------------------------------
+
+    def create_index(self, keys, unique: bool = False, expireAfterSeconds: float = None, name: str = None,
+                     session=None, **kwargs) -> str:
+        keys = normalize_sort(keys)
+        name = name or index_name(keys)
+        with self._client.lock:
+            existing = self._state.indexes.get(name)
+            if existing is not None:
+                if existing.keys != keys or existing.unique != unique:
+                    raise OperationFailure(f'An existing index has the same name as the requested index: {name}', 86)
+                return name
+            self._client._write(self.database.name, self.name, {
+                'op': 'create_index', 'name': name, 'keys': [list(key) for key in keys], 'unique': unique,
+                'expire_after': expireAfterSeconds
+            })
+        return name
+
+    def create_indexes(self, indexes, session=None, **kwargs) -> List[str]:
+        return [self.create_index(index.document['key'].items(), **{
+            key: value for key, value in index.document.items() if key != 'key'}) for index in indexes]
+
+    def drop_index(self, index_or_name, session=None, **kwargs):
+        name = index_or_name if isinstance(index_or_name, str) else index_name(normalize_sort(index_or_name))
+        with self._client.lock:
+            if name == '_id_':
+                raise OperationFailure('cannot drop _id index', 72)
+            if name not in self._state.indexes:
+                raise OperationFailure(f'index not found with name [{name}]', 27)
+            self._client._write(self.database.name, self.name, {'op': 'drop_index', 'name': name})
+
+    def index_information(self, session=None) -> Dict[str, Dict[str, Any]]:
+        with self._client.lock:
+            return {name: index.info() for name, index in self._state.indexes.items()}
+
+    def list_indexes(self, session=None) -> Iterator[Dict[str, Any]]:
+        return iter([dict(info, name=name) for name, info in self.index_information().items()])
+
+    def drop(self, session=None, **kwargs):
+        with self._client.lock:
+            self._client._write(self.database.name, self.name, {'op': 'drop'})
+
+    def _sweep(self) -> _CollectionState:
+        """The collection state, with documents past a TTL index's expiry removed (at most once a second)"""
+        state = self._state
+        ttl_indexes = [index for index in state.indexes.values() if index.expire_after is not None]
+        now = time.monotonic()
+        if not ttl_indexes or now - state.swept_at < TTL_SWEEP_INTERVAL:
+            return state
+        state.swept_at = now
+        cutoff = datetime.utcnow()
+        batch = _Batch(state, self.full_name)
+        for index in ttl_indexes:
+            expiry = timedelta(seconds=index.expire_after)
+            for id_key, document in state.documents.items():
+                value = get_path(document, index.fields[0])
+                stamps = value if isinstance(value, list) else [value]
+                dates = [stamp for stamp in stamps if isinstance(stamp, datetime)]
+                if dates and min(dates) + expiry <= cutoff:
+                    batch.delete(id_key)
+        self._commit(batch)
+        return state
+
+
+class MemoryDatabase:
+    def __init__(self, client: 'MemoryClient', name: str):
+        self.client = client
+        self.name = name
+        self._collections: Dict[str, MemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(self, name)
+        return self._collections[name]
+
+    def get_collection(self, name: str, **kwargs) -> MemoryCollection:
+        return self[name]
+
+    def list_collection_names(self, session=None, **kwargs) -> List[str]:
+        with self.client.lock:
+            return sorted(self.client._databases.get(self.name, {}))
+
+    def create_collection(self, name: str, capped: bool = False, size: int = None, max: int = None,
+                          session=None, **kwargs) -> MemoryCollection:
+        with self.client.lock:
+            if name in self.client._databases.get(self.name, {}):
+                raise CollectionInvalid(f'collection {name} already exists')
+            self.client._write(self.name, name, {'op': 'create', 'capped_max': max if capped else None})
+        return self[name]
+
+    def drop_collection(self, name: str, session=None, **kwargs):
+        self[name].drop()
+
+    def _indexes_of(self, collection: str) -> Optional[Dict[str, _Index]]:
+        state = self.client._databases.get(self.name, {}).get(collection)
+        return dict(state.indexes) if state is not None else None
+
+    def command(self, command, value: Any = 1, session=None, **kwargs) -> Dict[str, Any]:
+        name = command if isinstance(command, str) else next(iter(command))
+        if name in ('ping', 'isMaster', 'hello'):
+            return {'ok': 1.0}
+        if name == 'explain' and isinstance(value, dict):
+            with self.client.lock:
+                return explain(self.name, value, self._indexes_of)
+        raise OperationFailure(f"Command '{name}' is not supported by the memory storage engine", 59)
+
+
+class MemoryClient:
+    """In-process stand-in for `MongoClient`, optionally persisted by a `Journal`"""
+
+    def __init__(self, journal=None):
+        self.lock = threading.RLock()
+        self.journal = journal
+        self._databases: Dict[str, Dict[str, _CollectionState]] = {}
+        self._database_handles: Dict[str, MemoryDatabase] = {}
+        if journal is not None:
+            started = time.perf_counter()
+            records = 0
+            for database, collection, record in journal.replay():
+                self._apply(database, collection, record)
+                records += 1
+            logger.info("Memory storage loaded", path=journal.path, records=records,
+                        documents=sum(len(state.documents) for states in self._databases.values()
+                                      for state in states.values()),
+                        duration_ms=round((time.perf_counter() - started) * 1000, 2))
+            # Start from a fresh snapshot so the next start does not replay the same journal again
+            journal.snapshot(self._dump())
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        if name not in self._database_handles:
+            self._database_handles[name] = MemoryDatabase(self, name)
+        return self._database_handles[name]
+
+    def get_database(self, name: str, **kwargs) -> MemoryDatabase:
+        return self[name]
+
+    @property
+    def admin(self) -> MemoryDatabase:
+        return self['admin']
+
+    def start_session(self, **kwargs) -> MemorySession:
+        return MemorySession()
+
+    def close(self):
+        with self.lock:
+            if self.journal is not None:
+                self.journal.snapshot(self._dump())
+                self.journal.close()
+                self.journal = None
+
+    def _state(self, database: str, collection: str) -> _CollectionState:
+        collections = self._databases.setdefault(database, {})
+        if collection not in collections:
+            collections[collection] = _CollectionState()
+        return collections[collection]
+
+    def _write(self, database: str, collection: str, record: Dict[str, Any]):
+        """Journal `record` (write-ahead), then apply it"""
+        if self.journal is not None:
+            self.journal.append(database, collection, record)
+        self._apply(database, collection, record)
+        if self.journal is not None and self.journal.needs_snapshot():
+            self.journal.snapshot(self._dump())
+
+    def _apply(self, database: str, collection: str, record: Dict[str, Any]):
+        op = record['op']
+        if op == 'drop':
+            self._databases.get(database, {}).pop(collection, None)
+            return
+        state = self._state(database, collection)
+        if op == 'write':
+            for _id in record.get('del', ()):
+                state.delete(_id_key(_id))
+            for document in record.get('put', ()):
+                state.put(document)
+            if state.capped_max:
+                while len(state.documents) > state.capped_max:
+                    state.delete(next(iter(state.documents)))
+        elif op == 'create_index':
+            keys = [tuple(key) for key in record['keys']]
+            state.add_index(_Index(record['name'], keys, record.get('unique', False), record.get('expire_after')))
+        elif op == 'drop_index':
+            state.indexes.pop(record['name'], None)
+        elif op == 'create':
+            state.capped_max = record.get('capped_max')
+        else:
+            raise OperationFailure(f'Unknown storage record {op!r}')
+
+    def _dump(self) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+        """Records that rebuild the current state from nothing (what a snapshot holds)"""
+        for database, collections in list(self._databases.items()):
+            for collection, state in list(collections.items()):
+                yield database, collection, {'op': 'create', 'capped_max': state.capped_max}
+                for index in state.indexes.values():
+                    if index.name != '_id_':
+                        yield database, collection, {
+                            'op': 'create_index', 'name': index.name, 'keys': [list(key) for key in index.keys],
+                            'unique': index.unique, 'expire_after': index.expire_after}
+                documents = list(state.documents.values())
+                for start in range(0, len(documents), SNAPSHOT_CHUNK):
+                    yield database, collection, {'op': 'write', 'put': documents[start:start + SNAPSHOT_CHUNK]}
+
+
+# Documents per snapshot record, keeping each BSON record far below the 16MB document limit
+SNAPSHOT_CHUNK = 500
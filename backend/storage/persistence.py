@@ -0,0 +1,150 @@
+"""
+Durability for the in-memory storage engine.
+
+A storage directory holds two files of concatenated BSON records:
+
+- `snapshot.bson`: a header, then records that rebuild every collection
+  (options, indexes, documents in chunks). Read back through `mmap`, so
+  loading does not copy the file through Python buffers first.
+- `journal.bson`: every write applied since that snapshot, appended before
+  the write is applied in memory (optionally fsynced).
+
+Startup replays the snapshot and then the journal, dropping a torn record at
+the journal's tail (a crash mid-append). Once the journal outgrows
+`snapshot_bytes` the full state is written to a new snapshot, atomically
+swapped in with `os.replace`, and the journal starts over. A crash between
+the two steps only replays records the snapshot already holds, which is
+harmless because records put whole documents.
+"""
+import fcntl
+import mmap
+import os
+import struct
+from typing import Any, Dict, Iterable, Iterator, Tuple
+import bson
+from bson.errors import InvalidBSON
+from pymongo.errors import OperationFailure
+import structlog
+
+logger = structlog.get_logger()
+
+SNAPSHOT_FILE = 'snapshot.bson'
+JOURNAL_FILE = 'journal.bson'
+LOCK_FILE = 'LOCK'
+SNAPSHOT_FORMAT = 'nom-memory-snapshot'
+SNAPSHOT_VERSION = 1
+
+Record = Tuple[str, str, Dict[str, Any]]
+
+
+class StorageLockedError(RuntimeError):
+    """Another process already owns the storage directory"""
+
+
+def _read_records(buffer) -> Tuple[Iterator[Dict[str, Any]], int]:
+    """Records in `buffer`, and the offset after the last complete one"""
+    records = []
+    offset, size = 0, len(buffer)
+    while offset + 4 <= size:
+        length, = struct.unpack_from('<i', buffer, offset)
+        if length < 5 or offset + length > size:
+            break
+        try:
+            records.append(bson.decode(buffer[offset:offset + length]))
+        except InvalidBSON:
+            break
+        offset += length
+    return iter(records), offset
+
+
+class Journal:
+    def __init__(self, path: str, fsync: bool = False, snapshot_bytes: int = 64 * 1024 * 1024):
+        self.path = path
+        self.fsync = fsync
+        self.snapshot_bytes = snapshot_bytes
+        os.makedirs(path, exist_ok=True)
+        self._lock_file = open(os.path.join(path, LOCK_FILE), 'a+')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            raise StorageLockedError(f'Memory storage at {path} is in use by another process')
+        self._journal_path = os.path.join(path, JOURNAL_FILE)
+        self._snapshot_path = os.path.join(path, SNAPSHOT_FILE)
+        self._file = None
+        self._size = 0
+
+    def replay(self) -> Iterator[Record]:
+        """Records of the snapshot and then the journal; leaves the journal open for appending"""
+        if os.path.exists(self._snapshot_path) and os.path.getsize(self._snapshot_path):
+            with open(self._snapshot_path, 'rb') as snapshot, \
+                    mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                # A snapshot is only ever swapped in complete, so it decodes in one pass
+                records = bson.decode_iter(mapped)
+                header = next(records)
+                if header.get('format') != SNAPSHOT_FORMAT or header.get('version') != SNAPSHOT_VERSION:
+                    raise OperationFailure(f'{self._snapshot_path} is not a version {SNAPSHOT_VERSION} snapshot')
+                for record in records:
+                    yield record.pop('db'), record.pop('c'), record
+        if os.path.exists(self._journal_path) and os.path.getsize(self._journal_path):
+            with open(self._journal_path, 'rb') as journal, \
+                    mmap.mmap(journal.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                records, end = _read_records(mapped)
+                size = len(mapped)
+            for record in records:
+                yield record.pop('db'), record.pop('c'), record
+            if end < size:
+                logger.warning("Truncating torn journal tail", path=self._journal_path, dropped_bytes=size - end)
+                os.truncate(self._journal_path, end)
+        self._open()
+
+    def _open(self):
+        self._file = open(self._journal_path, 'ab')
+        self._size = self._file.tell()
+
+    def append(self, database: str, collection: str, record: Dict[str, Any]):
+        data = bson.encode(dict(record, db=database, c=collection))
+        try:
+            self._file.write(data)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        except OSError as e:
+            # Never leave a partial record for later appends to land behind
+            self._file.truncate(self._size)
+            raise OperationFailure(f'Journal write failed: {e}')
+        self._size += len(data)
+
+    def needs_snapshot(self) -> bool:
+        return self._size >= self.snapshot_bytes
+
+    def snapshot(self, records: Iterable[Record]):
+        """Write the full state as the new snapshot and empty the journal"""
+        temporary = self._snapshot_path + '.tmp'
+        with open(temporary, 'wb') as snapshot:
+            snapshot.write(bson.encode({'format': SNAPSHOT_FORMAT, 'version': SNAPSHOT_VERSION}))
+            for database, collection, record in records:
+                snapshot.write(bson.encode(dict(record, db=database, c=collection)))
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        os.replace(temporary, self._snapshot_path)
+        directory = os.open(self.path, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+        if self._file is not None:
+            self._file.truncate(0)
+            self._file.seek(0)
+        else:
+            open(self._journal_path, 'wb').close()
+        self._size = 0
+        logger.info("Memory storage snapshot written", path=self._snapshot_path,
+                    size_bytes=os.path.getsize(self._snapshot_path))
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        self._lock_file.close()
@@ -0,0 +1,180 @@
+"""
+Query plans for `explain` on the memory engine.
+
+The engine serves filters from hash lookups, so its own access paths say nothing
+about how MongoDB would run a query. This module answers that question with the
+MongoDB planner's rules for choosing an index:
+
+- an index can serve a filter when its first field has an indexable predicate
+  (equality, `$in`, a range or `$regex`; `$ne`, `$nin`, `$not` and `$size` cannot
+  bound an index), and it bounds as many leading fields as have one;
+- an index provides a sort when, skipping fields the filter pins to one value,
+  its fields follow the sort in order, all in or all against the sort directions;
+- a top-level `$or` is served by an index per clause, or not at all.
+
+`explain` returns the winning plan in the `queryPlanner` shape of a real server
+(COLLSCAN, IXSCAN, FETCH, SORT, ...), which is what the slow-query log and
+`flask check-indexes` read. Candidates are ranked rather than raced, so when two
+indexes fit the plan may differ from the one a server picks.
+"""
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from pymongo.errors import OperationFailure
+
+from .query import normalize_sort
+
+POINT = 'point'
+RANGE = 'range'
+
+RANGE_OPERATORS = ('$gt', '$gte', '$lt', '$lte', '$regex', '$exists', '$all', '$elemMatch')
+
+
+def _predicate(condition: Any) -> Optional[str]:
+    """How a field condition can bound an index: POINT (one value), RANGE, or None (not indexable)"""
+    if isinstance(condition, re.Pattern):
+        return RANGE
+    if not (isinstance(condition, dict) and condition and all(key.startswith('$') for key in condition)):
+        return POINT
+    if '$eq' in condition or ('$in' in condition and len(condition['$in']) == 1):
+        return POINT
+    if '$in' in condition or any(operator in condition for operator in RANGE_OPERATORS):
+        return RANGE
+    return None
+
+
+def predicates(query: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """Indexable fields of the AND part of a filter (top level and `$and` clauses)"""
+    fields: Dict[str, str] = {}
+    for key, condition in (query or {}).items():
+        if key == '$and':
+            for clause in condition:
+                for field, kind in predicates(clause).items():
+                    fields[field] = POINT if POINT in (kind, fields.get(field)) else kind
+        elif not key.startswith('$'):
+            kind = _predicate(condition)
+            if kind is not None:
+                fields[key] = POINT if fields.get(key) == POINT else kind
+    return fields
+
+
+def _bound_fields(keys: Sequence[Tuple[str, Any]], fields: Dict[str, str]) -> int:
+    """Leading index fields bounded by the filter (a range ends the prefix)"""
+    bound = 0
+    for field, _ in keys:
+        if field not in fields:
+            break
+        bound += 1
+        if fields[field] != POINT:
+            break
+    return bound
+
+
+def _sort_direction(keys: Sequence[Tuple[str, Any]], sort: List[Tuple[str, int]],
+                    fields: Dict[str, str]) -> Optional[str]:
+    """'forward' or 'backward' when walking the index yields documents in sort order, else None"""
+    wanted = [(field, direction) for field, direction in sort if fields.get(field) != POINT]
+    if not wanted:
+        return 'forward'
+    if any(field == '$natural' for field, _ in wanted):
+        return None
+    position, orientation = 0, None
+    for field, direction in keys:
+        if position == len(wanted):
+            break
+        if not isinstance(direction, int):
+            return None
+        if field == wanted[position][0]:
+            same = (direction > 0) == (wanted[position][1] > 0)
+            if orientation is None:
+                orientation = same
+            elif orientation != same:
+                return None
+            position += 1
+        elif fields.get(field) != POINT:
+            return None
+    if position < len(wanted):
+        return None
+    return 'forward' if orientation in (None, True) else 'backward'
+
+
+def _index_scan(name: str, keys: Sequence[Tuple[str, Any]], multikey: bool, direction: str) -> Dict[str, Any]:
+    return {'stage': 'FETCH', 'inputStage': {
+        'stage': 'IXSCAN', 'indexName': name, 'keyPattern': dict(keys), 'isMultiKey': multikey, 'direction': direction
+    }}
+
+
+def plan_query(indexes: Dict[str, Any], query: Optional[Dict[str, Any]], sort=None) -> Dict[str, Any]:
+    """Winning plan for `query` (and `sort`) over `indexes`: name -> object with `keys` and `multikey`"""
+    sort = normalize_sort(sort)
+    fields = predicates(query)
+    best, best_rank = None, None
+    for name, index in indexes.items():
+        bound = _bound_fields(index.keys, fields)
+        direction = _sort_direction(index.keys, sort, fields) if sort else None
+        if not bound and direction is None:
+            continue
+        rank = (bound > 0 and direction is not None, bound, direction is not None, -len(index.keys))
+        if best_rank is None or rank > best_rank:
+            best, best_rank = (name, index, direction or 'forward'), rank
+
+    if best is not None:
+        name, index, direction = best
+        plan = _index_scan(name, index.keys, index.multikey, direction)
+        if sort and _sort_direction(index.keys, sort, fields) is None:
+            plan = {'stage': 'SORT', 'sortPattern': dict(sort), 'inputStage': plan}
+        return plan
+
+    clauses = (query or {}).get('$or')
+    if clauses:
+        branches = [plan_query(indexes, clause) for clause in clauses]
+        if all(branch['stage'] != 'COLLSCAN' for branch in branches):
+            plan = {'stage': 'FETCH', 'inputStage': {'stage': 'OR', 'inputStages': [
+                branch.get('inputStage', branch) for branch in branches]}}
+            return {'stage': 'SORT', 'sortPattern': dict(sort), 'inputStage': plan} if sort else plan
+
+    plan = {'stage': 'COLLSCAN', 'direction': 'forward'}
+    if sort and not all(field == '$natural' for field, _ in sort):
+        plan = {'stage': 'SORT', 'sortPattern': dict(sort), 'inputStage': plan}
+    return plan
+
+
+def _query_planner(namespace: str, indexes: Optional[Dict[str, Any]], query, sort=None) -> Dict[str, Any]:
+    plan = plan_query(indexes, query, sort) if indexes is not None else {'stage': 'EOF'}
+    return {'namespace': namespace, 'parsedQuery': query or {}, 'winningPlan': plan, 'rejectedPlans': []}
+
+
+def explain(database: str, command: Dict[str, Any], indexes_of) -> Dict[str, Any]:
+    """`explain` result (queryPlanner verbosity) for a find, count, update, delete or aggregate command.
+
+    `indexes_of(collection)` gives the indexes of a collection, or None when it does not exist.
+    """
+    name = next(iter(command))
+    collection = command[name]
+    namespace = f'{database}.{collection}'
+    indexes = indexes_of(collection)
+    if name == 'find':
+        planner = _query_planner(namespace, indexes, command.get('filter'), command.get('sort'))
+        if command.get('limit') and planner['winningPlan']['stage'] != 'EOF':
+            planner['winningPlan'] = {'stage': 'LIMIT', 'limitAmount': command['limit'],
+                                      'inputStage': planner['winningPlan']}
+        return {'queryPlanner': planner, 'ok': 1.0}
+    if name == 'count':
+        planner = _query_planner(namespace, indexes, command.get('query'))
+        planner['winningPlan'] = {'stage': 'COUNT', 'inputStage': planner['winningPlan']}
+        return {'queryPlanner': planner, 'ok': 1.0}
+    if name in ('update', 'delete'):
+        statement = command[f'{name}s'][0]
+        planner = _query_planner(namespace, indexes, statement.get('q'))
+        planner['winningPlan'] = {'stage': name.upper(), 'inputStage': planner['winningPlan']}
+        return {'queryPlanner': planner, 'ok': 1.0}
+    if name == 'aggregate':
+        pipeline = list(command.get('pipeline') or [])
+        query = pipeline.pop(0)['$match'] if pipeline and '$match' in pipeline[0] else {}
+        # A $sort right after the leading $match is pushed into the query, as the server does
+        sort = pipeline.pop(0)['$sort'] if pipeline and '$sort' in pipeline[0] else None
+        planner = _query_planner(namespace, indexes, query, sort)
+        if not pipeline:
+            return {'queryPlanner': planner, 'ok': 1.0}
+        return {'stages': [{'$cursor': {'queryPlanner': planner}}] + pipeline, 'ok': 1.0}
+    raise OperationFailure(f"Cannot explain '{name}' on the memory storage engine", 59)
@@ -0,0 +1,757 @@
+"""
+Query language of the in-memory storage engine.
+
+The subset of MongoDB filters, projections, sorts, update operators (including
+pipeline updates), aggregation expressions and aggregation stages that the
+models and services use. Anything outside it raises `OperationFailure`, so a
+new query shape fails loudly under the memory backend instead of silently
+matching nothing.
+"""
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+# A path that resolves to nothing (distinct from a stored null)
+MISSING = type('Missing', (), {'__repr__': lambda self: 'MISSING'})()
+
+
+def copy_document(value: Any) -> Any:
+    """Copy of a BSON-like value (dicts and lists are copied, scalars are immutable)"""
+    if isinstance(value, dict):
+        return {key: copy_document(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_document(item) for item in value]
+    return value
+
+
+# ---------------------------------------------------------------------------
+# Values: ordering and equality across BSON types
+
+def _bracket(value: Any) -> int:
+    if value is None or value is MISSING:
+        return 1
+    if isinstance(value, bool):
+        return 8
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, str):
+        return 3
+    if isinstance(value, dict):
+        return 4
+    if isinstance(value, list):
+        return 5
+    if isinstance(value, bytes):
+        return 6
+    if isinstance(value, ObjectId):
+        return 7
+    if isinstance(value, datetime):
+        return 9
+    return 10
+
+
+def sort_key(value: Any) -> Tuple:
+    """Total order over values following MongoDB's comparison order of types"""
+    bracket = _bracket(value)
+    if bracket == 1:
+        return (1, 0)
+    if bracket == 4:
+        return (4, tuple((key, sort_key(item)) for key, item in value.items()))
+    if bracket == 5:
+        return (5, tuple(sort_key(item) for item in value))
+    if bracket == 7:
+        return (7, value.binary)
+    if bracket == 10:
+        return (10, str(value))
+    return (bracket, value)
+
+
+def values_equal(left: Any, right: Any) -> bool:
+    if left is MISSING:
+        left = None
+    if right is MISSING:
+        right = None
+    return _bracket(left) == _bracket(right) and left == right
+
+
+# ---------------------------------------------------------------------------
+# Paths
+
+def get_path(document: Any, path: str) -> Any:
+    """Value at a dotted path without array traversal (MISSING when absent)"""
+    value = document
+    for part in path.split('.'):
+        if isinstance(value, dict):
+            value = value.get(part, MISSING)
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return MISSING
+        if value is MISSING:
+            return MISSING
+    return value
+
+
+def resolve(value: Any, parts: Sequence[str]) -> List[Any]:
+    """Candidate values of a dotted path for matching: arrays of documents are traversed element-wise"""
+    if not parts:
+        return [value]
+    head, rest = parts[0], parts[1:]
+    if isinstance(value, dict):
+        return resolve(value[head], rest) if head in value else [MISSING]
+    if isinstance(value, list):
+        if head.isdigit():
+            index = int(head)
+            return resolve(value[index], rest) if index < len(value) else [MISSING]
+        found = [candidate for item in value if isinstance(item, dict)
+                 for candidate in resolve(item, parts) if candidate is not MISSING]
+        return found or [MISSING]
+    return [MISSING]
+
+
+def set_path(document: Dict[str, Any], path: str, value: Any):
+    parts = path.split('.')
+    target = document
+    for part in parts[:-1]:
+        if isinstance(target, list) and part.isdigit():
+            target = target[int(part)]
+            continue
+        nested = target.get(part, MISSING)
+        if not isinstance(nested, (dict, list)):
+            nested = target[part] = {}
+        target = nested
+    last = parts[-1]
+    if isinstance(target, list) and last.isdigit():
+        index = int(last)
+        target.extend([None] * (index + 1 - len(target)))
+        target[index] = value
+    elif isinstance(target, dict):
+        target[last] = value
+    else:
+        raise OperationFailure(f"Cannot create field '{last}' in {type(target).__name__}")
+
+
+def unset_path(document: Dict[str, Any], path: str) -> bool:
+    parts = path.split('.')
+    target = get_path(document, '.'.join(parts[:-1])) if len(parts) > 1 else document
+    if isinstance(target, dict) and parts[-1] in target:
+        del target[parts[-1]]
+        return True
+    if isinstance(target, list) and parts[-1].isdigit() and int(parts[-1]) < len(target):
+        target[int(parts[-1])] = None
+        return True
+    return False
+
+
+# ---------------------------------------------------------------------------
+# Filters
+
+def _regex(pattern: Any, options: str = '') -> 're.Pattern':
+    if isinstance(pattern, re.Pattern):
+        return pattern
+    flags = 0
+    for option, flag in (('i', re.IGNORECASE), ('m', re.MULTILINE), ('s', re.DOTALL), ('x', re.VERBOSE)):
+        if option in (options or ''):
+            flags |= flag
+    return re.compile(pattern, flags)
+
+
+def _expand(candidates: List[Any]) -> List[Any]:
+    """Arrays match both as a whole and through each of their elements"""
+    expanded = []
+    for value in candidates:
+        expanded.append(value)
+        if isinstance(value, list):
+            expanded.extend(value)
+    return expanded
+
+
+def _compare(candidates: List[Any], operand: Any, test) -> bool:
+    bracket = _bracket(operand)
+    return any(_bracket(value) == bracket and value is not MISSING and test(sort_key(value), sort_key(operand))
+               for value in _expand(candidates))
+
+
+def _equals_any(candidates: List[Any], operand: Any) -> bool:
+    if isinstance(operand, re.Pattern):
+        return any(isinstance(value, str) and operand.search(value) for value in _expand(candidates))
+    return any(values_equal(value, operand) for value in _expand(candidates))
+
+
+def _match_operators(candidates: List[Any], condition: Dict[str, Any]) -> bool:
+    for operator, operand in condition.items():
+        if operator == '$eq':
+            matched = _equals_any(candidates, operand)
+        elif operator == '$ne':
+            matched = not _equals_any(candidates, operand)
+        elif operator == '$gt':
+            matched = _compare(candidates, operand, lambda a, b: a > b)
+        elif operator == '$gte':
+            matched = _compare(candidates, operand, lambda a, b: a >= b)
+        elif operator == '$lt':
+            matched = _compare(candidates, operand, lambda a, b: a < b)
+        elif operator == '$lte':
+            matched = _compare(candidates, operand, lambda a, b: a <= b)
+        elif operator == '$in':
+            matched = any(_equals_any(candidates, item) for item in operand)
+        elif operator == '$nin':
+            matched = not any(_equals_any(candidates, item) for item in operand)
+        elif operator == '$exists':
+            matched = any(value is not MISSING for value in candidates) == bool(operand)
+        elif operator == '$regex':
+            pattern = _regex(operand, condition.get('$options', ''))
+            matched = any(isinstance(value, str) and pattern.search(value) for value in _expand(candidates))
+        elif operator == '$options':
+            continue
+        elif operator == '$not':
+            matched = not (_equals_any(candidates, operand) if isinstance(operand, re.Pattern)
+                           else _match_operators(candidates, operand))
+        elif operator == '$size':
+            matched = any(isinstance(value, list) and len(value) == operand for value in candidates)
+        elif operator == '$all':
+            matched = all(_equals_any(candidates, item) for item in operand)
+        elif operator == '$elemMatch':
+            matched = any(
+                isinstance(value, list) and any(
+                    (matches(element, operand) if isinstance(element, dict) and not _is_operator_doc(operand)
+                     else _match_operators([element], operand))
+                    for element in value)
+                for value in candidates)
+        else:
+            raise OperationFailure(f'Query operator {operator} is not supported by the memory storage engine')
+        if not matched:
+            return False
+    return True
+
+
+def _is_operator_doc(value: Any) -> bool:
+    return isinstance(value, dict) and bool(value) and all(key.startswith('$') for key in value)
+
+
+def matches(document: Dict[str, Any], query: Optional[Dict[str, Any]]) -> bool:
+    """Whether `document` satisfies a MongoDB filter"""
+    for key, condition in (query or {}).items():
+        if key == '$and':
+            if not all(matches(document, clause) for clause in condition):
+                return False
+        elif key == '$or':
+            if not any(matches(document, clause) for clause in condition):
+                return False
+        elif key == '$nor':
+            if any(matches(document, clause) for clause in condition):
+                return False
+        elif key.startswith('$'):
+            raise OperationFailure(f'Query operator {key} is not supported by the memory storage engine')
+        else:
+            candidates = resolve(document, key.split('.'))
+            if _is_operator_doc(condition):
+                if not _match_operators(candidates, condition):
+                    return False
+            elif not _equals_any(candidates, condition):
+                return False
+    return True
+
+
+def equality_fields(query: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Fields a filter pins to one value (what an upsert inserts)"""
+    fields = {}
+    for key, condition in (query or {}).items():
+        if key == '$and':
+            for clause in condition:
+                fields.update(equality_fields(clause))
+        elif key.startswith('$'):
+            continue
+        elif _is_operator_doc(condition):
+            if '$eq' in condition:
+                fields[key] = condition['$eq']
+        elif not isinstance(condition, re.Pattern):
+            fields[key] = condition
+    return fields
+
+
+# ---------------------------------------------------------------------------
+# Sorting and projection
+
+def normalize_sort(key_or_list: Any, direction: Optional[int] = None) -> List[Tuple[str, int]]:
+    if key_or_list is None:
+        return []
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return [(key, value) for key, value in key_or_list]
+
+
+def sort_documents(documents: List[Dict[str, Any]], spec: List[Tuple[str, int]]) -> List[Dict[str, Any]]:
+    """Stable multi-key sort; `$natural` keeps (or reverses) insertion order"""
+    for key, direction in reversed(spec):
+        if key == '$natural':
+            if direction < 0:
+                documents.reverse()
+            continue
+        descending = direction < 0
+
+        def field_key(document, key=key, descending=descending):
+            value = get_path(document, key)
+            if isinstance(value, list) and value:
+                # Arrays sort by their smallest element ascending, their largest descending
+                keys = [sort_key(item) for item in value]
+                return max(keys) if descending else min(keys)
+            return sort_key(value)
+        documents.sort(key=field_key, reverse=descending)
+    return documents
+
+
+def project(document: Dict[str, Any], projection: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Find-style projection (inclusion or exclusion of dotted paths)"""
+    if not projection:
+        return copy_document(document)
+    if isinstance(projection, (list, tuple)):
+        projection = dict.fromkeys(projection, 1)
+    fields = {key: value for key, value in projection.items() if key != '_id'}
+    for key, value in fields.items():
+        if isinstance(value, dict):
+            raise OperationFailure(f'Projection operator on {key} is not supported by the memory storage engine')
+    include_id = bool(projection.get('_id', 1))
+    if fields and all(fields.values()):
+        projected: Dict[str, Any] = {}
+        if include_id and '_id' in document:
+            projected['_id'] = copy_document(document['_id'])
+        for path in fields:
+            _copy_path(document, projected, path.split('.'))
+        return projected
+    projected = copy_document(document)
+    for path in fields:
+        _remove_path(projected, path.split('.'))
+    if not include_id:
+        projected.pop('_id', None)
+    return projected
+
+
+def _copy_path(source: Any, target: Dict[str, Any], parts: List[str]):
+    head, rest = parts[0], parts[1:]
+    if not isinstance(source, dict) or head not in source:
+        return
+    value = source[head]
+    if not rest:
+        target[head] = copy_document(value)
+    elif isinstance(value, dict):
+        _copy_path(value, target.setdefault(head, {}), rest)
+    elif isinstance(value, list):
+        items = target.setdefault(head, [{} for item in value if isinstance(item, dict)])
+        for item, projected in zip([item for item in value if isinstance(item, dict)], items):
+            _copy_path(item, projected, rest)
+
+
+def _remove_path(target: Any, parts: List[str]):
+    if isinstance(target, list):
+        for item in target:
+            _remove_path(item, parts)
+        return
+    if not isinstance(target, dict) or parts[0] not in target:
+        return
+    if len(parts) == 1:
+        del target[parts[0]]
+    else:
+        _remove_path(target[parts[0]], parts[1:])
+
+
+# ---------------------------------------------------------------------------
+# Aggregation expressions
+
+def _numbers(values: Iterable[Any]) -> List[Any]:
+    return [value for value in values if isinstance(value, (int, float)) and not isinstance(value, bool)]
+
+
+def _subtract(left: Any, right: Any) -> Any:
+    if left is None or right is None:
+        return None
+    if isinstance(left, datetime) and isinstance(right, datetime):
+        return int((left - right) / timedelta(milliseconds=1))
+    if isinstance(left, datetime):
+        return left - timedelta(milliseconds=right)
+    return left - right
+
+
+def _add(values: List[Any]) -> Any:
+    if any(value is None for value in values):
+        return None
+    dates = [value for value in values if isinstance(value, datetime)]
+    total = sum(_numbers(values))
+    if dates:
+        return dates[0] + timedelta(milliseconds=total)
+    return total
+
+
+def _multiply(values: List[Any]) -> Any:
+    if any(value is None for value in values):
+        return None
+    product = 1
+    for value in values:
+        product *= value
+    return product
+
+
+def _extreme(values: List[Any], largest: bool) -> Any:
+    present = [value for value in values if value is not None and value is not MISSING]
+    if not present:
+        return None
+    return (max if largest else min)(present, key=sort_key)
+
+
+def _cmp(operator: str, left: Any, right: Any) -> bool:
+    if operator == '$eq':
+        return values_equal(left, right)
+    if operator == '$ne':
+        return not values_equal(left, right)
+    left_key, right_key = sort_key(None if left is MISSING else left), sort_key(None if right is MISSING else right)
+    return {'$gt': left_key > right_key, '$gte': left_key >= right_key,
+            '$lt': left_key < right_key, '$lte': left_key <= right_key}[operator]
+
+
+def _truthy(value: Any) -> bool:
+    return value not in (None, False, 0) and value is not MISSING
+
+
+def evaluate(expression: Any, document: Dict[str, Any], variables: Dict[str, Any] = None) -> Any:
+    """Value of an aggregation expression against `document` (`$$NOW`, `$$ROOT` and custom variables)"""
+    variables = variables or {}
+    if isinstance(expression, str) and expression.startswith('$$'):
+        name, _, path = expression[2:].partition('.')
+        if name == 'NOW':
+            base = variables.get('NOW') or datetime.utcnow()
+        elif name in ('ROOT', 'CURRENT'):
+            base = document
+        elif name in variables:
+            base = variables[name]
+        else:
+            raise OperationFailure(f'Use of undefined variable: {name}')
+        value = get_path(base, path) if path else base
+        return None if value is MISSING else value
+    if isinstance(expression, str) and expression.startswith('$'):
+        candidates = resolve(document, expression[1:].split('.'))
+        if len(candidates) == 1:
+            return None if candidates[0] is MISSING else candidates[0]
+        return [value for value in candidates if value is not MISSING]
+    if isinstance(expression, list):
+        return [evaluate(item, document, variables) for item in expression]
+    if not isinstance(expression, dict):
+        return expression
+    if len(expression) == 1 and next(iter(expression)).startswith('$'):
+        operator, operand = next(iter(expression.items()))
+        return _operator(operator, operand, document, variables)
+    return {key: evaluate(value, document, variables) for key, value in expression.items()}
+
+
+def _operator(operator: str, operand: Any, document: Dict[str, Any], variables: Dict[str, Any]) -> Any:
+    if operator == '$literal':
+        return operand
+    args = operand if isinstance(operand, list) else [operand]
+    if operator == '$cond':
+        if isinstance(operand, dict):
+            condition, then, otherwise = operand['if'], operand['then'], operand['else']
+        else:
+            condition, then, otherwise = operand
+        chosen = then if _truthy(evaluate(condition, document, variables)) else otherwise
+        return evaluate(chosen, document, variables)
+    if operator == '$ifNull':
+        for item in args:
+            value = evaluate(item, document, variables)
+            if value is not None:
+                return value
+        return None
+    values = [evaluate(item, document, variables) for item in args]
+    if operator == '$add':
+        return _add(values)
+    if operator == '$subtract':
+        return _subtract(values[0], values[1])
+    if operator == '$multiply':
+        return _multiply(values)
+    if operator == '$divide':
+        return None if values[0] is None or values[1] is None else values[0] / values[1]
+    if operator in ('$min', '$max'):
+        items = values[0] if len(values) == 1 and isinstance(values[0], list) else values
+        return _extreme(items, operator == '$max')
+    if operator in ('$sum', '$avg'):
+        items = values[0] if len(values) == 1 and isinstance(values[0], list) else values
+        numbers = _numbers(items)
+        if operator == '$sum':
+            return sum(numbers)
+        return sum(numbers) / len(numbers) if numbers else None
+    if operator in ('$eq', '$ne', '$gt', '$gte', '$lt', '$lte'):
+        return _cmp(operator, values[0], values[1])
+    if operator == '$and':
+        return all(_truthy(value) for value in values)
+    if operator == '$or':
+        return any(_truthy(value) for value in values)
+    if operator == '$not':
+        return not _truthy(values[0])
+    if operator == '$in':
+        return any(values_equal(values[0], item) for item in values[1] or [])
+    if operator == '$size':
+        return len(values[0])
+    if operator == '$arrayElemAt':
+        array, index = values
+        return array[index] if array is not None and -len(array) <= index < len(array) else None
+    if operator == '$concat':
+        return None if any(value is None for value in values) else ''.join(values)
+    if operator == '$toString':
+        value = values[0]
+        return None if value is None else value.isoformat() if isinstance(value, datetime) else str(value)
+    raise OperationFailure(f'Expression operator {operator} is not supported by the memory storage engine')
+
+
+# ---------------------------------------------------------------------------
+# Updates
+
+UPDATE_OPERATORS = ('$set', '$unset', '$inc', '$mul', '$min', '$max', '$push', '$addToSet', '$pull',
+                    '$setOnInsert', '$currentDate')
+
+
+def _each(value: Any) -> List[Any]:
+    if isinstance(value, dict) and '$each' in value:
+        return list(value['$each'])
+    return [value]
+
+
+def apply_update(document: Dict[str, Any], update: Any, inserting: bool = False) -> Dict[str, Any]:
+    """New version of `document` with an update (operators, replacement or pipeline) applied"""
+    if isinstance(update, list):
+        return _apply_pipeline_update(document, update)
+    if not update or not all(key.startswith('$') for key in update):
+        if any(key.startswith('$') for key in update or {}):
+            raise OperationFailure('Update document mixes operators and fields')
+        replaced = copy_document(update)
+        if '_id' in document:
+            replaced['_id'] = document['_id']
+        return replaced
+    updated = copy_document(document)
+    for operator, fields in update.items():
+        if operator not in UPDATE_OPERATORS:
+            raise OperationFailure(f'Update operator {operator} is not supported by the memory storage engine')
+        if operator == '$setOnInsert' and not inserting:
+            continue
+        for path, value in fields.items():
+            if path == '_id' and operator != '$setOnInsert' and not values_equal(value, document.get('_id')):
+                raise OperationFailure("Performing an update on the path '_id' would modify the immutable field '_id'")
+            _apply_operator(updated, operator, path, value)
+    return updated
+
+
+def _apply_operator(document: Dict[str, Any], operator: str, path: str, value: Any):
+    current = get_path(document, path)
+    if operator in ('$set', '$setOnInsert'):
+        set_path(document, path, copy_document(value))
+    elif operator == '$unset':
+        unset_path(document, path)
+    elif operator == '$currentDate':
+        set_path(document, path, datetime.utcnow())
+    elif operator in ('$inc', '$mul'):
+        if current is not MISSING and not _numbers([current]):
+            raise OperationFailure(f"Cannot apply {operator} to a value of non-numeric type at '{path}'")
+        if operator == '$inc':
+            set_path(document, path, (0 if current is MISSING else current) + value)
+        else:
+            set_path(document, path, (0 if current is MISSING else current) * value)
+    elif operator in ('$min', '$max'):
+        if current is MISSING or (sort_key(value) < sort_key(current) if operator == '$min'
+                                  else sort_key(value) > sort_key(current)):
+            set_path(document, path, copy_document(value))
+    elif operator in ('$push', '$addToSet', '$pull'):
+        if current is MISSING:
+            if operator == '$pull':
+                return
+            current = []
+            set_path(document, path, current)
+        if not isinstance(current, list):
+            raise OperationFailure(f"The field '{path}' must be an array")
+        if operator == '$push':
+            current.extend(copy_document(item) for item in _each(value))
+        elif operator == '$addToSet':
+            for item in _each(value):
+                if not any(values_equal(existing, item) for existing in current):
+                    current.append(copy_document(item))
+        else:
+            keep = [item for item in current if not (
+                matches(item, value) if isinstance(value, dict) and isinstance(item, dict) and not _is_operator_doc(value)
+                else _match_operators([item], value) if _is_operator_doc(value)
+                else values_equal(item, value))]
+            current[:] = keep
+
+
+def _apply_pipeline_update(document: Dict[str, Any], pipeline: List[Dict[str, Any]]) -> Dict[str, Any]:
+    variables = {'NOW': datetime.utcnow()}
+    updated = copy_document(document)
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        if name in ('$set', '$addFields'):
+            updated = _add_fields(updated, spec, variables)
+        elif name in ('$unset', '$project'):
+            updated = _project_stage(updated, {field: 0 for field in _each_field(spec)} if name == '$unset' else spec,
+                                     variables)
+        else:
+            raise OperationFailure(f'Update pipeline stage {name} is not supported by the memory storage engine')
+    if '_id' in document:
+        updated['_id'] = document['_id']
+    return updated
+
+
+def _each_field(spec: Any) -> List[str]:
+    return [spec] if isinstance(spec, str) else list(spec)
+
+
+# ---------------------------------------------------------------------------
+# Aggregation stages
+
+def _add_fields(document: Dict[str, Any], spec: Dict[str, Any], variables: Dict[str, Any]) -> Dict[str, Any]:
+    updated = copy_document(document)
+    # Every expression of one stage sees the document as it entered the stage
+    values = {path: evaluate(expression, document, variables) for path, expression in spec.items()}
+    for path, value in values.items():
+        set_path(updated, path, value)
+    return updated
+
+
+def _project_stage(document: Dict[str, Any], spec: Dict[str, Any], variables: Dict[str, Any]) -> Dict[str, Any]:
+    fields = {key: value for key, value in spec.items() if key != '_id'}
+    excluding = bool(fields) and all(value in (0, False) and not isinstance(value, dict) for value in fields.values())
+    if excluding:
+        projected = copy_document(document)
+        for path in fields:
+            _remove_path(projected, path.split('.'))
+        if spec.get('_id', 1) in (0, False):
+            projected.pop('_id', None)
+        return projected
+    projected: Dict[str, Any] = {}
+    id_spec = spec.get('_id', 1)
+    if id_spec is True or id_spec == 1:
+        if '_id' in document:
+            projected['_id'] = copy_document(document['_id'])
+    elif id_spec not in (0, False):
+        projected['_id'] = evaluate(id_spec, document, variables)
+    for path, value in fields.items():
+        if value is True or (value == 1 and not isinstance(value, bool) and isinstance(value, int)):
+            _copy_path(document, projected, path.split('.'))
+        elif value in (0, False):
+            raise OperationFailure(f'Cannot exclude {path} in an inclusion projection')
+        else:
+            result = evaluate(value, document, variables)
+            if result is not None or not (isinstance(value, str) and value.startswith('$')):
+                set_path(projected, path, result)
+    return projected
+
+
+def _unwind(documents: Iterable[Dict[str, Any]], spec: Any) -> Iterator[Dict[str, Any]]:
+    options = spec if isinstance(spec, dict) else {'path': spec}
+    path = options['path'][1:]
+    keep_empty = options.get('preserveNullAndEmptyArrays', False)
+    for document in documents:
+        value = get_path(document, path)
+        if isinstance(value, list) and value:
+            for item in value:
+                unwound = dict(document)
+                unwound = copy_document(unwound)
+                set_path(unwound, path, copy_document(item))
+                yield unwound
+        elif isinstance(value, list) or value is MISSING or value is None:
+            if keep_empty:
+                unwound = copy_document(document)
+                if isinstance(value, list):
+                    unset_path(unwound, path)
+                yield unwound
+        else:
+            yield document
+
+
+class _Accumulator:
+    def __init__(self, operator: str):
+        self.operator = operator
+        self.values: List[Any] = []
+        self.first = MISSING
+
+    def add(self, value: Any):
+        if self.operator == '$first':
+            if self.first is MISSING:
+                self.first = value
+        else:
+            self.values.append(value)
+
+    def result(self) -> Any:
+        operator, values = self.operator, self.values
+        if operator == '$first':
+            return None if self.first is MISSING else self.first
+        if operator == '$last':
+            return values[-1] if values else None
+        if operator == '$sum':
+            return sum(_numbers(values))
+        if operator == '$avg':
+            numbers = _numbers(values)
+            return sum(numbers) / len(numbers) if numbers else None
+        if operator in ('$min', '$max'):
+            return _extreme(values, operator == '$max')
+        if operator == '$push':
+            return values
+        if operator == '$addToSet':
+            unique: List[Any] = []
+            for value in values:
+                if not any(values_equal(value, seen) for seen in unique):
+                    unique.append(value)
+            return unique
+        raise OperationFailure(f'Accumulator {operator} is not supported by the memory storage engine')
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, dict):
+        return ('d', tuple((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, list):
+        return ('l', tuple(_freeze(item) for item in value))
+    return (_bracket(value), value)
+
+
+def _group(documents: Iterable[Dict[str, Any]], spec: Dict[str, Any], variables: Dict[str, Any]):
+    groups: Dict[Any, Tuple[Any, Dict[str, _Accumulator]]] = {}
+    for document in documents:
+        key = evaluate(spec['_id'], document, variables)
+        frozen = _freeze(key)
+        if frozen not in groups:
+            groups[frozen] = (key, {field: _Accumulator(next(iter(accumulator)))
+                                    for field, accumulator in spec.items() if field != '_id'})
+        for field, accumulator in spec.items():
+            if field != '_id':
+                (_, expression), = accumulator.items()
+                groups[frozen][1][field].add(evaluate(expression, document, variables))
+    for key, accumulators in groups.values():
+        yield dict({'_id': key}, **{field: accumulator.result() for field, accumulator in accumulators.items()})
+
+
+def aggregate(documents: Iterable[Dict[str, Any]], pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Run an aggregation pipeline over documents (which are not modified)"""
+    variables = {'NOW': datetime.utcnow()}
+    results: Iterable[Dict[str, Any]] = documents
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        if name == '$match':
+            results = [document for document in results if matches(document, spec)]
+        elif name == '$project':
+            results = [_project_stage(document, spec, variables) for document in results]
+        elif name in ('$set', '$addFields'):
+            results = [_add_fields(document, spec, variables) for document in results]
+        elif name == '$unset':
+            results = [_project_stage(document, {field: 0 for field in _each_field(spec)}, variables)
+                       for document in results]
+        elif name == '$sort':
+            results = sort_documents(list(results), normalize_sort(spec))
+        elif name == '$skip':
+            results = list(results)[spec:]
+        elif name == '$limit':
+            results = list(results)[:spec]
+        elif name == '$unwind':
+            results = list(_unwind(results, spec))
+        elif name == '$group':
+            results = list(_group(results, spec, variables))
+        elif name == '$count':
+            results = [{spec: len(list(results))}]
+        else:
+            raise OperationFailure(f'Aggregation stage {name} is not supported by the memory storage engine')
+    return [copy_document(document) for document in results]
@@ -0,0 +1,72 @@
+"""
+Fixtures for the test suite: the `testing` app on the embedded memory engine, no MongoDB needed.
+"""
+import os
+import uuid
+
+# Set before the config module is imported; importing backend.app also builds the default app
+os.environ.setdefault('SECRET_KEY', 'test-secret-key-of-at-least-32-bytes')
+os.environ.setdefault('JWT_SECRET_KEY', 'test-jwt-secret-key-of-at-least-32-bytes')
+os.environ.setdefault('ADMIN_TOKEN', 'test-admin-token')
+os.environ.setdefault('STORAGE_BACKEND', 'memory')
+os.environ.setdefault('STORAGE_MEMORY_PATH', '')
+os.environ.setdefault('LOG_ASYNC', 'False')
+
+import pytest
+
+from backend.storage import MemoryClient
+
+PASSWORD = 'password123'
+
+
+@pytest.fixture(scope='session')
+def app():
+    from backend.app import create_app
+    from backend.commands import init_db
+
+    app = create_app('testing')
+    with app.app_context():
+        init_db()
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def _register(client, game_id, name=None):
+    response = client.post('/api/teams/register', headers={'X-Game-Id': game_id},
+                           json={'name': name or f'team-{uuid.uuid4().hex[:8]}', 'password': PASSWORD})
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()
+
+
+@pytest.fixture
+def register_team(client):
+    """Register a team in a game; returns the registration response body"""
+    return lambda game_id, name=None: _register(client, game_id, name)
+
+
+@pytest.fixture(scope='session')
+def admin_headers(app):
+    """Headers of an admin request: a team token of the default game plus the admin token"""
+    from backend.utils.constants import DEFAULT_GAME_ID
+
+    team = _register(app.test_client(), DEFAULT_GAME_ID, name='test-admin')
+    return {'Authorization': f"Bearer {team['access_token']}", 'X-Admin-Token': os.environ['ADMIN_TOKEN']}
+
+
+@pytest.fixture
+def game_id(client, admin_headers):
+    """A freshly provisioned game, so tests never share teams, pages or game state"""
+    game_id = f'test-{uuid.uuid4().hex[:12]}'
+    response = client.post('/api/admin/games', headers=admin_headers, json={'game_id': game_id})
+    assert response.status_code == 201, response.get_json()
+    return game_id
+
+
+@pytest.fixture
+def db():
+    """An empty database on its own memory engine"""
+    return MemoryClient()['test']
@@ -0,0 +1,27 @@
+"""
+The admin token: constant-time checks that never fail on unexpected input.
+"""
+import pytest
+
+
+def bearer(team, **extra):
+    return {'Authorization': f"Bearer {team['access_token']}", **extra}
+
+
+@pytest.mark.parametrize('token', ['tökén', 'wrong', ''])
+def test_bad_admin_token_is_refused_not_an_error(client, game_id, register_team, token):
+    team = register_team(game_id)
+    assert client.get('/api/game/status', headers=bearer(team, **{'X-Admin-Token': token})).status_code == 200
+    assert client.get('/api/admin/stats', headers=bearer(team, **{'X-Admin-Token': token})).status_code == 403
+
+
+def test_request_profiling_needs_the_admin_token(client, admin_headers, game_id):
+    headers = {**admin_headers, 'X-Game-Id': game_id, 'X-Profile': 'cprofile'}
+    profiled = client.get('/api/game/status', headers=headers)
+    assert profiled.status_code == 200
+    assert profiled.headers['X-Profiled-Status'] == '200'
+    assert 'function calls' in profiled.get_data(as_text=True)
+
+    for token in ('tökén', 'wrong'):
+        plain = client.get('/api/game/status', headers={**headers, 'X-Admin-Token': token})
+        assert 'X-Profiled-Status' not in plain.headers
@@ -0,0 +1,43 @@
+"""
+Reset epochs: progress of an older epoch rolls over on write, without waiting for the background sweep.
+"""
+import pytest
+
+from backend.models.epoch import identity_query
+from backend.models.page import SOLVE_STATE_DEFAULTS
+
+
+@pytest.fixture
+def no_sweep(monkeypatch):
+    """Stale documents are only rolled over by the writes under test"""
+    monkeypatch.setattr('backend.models.game_state.schedule_sweep', lambda *args: None)
+
+
+def bearer(team):
+    return {'Authorization': f"Bearer {team['access_token']}"}
+
+
+def test_page_solved_in_an_earlier_epoch_can_be_solved_again(client, admin_headers, game_id, register_team, no_sweep):
+    team = register_team(game_id)
+    admin = {**admin_headers, 'X-Game-Id': game_id}
+
+    assert client.post('/api/game/start', headers=admin).status_code == 200
+    assert client.post('/api/game/solve', headers=bearer(team), json={'answer': 'MAP'}).status_code == 200
+
+    assert client.post('/api/game/reset', headers=admin).status_code == 200
+    assert client.post('/api/game/start', headers=admin).status_code == 200
+    response = client.post('/api/game/solve', headers=bearer(team), json={'answer': 'MAP'})
+    assert response.status_code == 200, response.get_json()
+    # A page still solved in the current epoch keeps refusing a second solver
+    client.post('/api/admin/game/page/1', headers=admin)
+    response = client.post('/api/game/solve', headers=bearer(register_team(game_id)), json={'answer': 'MAP'})
+    assert response.status_code == 409
+
+    epochs = client.get('/api/admin/epochs/0', headers=admin).get_json()
+    assert 'MAP' in str(epochs)
+
+
+def test_identity_query_drops_progress_conditions():
+    query = {'game_id': 'g1', 'number': 1, 'is_solved': False, 'solved_by.code': 'X',
+             '$and': [{'_id': 5}, {'solved_at': None}], '$or': [{'is_solved': True}]}
+    assert identity_query(query, SOLVE_STATE_DEFAULTS) == {'game_id': 'g1', 'number': 1, '_id': 5}
@@ -0,0 +1,28 @@
+"""
+Spectator event rings: waiting streams must let other greenlets run and wake on publish from any thread.
+"""
+import threading
+import time
+
+import gevent
+
+from backend.services.event_stream import EventRing
+
+
+def test_event_ring_wakes_waiting_greenlets():
+    ring = EventRing(8)
+    waiters = [gevent.spawn(ring.wait, 0, 2.0) for _ in range(2)]
+    publisher = gevent.spawn_later(0.05, ring.publish, 'page_solved', '{}')
+    started = time.monotonic()
+    gevent.joinall(waiters + [publisher], timeout=5)
+    assert [waiter.value for waiter in waiters] == [True, True]
+    assert time.monotonic() - started < 1.0
+    assert ring.wait(1, 0.01) is False
+
+
+def test_event_ring_wakes_a_greenlet_from_a_native_thread():
+    ring = EventRing(8)
+    waiter = gevent.spawn(ring.wait, 0, 2.0)
+    gevent.sleep(0)
+    threading.Timer(0.05, ring.publish, ('advance_page', '{}')).start()
+    assert waiter.get(timeout=5) is True
@@ -0,0 +1,54 @@
+"""
+The single-writer game engine: reloads never race pending persists, and timed-out commands do not run late.
+"""
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import pytest
+
+from backend.database import db_manager
+from backend.models.page import Page, get_page_table
+from backend.services.game_engine import GameEngine
+
+
+@pytest.fixture
+def engine(app, game_id, tmp_path):
+    engine = GameEngine(db_manager, get_page_table(Page(db_manager, game_id)), str(tmp_path / 'engine.journal'),
+                        fsync=False, game_id=game_id)
+    engine.start()
+    yield engine
+    engine.stop()
+
+
+def test_reload_picks_up_changes_made_outside_the_engine(engine, game_id):
+    db_manager.get_collection('game_state').update_one({'game_id': game_id, 'type': 'current'},
+                                                       {'$set': {'current_page': 4}})
+    assert engine.execute('reload').status == 200
+    assert engine.status_snapshot()['current_page'] == 4
+
+
+def test_reload_is_aborted_while_writes_are_unpersisted(engine, game_id, monkeypatch):
+    assert engine.execute('start_game').status == 200
+    seq = engine.version
+    db_manager.get_collection('game_state').update_one({'game_id': game_id, 'type': 'current'},
+                                                       {'$set': {'current_page': 4}})
+    monkeypatch.setattr(engine, 'flush', lambda timeout=5.0: False)
+
+    result = engine.execute('reload')
+    assert result.status == 503
+    assert engine.version == seq
+    assert engine.status_snapshot()['current_page'] == 1
+
+
+def test_command_still_queued_at_timeout_never_runs(engine):
+    # Holding the engine lock stalls the writer on the first command; the second waits in the queue
+    with engine._lock:
+        first = threading.Thread(target=engine.execute, args=('start_game',))
+        first.start()
+        with pytest.raises(FutureTimeoutError):
+            engine.execute('reset_game', timeout=0.2)
+    first.join(5)
+    assert engine.flush()
+    assert engine.status_snapshot()['game_status'] == 'in_progress'
+    assert engine.execute('reload').status == 200
+    assert engine.status_snapshot()['game_status'] == 'in_progress'
@@ -0,0 +1,81 @@
+"""
+Register -> solve -> leaderboard through the HTTP API of the `testing` app.
+"""
+
+
+def bearer(team):
+    return {'Authorization': f"Bearer {team['access_token']}"}
+
+
+def start_game(client, admin_headers, game_id):
+    response = client.post('/api/game/start', headers={**admin_headers, 'X-Game-Id': game_id})
+    assert response.status_code == 200, response.get_json()
+
+
+def test_register_solve_leaderboard(client, admin_headers, game_id, register_team):
+    solver = register_team(game_id, name='Solvers')
+    other = register_team(game_id, name='Others')
+
+    profile = client.get('/api/teams/profile', headers=bearer(solver))
+    assert profile.status_code == 200
+    assert profile.get_json()['code'] == solver['team_code']
+
+    # Answers are refused until the game starts
+    response = client.post('/api/game/solve', headers=bearer(solver), json={'answer': 'MAP'})
+    assert response.status_code == 400
+    start_game(client, admin_headers, game_id)
+
+    response = client.post('/api/game/solve', headers=bearer(other), json={'answer': 'WRONG'})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Incorrect answer'
+
+    response = client.post('/api/game/solve', headers=bearer(solver), json={'answer': 'map'})
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()['first_solver'] is True
+
+    status = client.get('/api/game/status', headers=bearer(other)).get_json()
+    assert status['current_page'] == 2
+
+    response = client.get('/api/leaderboard', headers=bearer(other))
+    assert response.status_code == 200
+    rankings = response.get_json()['rankings']
+    assert [team['name'] for team in rankings] == ['Solvers', 'Others']
+    assert [team['NOMs'] for team in rankings] == [1, 0]
+
+
+def test_login_returns_a_working_token(client, game_id, register_team):
+    team = register_team(game_id)
+    response = client.post('/api/teams/login', headers={'X-Game-Id': game_id},
+                           json={'team_code': team['team_code'], 'password': 'password123'})
+    assert response.status_code == 200, response.get_json()
+    assert client.get('/api/teams/profile', headers=bearer(response.get_json())).status_code == 200
+
+    response = client.post('/api/teams/login', headers={'X-Game-Id': game_id},
+                           json={'team_code': team['team_code'], 'password': 'wrong-password1'})
+    assert response.status_code == 401
+
+
+def test_games_are_isolated(client, admin_headers, game_id, register_team):
+    register_team(game_id, name='Solo')
+    leaderboard = client.get('/api/admin/leaderboard', headers={**admin_headers, 'X-Game-Id': game_id})
+    assert leaderboard.status_code == 200
+    assert 'Solo' in leaderboard.get_data(as_text=True)
+
+    # Names are unique per game, not across games
+    response = client.post('/api/teams/register', headers={'X-Game-Id': game_id},
+                           json={'name': 'Solo', 'password': 'password123'})
+    assert response.status_code == 400
+
+
+def test_unknown_game_is_rejected(client):
+    response = client.post('/api/teams/register', headers={'X-Game-Id': 'no-such-game'},
+                           json={'name': 'Lost', 'password': 'password123'})
+    assert response.status_code == 404
+
+
+def test_non_ascii_answer_is_just_wrong(client, admin_headers, game_id, register_team):
+    team = register_team(game_id)
+    start_game(client, admin_headers, game_id)
+    response = client.post('/api/game/solve', headers=bearer(team), json={'answer': 'CAFÉ'})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Incorrect answer'
@@ -0,0 +1,86 @@
+"""
+Index coverage: every query shape the app issues must be served by an index (see `flask check-indexes`).
+
+Plans come from the memory engine's `explain`, which applies MongoDB's index selection rules. Its planner ranks
+candidates instead of racing them, so agreement with it is only the offline fallback: with `TEST_MONGODB_URI` set
+the same check also runs against that server.
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+from backend.services.index_check import RecordedQuery, check_indexes, check_plan
+
+
+def test_every_query_shape_uses_an_index(app):
+    from backend.database import db_manager
+
+    with app.app_context():
+        results = check_indexes(app, db_manager)
+    # The workload must actually have reached the models, or the check proves nothing
+    assert {result.key.split('.')[0] for result in results} >= {'teams', 'pages', 'game_state'}
+    failing = [f"{result.key}: {result.error or result.plan_summary}" for result in results if not result.ok]
+    assert not failing, 'Queries without a usable index:\n' + '\n'.join(failing)
+
+
+@pytest.mark.skipif(not os.environ.get('TEST_MONGODB_URI'), reason='TEST_MONGODB_URI is not set')
+def test_every_query_shape_uses_an_index_on_mongodb():
+    # A separate process: the storage backend is chosen once per process (the db_manager and engines are global)
+    package_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = dict(os.environ, STORAGE_BACKEND='mongo', MONGODB_URI=os.environ['TEST_MONGODB_URI'],
+               PYTHONPATH=os.pathsep.join(filter(None, [package_root, os.environ.get('PYTHONPATH')])))
+    result = subprocess.run([sys.executable, '-m', 'flask', '--app', 'backend.app', 'check-indexes'], env=env,
+                            cwd=package_root, capture_output=True, text=True, timeout=300)
+    output = result.stdout + result.stderr
+    assert result.returncode == 0, output
+    # As offline: the workload must have reached the models
+    for collection in ('teams', 'pages', 'game_state'):
+        assert f'OK   {collection}.' in result.stdout, output
+    assert ', 0 failing' in result.stdout, output
+
+
+@pytest.fixture
+def teams(db):
+    collection = db['teams']
+    collection.insert_one({'game_id': 'g1', 'code': 'AAAA', 'name': 'Alpha'})
+    collection.create_index([('game_id', 1), ('code', 1)], unique=True)
+    collection.create_index([('game_id', 1), ('created_at', -1)])
+    return collection
+
+
+def plan(db, operation, query, **details):
+    return check_plan(db, RecordedQuery('teams', operation, query, details))
+
+
+@pytest.mark.parametrize('operation, query, details, index', [
+    ('find_one', {'game_id': 'g1', 'code': 'AAAA'}, {}, 'game_id_1_code_1'),
+    ('find', {'game_id': 'g1'}, {'sort': [('created_at', -1)]}, 'game_id_1_created_at_-1'),
+    ('find', {'game_id': 'g1'}, {'sort': [('created_at', 1)]}, 'game_id_1_created_at_-1'),
+    ('find', {'game_id': {'$in': ['g1', 'g2']}, 'name': {'$ne': 'x'}}, {}, 'game_id_1_code_1'),
+    ('count', {'$or': [{'game_id': 'g1'}, {'_id': 1}]}, {}, 'game_id_1_code_1'),
+    ('update_one', {'game_id': 'g1', 'code': {'$gte': 'A'}}, {'update': {'$set': {'x': 1}}}, 'game_id_1_code_1'),
+    ('delete_many', {'game_id': 'g1'}, {}, 'game_id_1_code_1'),
+    ('aggregate', {}, {'pipeline': [{'$match': {'game_id': 'g1'}}, {'$sort': {'created_at': -1}},
+                                    {'$limit': 5}]}, 'game_id_1_created_at_-1'),
+])
+def test_indexed_plans_pass(db, teams, operation, query, details, index):
+    result = plan(db, operation, query, **details)
+    assert result.ok, result
+    assert index in result.indexes
+
+
+@pytest.mark.parametrize('operation, query, details, failure', [
+    ('find', {'name': 'Alpha'}, {}, 'COLLSCAN'),
+    ('find', {'game_id': {'$ne': 'g1'}}, {}, 'COLLSCAN'),
+    ('count', {'$or': [{'game_id': 'g1'}, {'name': 'Alpha'}]}, {}, 'COLLSCAN'),
+    ('find', {'game_id': 'g1'}, {'sort': [('name', 1)]}, 'SORT'),
+    ('find', {'game_id': {'$gt': 'a'}}, {'sort': [('created_at', -1)]}, 'SORT'),
+    ('update_many', {'code': 'AAAA'}, {'update': {'$set': {'x': 1}}}, 'COLLSCAN'),
+    ('aggregate', {}, {'pipeline': [{'$group': {'_id': '$game_id'}}]}, 'COLLSCAN'),
+])
+def test_unindexed_plans_fail(db, teams, operation, query, details, failure):
+    result = plan(db, operation, query, **details)
+    assert not result.ok
+    assert failure in result.failures
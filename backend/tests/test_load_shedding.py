@@ -0,0 +1,71 @@
+"""
+The admission queue under gevent, which the server does not monkey-patch: queued requests must let others run.
+"""
+import threading
+import time
+
+import gevent
+
+from backend.middleware.load_shedding import AdmissionController
+from backend.utils.cooperative import Condition
+
+
+def controller(queue_timeout=2.0):
+    return AdmissionController(10, {'gameplay': {'concurrency': 1, 'priority': 1, 'queue_timeout': queue_timeout}})
+
+
+def test_queued_requests_are_admitted_as_greenlets_release():
+    admission = controller()
+    log = []
+
+    def request(name, hold):
+        admitted = admission.acquire('gameplay')
+        log.append((name, admitted))
+        if admitted:
+            gevent.sleep(hold)
+            admission.release('gameplay')
+
+    started = time.monotonic()
+    gevent.joinall([gevent.spawn(request, 'first', 0.05), gevent.spawn(request, 'second', 0.05),
+                    gevent.spawn(request, 'third', 0.05)], timeout=5)
+    assert log == [('first', True), ('second', True), ('third', True)]
+    assert time.monotonic() - started < 1.0
+    assert admission.snapshot()['gameplay'] == {'inflight': 0, 'waiting': 0, 'shed': 0}
+
+
+def test_queued_greenlet_is_shed_at_its_deadline_without_stalling_others():
+    admission = controller(queue_timeout=0.1)
+    assert admission.acquire('gameplay')
+    ticks = []
+
+    def ticker():
+        for _ in range(5):
+            ticks.append(time.monotonic())
+            gevent.sleep(0.01)
+
+    waiter = gevent.spawn(admission.acquire, 'gameplay')
+    gevent.joinall([waiter, gevent.spawn(ticker)], timeout=5)
+    assert waiter.value is False
+    assert len(ticks) == 5 and ticks[-1] - ticks[0] < 0.1
+    assert admission.snapshot()['gameplay']['shed'] == 1
+
+
+def test_condition_between_native_threads():
+    condition = Condition()
+    state = {'ready': False}
+    results = []
+
+    def wait():
+        with condition:
+            results.append(condition.wait_for(lambda: state['ready'], 2.0))
+
+    threads = [threading.Thread(target=wait) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    with condition:
+        state['ready'] = True
+        condition.notify_all()
+    for thread in threads:
+        thread.join(5)
+    assert results == [True, True]
@@ -0,0 +1,265 @@
+"""
+The embedded memory engine against the MongoDB behaviour the app relies on.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+
+@pytest.fixture
+def teams(db):
+    collection = db['teams']
+    collection.insert_many([
+        {'_id': 1, 'name': 'Alpha', 'NOMs': 3, 'solved_pages': [1, 2, 5], 'tags': ['fast', 'red'],
+         'word_guesses': [{'word': 'HOUSE', 'greens': 2}], 'game_id': 'g1'},
+        {'_id': 2, 'name': 'Bravo', 'NOMs': 1, 'solved_pages': [3], 'tags': ['red'],
+         'word_guesses': [{'word': 'POWER', 'greens': 5}, {'word': 'HOUSE', 'greens': 1}], 'game_id': 'g1'},
+        {'_id': 3, 'name': 'charlie', 'NOMs': 0, 'solved_pages': [], 'tags': [], 'game_id': 'g2', 'retired': True},
+        {'_id': 4, 'name': 'Delta', 'NOMs': None, 'game_id': 'g2'},
+    ])
+    return collection
+
+
+def ids(cursor):
+    return sorted(document['_id'] for document in cursor)
+
+
+@pytest.mark.parametrize('query, expected', [
+    ({}, [1, 2, 3, 4]),
+    ({'name': 'Alpha'}, [1]),
+    ({'NOMs': {'$eq': 1}}, [2]),
+    ({'NOMs': {'$ne': 1}}, [1, 3, 4]),
+    ({'NOMs': {'$gt': 0}}, [1, 2]),
+    ({'NOMs': {'$gte': 1}}, [1, 2]),
+    ({'NOMs': {'$lt': 1}}, [3]),
+    ({'NOMs': {'$lte': 1}}, [2, 3]),
+    ({'NOMs': None}, [4]),
+    ({'NOMs': {'$in': [0, 3]}}, [1, 3]),
+    ({'NOMs': {'$nin': [0, 3]}}, [2, 4]),
+    ({'retired': {'$exists': True}}, [3]),
+    ({'solved_pages': {'$exists': False}}, [4]),
+    ({'name': {'$regex': '^[a-c]', '$options': 'i'}}, [1, 2, 3]),
+    ({'name': {'$not': {'$regex': '^[A-Z]'}}}, [3]),
+    ({'solved_pages': 2}, [1]),
+    ({'solved_pages': {'$size': 0}}, [3]),
+    ({'tags': {'$all': ['red', 'fast']}}, [1]),
+    ({'word_guesses': {'$elemMatch': {'word': 'HOUSE', 'greens': {'$lt': 2}}}}, [2]),
+    ({'word_guesses.word': 'POWER'}, [2]),
+    ({'$and': [{'game_id': 'g1'}, {'NOMs': {'$gt': 1}}]}, [1]),
+    ({'$or': [{'name': 'Delta'}, {'NOMs': 3}]}, [1, 4]),
+    ({'$nor': [{'game_id': 'g1'}, {'retired': True}]}, [4]),
+])
+def test_filter_operators(teams, query, expected):
+    assert ids(teams.find(query)) == expected
+    assert teams.count_documents(query) == len(expected)
+
+
+def test_find_sort_skip_limit_and_projection(teams):
+    names = [team['name'] for team in teams.find({'game_id': 'g1'}).sort('NOMs', DESCENDING)]
+    assert names == ['Alpha', 'Bravo']
+    page = teams.find({}, {'name': 1, '_id': 0}).sort([('game_id', ASCENDING), ('name', ASCENDING)]).skip(1).limit(2)
+    assert list(page) == [{'name': 'Bravo'}, {'name': 'Delta'}]
+    assert teams.find_one({'_id': 2}, {'solved_pages': 0, 'word_guesses': 0, 'tags': 0}) == \
+        {'_id': 2, 'name': 'Bravo', 'NOMs': 1, 'game_id': 'g1'}
+    assert teams.distinct('game_id') == ['g1', 'g2']
+
+
+def test_documents_are_copied_in_and_out(db):
+    document = {'_id': 'a', 'pages': [1]}
+    db['items'].insert_one(document)
+    document['pages'].append(2)
+    found = db['items'].find_one({'_id': 'a'})
+    found['pages'].append(3)
+    assert db['items'].find_one({'_id': 'a'})['pages'] == [1]
+
+
+def test_update_operators(teams):
+    result = teams.update_one({'_id': 1}, {
+        '$set': {'name': 'Alpha Prime', 'stats.score': 10},
+        '$inc': {'NOMs': 2},
+        '$unset': {'tags': ''},
+        '$push': {'solved_pages': 7, 'word_guesses': {'$each': [{'word': 'WATER', 'greens': 0}]}},
+        '$addToSet': {'badges': 'first'},
+        '$max': {'best': 4},
+        '$min': {'worst': 1},
+        '$mul': {'multiplier': 2},
+    })
+    assert (result.matched_count, result.modified_count) == (1, 1)
+    team = teams.find_one({'_id': 1})
+    assert team['name'] == 'Alpha Prime'
+    assert team['stats'] == {'score': 10}
+    assert team['NOMs'] == 5
+    assert 'tags' not in team
+    assert team['solved_pages'] == [1, 2, 5, 7]
+    assert team['word_guesses'][-1] == {'word': 'WATER', 'greens': 0}
+    assert (team['badges'], team['best'], team['worst'], team['multiplier']) == (['first'], 4, 1, 0)
+
+    teams.update_one({'_id': 1}, {'$addToSet': {'badges': 'first'}, '$pull': {'solved_pages': 2},
+                                  '$max': {'best': 3}, '$min': {'worst': 0}})
+    team = teams.find_one({'_id': 1})
+    assert (team['badges'], team['solved_pages'], team['best'], team['worst']) == (['first'], [1, 5, 7], 4, 0)
+
+    unchanged = teams.update_one({'_id': 2}, {'$set': {'name': 'Bravo'}})
+    assert (unchanged.matched_count, unchanged.modified_count) == (1, 0)
+    many = teams.update_many({'game_id': 'g2'}, {'$set': {'game_id': 'g3'}})
+    assert (many.matched_count, many.modified_count) == (2, 2)
+    assert teams.count_documents({'game_id': 'g3'}) == 2
+
+
+def test_update_rejects_replacement_documents(teams):
+    with pytest.raises(ValueError):
+        teams.update_one({'_id': 1}, {'name': 'no operators'})
+
+
+def test_pipeline_update(db):
+    """Slot reservation in the bulk team import: raise a counter up to a cap in one statement"""
+    counters = db['counters']
+    pipeline = [{'$set': {'count': {'$max': [
+        {'$ifNull': ['$count', 0]},
+        {'$min': [5, {'$add': [{'$ifNull': ['$count', 0]}, 3]}]}
+    ]}}}]
+    before = counters.find_one_and_update({'_id': 'team_count:g1'}, pipeline, upsert=True,
+                                          return_document=ReturnDocument.BEFORE)
+    assert before is None
+    assert counters.find_one({'_id': 'team_count:g1'})['count'] == 3
+    before = counters.find_one_and_update({'_id': 'team_count:g1'}, pipeline, return_document=ReturnDocument.BEFORE)
+    assert before['count'] == 3
+    assert counters.find_one({'_id': 'team_count:g1'})['count'] == 5
+
+
+def test_pipeline_update_with_now_and_conditionals(db):
+    """Token bucket refill as the rate limiter writes it"""
+    buckets = db['rate_limits']
+    update = [{'$set': {
+        'tokens': {'$cond': [{'$gte': [{'$ifNull': ['$tokens', 2]}, 1]},
+                             {'$subtract': [{'$ifNull': ['$tokens', 2]}, 1]}, 0]},
+        'updated_at': '$$NOW',
+        'expires_at': {'$add': ['$$NOW', 60000]},
+    }}, {'$unset': 'scratch'}]
+    for expected in (1, 0, 0):
+        bucket = buckets.find_one_and_update({'_id': 'ip:1'}, update, upsert=True,
+                                             return_document=ReturnDocument.AFTER)
+        assert bucket['tokens'] == expected
+    assert isinstance(bucket['updated_at'], datetime)
+    assert bucket['expires_at'] - bucket['updated_at'] == timedelta(minutes=1)
+
+
+def test_upserts(db):
+    counters = db['counters']
+    result = counters.update_one({'_id': 'team_count:g1'}, {'$inc': {'count': 1}, '$setOnInsert': {'created': True}},
+                                 upsert=True)
+    assert result.upserted_id == 'team_count:g1'
+    counters.update_one({'_id': 'team_count:g1'}, {'$inc': {'count': 1}, '$setOnInsert': {'created': False}},
+                        upsert=True)
+    assert counters.find_one({'_id': 'team_count:g1'}) == {'_id': 'team_count:g1', 'count': 2, 'created': True}
+
+    # Equality fields of the filter seed the inserted document; operators do not
+    db['pages'].update_one({'game_id': 'g1', 'number': 4, 'epoch': {'$gte': 0}}, {'$set': {'is_solved': False}},
+                           upsert=True)
+    page = db['pages'].find_one({'number': 4}, {'_id': 0})
+    assert page == {'game_id': 'g1', 'number': 4, 'is_solved': False}
+
+    replaced = db['pages'].replace_one({'number': 9}, {'number': 9, 'title': 'new'}, upsert=True)
+    assert replaced.upserted_id is not None
+    after = db['pages'].find_one_and_update({'number': 9}, {'$set': {'title': 'newer'}},
+                                            return_document=ReturnDocument.AFTER, projection={'_id': 0})
+    assert after == {'number': 9, 'title': 'newer'}
+
+
+def test_find_one_and_update_is_atomic_claim(db):
+    """The first-solver claim: only one of two identical conditional updates matches"""
+    pages = db['pages']
+    pages.insert_one({'number': 1, 'is_solved': False})
+    claim = {'$set': {'is_solved': True, 'solved_by': 'AAAA'}}
+    assert pages.find_one_and_update({'number': 1, 'is_solved': False}, claim) is not None
+    assert pages.find_one_and_update({'number': 1, 'is_solved': False}, claim) is None
+
+
+def test_unique_indexes(db):
+    teams = db['teams']
+    teams.create_index([('game_id', ASCENDING), ('code', ASCENDING)], unique=True)
+    teams.insert_one({'game_id': 'g1', 'code': 'AAAA'})
+    teams.insert_one({'game_id': 'g2', 'code': 'AAAA'})
+    with pytest.raises(DuplicateKeyError):
+        teams.insert_one({'game_id': 'g1', 'code': 'AAAA'})
+    with pytest.raises(DuplicateKeyError):
+        teams.update_one({'game_id': 'g2'}, {'$set': {'game_id': 'g1'}})
+    assert 'game_id_1_code_1' in teams.index_information()
+
+    with pytest.raises(BulkWriteError) as raised:
+        teams.insert_many([{'game_id': 'g1', 'code': 'BBBB'}, {'game_id': 'g1', 'code': 'AAAA'},
+                           {'game_id': 'g1', 'code': 'CCCC'}], ordered=False)
+    errors = raised.value.details['writeErrors']
+    assert [(error['index'], error['code']) for error in errors] == [(1, 11000)]
+    assert errors[0]['keyValue'] == {'game_id': 'g1', 'code': 'AAAA'}
+    assert teams.count_documents({'game_id': 'g1'}) == 3
+
+    with pytest.raises(BulkWriteError):
+        teams.insert_many([{'game_id': 'g3', 'code': 'AAAA'}, {'game_id': 'g1', 'code': 'AAAA'},
+                           {'game_id': 'g3', 'code': 'BBBB'}])
+    assert teams.count_documents({'game_id': 'g3'}) == 1
+
+
+def test_delete(teams):
+    assert teams.delete_one({'game_id': 'g2'}).deleted_count == 1
+    assert teams.delete_many({'game_id': {'$in': ['g1', 'g2']}}).deleted_count == 3
+    assert teams.count_documents({}) == 0
+
+
+def test_aggregate_group_sort_limit(db):
+    """Slow query summary: per query shape counts, averages, maxima and a sample"""
+    db['slow_queries'].insert_many([
+        {'key': 'teams.find', 'duration_ms': 120, 'plan': 'IXSCAN'},
+        {'key': 'pages.find', 'duration_ms': 300, 'plan': 'COLLSCAN'},
+        {'key': 'teams.find', 'duration_ms': 80, 'plan': 'IXSCAN'},
+        {'key': 'teams.update', 'duration_ms': 50, 'plan': 'IXSCAN'},
+    ])
+    summary = list(db['slow_queries'].aggregate([
+        {'$match': {'duration_ms': {'$gte': 60}}},
+        {'$group': {'_id': '$key', 'count': {'$sum': 1}, 'avg_ms': {'$avg': '$duration_ms'},
+                    'max_ms': {'$max': '$duration_ms'}, 'plan': {'$first': '$plan'}}},
+        {'$sort': {'count': -1, 'max_ms': -1}},
+        {'$limit': 5},
+    ]))
+    assert summary == [
+        {'_id': 'teams.find', 'count': 2, 'avg_ms': 100, 'max_ms': 120, 'plan': 'IXSCAN'},
+        {'_id': 'pages.find', 'count': 1, 'avg_ms': 300, 'max_ms': 300, 'plan': 'COLLSCAN'},
+    ]
+
+
+def test_aggregate_project_unwind_count(teams):
+    """Export shapes: one row per solved page, renamed and computed fields"""
+    rows = list(teams.aggregate([
+        {'$match': {'game_id': 'g1'}},
+        {'$sort': {'name': 1}},
+        {'$project': {'_id': 0, 'team': '$name', 'page': '$solved_pages', 'guesses': {'$size': '$word_guesses'}}},
+        {'$unwind': '$page'},
+    ]))
+    assert rows == [
+        {'team': 'Alpha', 'page': 1, 'guesses': 1},
+        {'team': 'Alpha', 'page': 2, 'guesses': 1},
+        {'team': 'Alpha', 'page': 5, 'guesses': 1},
+        {'team': 'Bravo', 'page': 3, 'guesses': 2},
+    ]
+    kept = list(teams.aggregate([{'$unwind': {'path': '$solved_pages', 'preserveNullAndEmptyArrays': True}},
+                                 {'$match': {'game_id': 'g2'}}, {'$project': {'solved_pages': 1}}]))
+    assert kept == [{'_id': 3}, {'_id': 4}]
+    assert list(teams.aggregate([{'$unwind': '$tags'}, {'$count': 'tagged'}])) == [{'tagged': 3}]
+
+
+def test_aggregate_set_and_unset_stages(teams):
+    rows = list(teams.aggregate([
+        {'$match': {'_id': {'$in': [1, 2]}}},
+        {'$set': {'score': {'$add': ['$NOMs', {'$size': '$solved_pages'}]}, 'label': {'$concat': ['$name', '!']}}},
+        {'$unset': ['solved_pages', 'tags', 'word_guesses', 'game_id']},
+        {'$sort': {'score': -1}},
+    ]))
+    assert rows == [{'_id': 1, 'name': 'Alpha', 'NOMs': 3, 'score': 6, 'label': 'Alpha!'},
+                    {'_id': 2, 'name': 'Bravo', 'NOMs': 1, 'score': 2, 'label': 'Bravo!'}]
+
+
+def test_unsupported_aggregation_stage_fails_loudly(teams):
+    with pytest.raises(OperationFailure):
+        list(teams.aggregate([{'$lookup': {'from': 'pages', 'localField': 'x', 'foreignField': 'y', 'as': 'z'}}]))
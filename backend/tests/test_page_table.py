@@ -0,0 +1,22 @@
+"""
+Answer checks against the preloaded page table.
+"""
+import pytest
+
+from backend.models.page import PageTable
+
+PAGES = [{'number': 1, 'letter': 'P', 'puzzle': 'p1', 'solution': 'map'},
+         {'number': 2, 'letter': 'O', 'puzzle': 'p2', 'solution': 'Café  crème'}]
+
+
+@pytest.mark.parametrize('hash_key', [None, b'page-hash-key'])
+@pytest.mark.parametrize('number, answer, expected', [
+    (1, 'MAP', True),
+    (1, ' m a p ', False),
+    (1, 'CAFÉ', False),
+    (2, 'café crème', True),
+    (2, 'CAFE CREME', False),
+    (3, 'MAP', False),
+])
+def test_check_answer(hash_key, number, answer, expected):
+    assert PageTable.from_documents(PAGES, hash_key).check_answer(number, answer) is expected
@@ -0,0 +1,25 @@
+"""
+The sampling profiler must keep the gevent worker serving while it samples.
+"""
+import gevent
+
+from backend.services.profiler import SamplingProfiler
+
+
+def serving_greenlet(ticks, stop):
+    while not stop:
+        ticks.append(1)
+        gevent.sleep(0.005)
+
+
+def test_sampling_run_lets_other_greenlets_run_and_samples_them():
+    ticks, stop = [], []
+    other = gevent.spawn(serving_greenlet, ticks, stop)
+    run = gevent.spawn(SamplingProfiler().run, 0.3, 0.005)
+    result = run.get(timeout=10)
+    stop.append(True)
+    other.join(timeout=5)
+
+    assert len(ticks) > 20
+    assert result['samples'] > 10
+    assert any('serving_greenlet' in stack for stack in result['stacks'])
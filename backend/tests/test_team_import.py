@@ -0,0 +1,44 @@
+"""
+Bulk-import password hashing in worker processes.
+"""
+import sys
+
+import gevent
+
+from backend.services.auth_service import AuthService
+from backend.services.team_import import hash_passwords
+
+
+PASSWORDS = ['password123', 'Café crème 1', 'hunter2hunter2']
+
+
+def test_workers_hash_every_password_in_order():
+    main = sys.modules['__main__']
+    hashes = hash_passwords(PASSWORDS, workers=2)
+    assert sys.modules['__main__'] is main
+    assert len(hashes) == len(PASSWORDS)
+    for password, hashed in zip(PASSWORDS, hashes):
+        assert AuthService.verify_password(password, hashed)
+
+
+def test_hashing_in_a_greenlet_lets_others_run():
+    ticks = []
+
+    def ticker():
+        while True:
+            ticks.append(1)
+            gevent.sleep(0.01)
+
+    other = gevent.spawn(ticker)
+    try:
+        hashes = gevent.spawn(hash_passwords, PASSWORDS, 2).get(timeout=30)
+    finally:
+        other.kill()
+    assert AuthService.verify_password(PASSWORDS[0], hashes[0])
+    assert len(ticks) > 1
+
+
+def test_failed_workers_fall_back_to_inline_hashing(monkeypatch):
+    monkeypatch.setattr('backend.services.team_import.sys.executable', '/nonexistent/python')
+    hashes = hash_passwords(PASSWORDS[:2], workers=2)
+    assert AuthService.verify_password(PASSWORDS[1], hashes[1])
@@ -4,6 +4,9 @@ from decouple import config as env_config
 GAME_WORD = env_config('GAME_WORD', default='POWERHOUSE')
 TOTAL_PAGES = env_config('TOTAL_PAGES', default=10, cast=int)
 
+# Game used when a request does not name one
+DEFAULT_GAME_ID = env_config('DEFAULT_GAME_ID', default='default')
+
 GAME_STATUS_WAITING = 'waiting'
 GAME_STATUS_ACTIVE = 'in_progress'
 GAME_STATUS_COMPLETED = 'completed'
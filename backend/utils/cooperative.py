@@ -0,0 +1,108 @@
+"""
+Waits that yield to gevent instead of blocking it.
+
+The server runs Flask-SocketIO on gevent without monkey-patching the stdlib, so
+`threading` waits and `time.sleep` in a request block the whole worker: no other
+greenlet runs, including the one that would end the wait. These stand-ins wait
+on gevent primitives when the calling thread runs a gevent hub and on native
+ones otherwise (the threaded dev server, background threads, tests).
+"""
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+try:
+    import gevent
+    from gevent._hub_local import get_hub_if_exists
+    from gevent.lock import Semaphore
+except ImportError:  # pragma: no cover - gevent is a hard dependency of the server, not of every tool
+    gevent = None
+
+    def get_hub_if_exists():
+        return None
+
+
+def in_gevent() -> bool:
+    """Whether the calling thread runs a gevent hub (its blocking calls would stall other greenlets)"""
+    return get_hub_if_exists() is not None
+
+
+def sleep(seconds: float):
+    """`time.sleep` that lets other greenlets run meanwhile"""
+    if in_gevent():
+        gevent.sleep(seconds)
+    else:
+        time.sleep(seconds)
+
+
+class _Waiter:
+    """One blocked caller of `Condition.wait`, woken by `wake` from any thread or greenlet"""
+
+    def __init__(self):
+        self.hub = get_hub_if_exists()
+        if self.hub is not None:
+            self._lock = Semaphore(0)
+        else:
+            self._lock = threading.Lock()
+            self._lock.acquire()
+
+    def wait(self, timeout: Optional[float]) -> bool:
+        if self.hub is not None:
+            return self._lock.acquire(timeout=timeout)
+        return self._lock.acquire(timeout=-1 if timeout is None else max(timeout, 0))
+
+    def wake(self):
+        if self.hub is None or get_hub_if_exists() is self.hub:
+            self._lock.release()
+        else:
+            # A gevent semaphore may only be released from its own hub's thread
+            self.hub.loop.run_callback_threadsafe(self._lock.release)
+
+
+class Condition:
+    """`threading.Condition` (with, wait, wait_for, notify_all) whose waits are cooperative under gevent.
+
+    The state lock is a native lock held only between waits, so code inside
+    `with condition:` must not yield to another greenlet.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = deque()
+
+    def __enter__(self):
+        self._lock.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._lock.release()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        waiter = _Waiter()
+        self._waiters.append(waiter)
+        self._lock.release()
+        try:
+            return waiter.wait(timeout)
+        finally:
+            self._lock.acquire()
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+
+    def wait_for(self, predicate: Callable[[], bool], timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        result = predicate()
+        while not result:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            self.wait(remaining)
+            result = predicate()
+        return result
+
+    def notify_all(self):
+        waiters, self._waiters = self._waiters, deque()
+        for waiter in waiters:
+            waiter.wake()
@@ -1,7 +1,10 @@
-from typing import Any, Dict, List
-from flask import jsonify
+import hmac
+from typing import Any, Dict, List, Optional
+from flask import jsonify, request, has_request_context
+from flask_jwt_extended import get_jwt
 from bson import ObjectId
-from .constants import GAME_WORD
+from decouple import config as env_config
+from .constants import DEFAULT_GAME_ID, GAME_WORD
 
 
 def create_response(data: Dict[str, Any] | List[Any] | None = None, message: str | None = None) -> Dict[str, Any]:
@@ -24,35 +27,81 @@ def create_error_response(message: str, status_code: int, errors: Dict[str, Any]
     return jsonify(payload)
 
 
-def get_letter_positions(letter: str) -> List[int]:
+def is_admin_token(token: Any) -> bool:
+    expected = env_config('ADMIN_TOKEN', default='')
+    # Bytes: compare_digest raises TypeError for str holding non-ASCII characters
+    return bool(expected) and isinstance(token, str) and hmac.compare_digest(token.encode('utf-8'),
+                                                                             expected.encode('utf-8'))
+
+
+def is_admin_request() -> bool:
+    return has_request_context() and is_admin_token(request.headers.get('X-Admin-Token'))
+
+
+def requested_game_id() -> Optional[str]:
+    """Game named by the request itself (X-Game-Id, then ?game_id), if any"""
+    if not has_request_context():
+        return None
+    return request.headers.get('X-Game-Id') or request.args.get('game_id') or None
+
+
+def current_game_id() -> str:
+    """Game of the current request.
+
+    A team's JWT binds it to the game it registered in; only admins can
+    address another game with X-Game-Id or ?game_id. Requests without a JWT
+    (registration, login, spectators) name their game the same way. Unknown
+    game ids are rejected with 404 before a controller runs (see routes.py).
+    """
+    if not has_request_context():
+        return DEFAULT_GAME_ID
+    try:
+        claimed = get_jwt().get('game_id')
+    except RuntimeError:
+        # No JWT verified for this request
+        claimed = None
+    if claimed and not is_admin_request():
+        return claimed
+    return requested_game_id() or claimed or DEFAULT_GAME_ID
+
+
+def game_room(game_id: str, name: str = 'updates') -> str:
+    """Socket.IO room of a game"""
+    return f'{game_id}:{name}'
+
+
+def get_letter_positions(letter: str, word: str = None) -> List[int]:
     letter = letter.upper()
     positions: List[int] = []
-    for i, ch in enumerate(GAME_WORD):
+    for i, ch in enumerate(word or GAME_WORD):
         if ch == letter:
             positions.append(i)
     return positions
 
 
-def format_leaderboard(teams: List[Dict[str, Any]], revealed_letters: Dict[str, List[int]]):
-    """Format leaderboard using consistent scoring from GameManager.best_team_scores"""
+def normalize_answer(answer: str) -> str:
+    """Canonical form for puzzle answers: upper case with single spaces"""
+    return ' '.join((answer or '').upper().split())
+
+
+def format_leaderboard(teams: List[Dict[str, Any]], revealed_letters: Dict[str, List[int]], word: str = None):
+    """Format leaderboard using consistent scoring from GameManager.best_scores"""
     from ..services.game_service import GameManager
     
-    leaderboard = []
-    for team in teams:
-        # Use GameManager.best_team_scores for consistent scoring
-        greens, yellows = GameManager.best_team_scores(team)
-        
-        leaderboard.append({
+    entries = []
+    # Score every team's guesses in one batch for consistent scoring
+    for team, (greens, yellows) in zip(teams, GameManager.best_scores(teams, word)):
+        entries.append((team.get('NOMs', 0), {
             'name': team.get('name'),
             'code': team.get('code'),
             'greens': greens,
             'yellows': yellows,
             'word_guesses_count': len(team.get('word_guesses', []) or [])
-        })
+        }))
 
     # Sort by greens desc, NOMs desc, yellows desc
-    leaderboard.sort(key=lambda x: (-x['greens'], -team.get('NOMs', 0), -x['yellows']))
-    return leaderboard
+    entries.sort(key=lambda x: (-x[1]['greens'], -x[0], -x[1]['yellows']))
+    return [entry for _, entry in entries]
 
 
 def serialize_object(obj: Any) -> Any:
@@ -0,0 +1,195 @@
+"""
+Asynchronous structlog pipeline.
+
+Request code only samples, rate-caps and enqueues the raw event dict; timestamp
+formatting, JSON rendering and the write happen on a background thread.
+"""
+import atexit
+import json
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, TextIO
+import structlog
+
+# Levels that are never sampled or rate-capped
+ALWAYS_KEPT_LEVELS = ('warning', 'error', 'critical', 'exception')
+
+
+def parse_event_map(value: str, cast=float) -> Dict[str, Any]:
+    """Parse "Event name:value,Other event:value" settings"""
+    parsed = {}
+    for item in value.split(','):
+        if ':' in item:
+            event, number = item.rsplit(':', 1)
+            parsed[event.strip()] = cast(number)
+    return parsed
+
+
+class EventFilter:
+    """structlog processor dropping sampled-out and over-cap info/debug events.
+
+    `sample_rates` keeps a fraction of an event; `rate_limits` caps an event to
+    N per second. Dropped events are counted and reported by the sink.
+    """
+
+    def __init__(self, sample_rates: Dict[str, float] = None, rate_limits: Dict[str, float] = None):
+        self.sample_rates = sample_rates or {}
+        self.rate_limits = rate_limits or {}
+        self._windows: Dict[str, list] = {}
+        self._lock = threading.Lock()
+        self.suppressed: Dict[str, int] = {}
+
+    def __call__(self, logger, method_name: str, event_dict: Dict[str, Any]):
+        if method_name in ALWAYS_KEPT_LEVELS:
+            return event_dict
+        event = event_dict.get('event')
+        rate = self.sample_rates.get(event)
+        if rate is not None and random.random() >= rate:
+            self._suppress(event)
+        limit = self.rate_limits.get(event)
+        if limit is not None and not self._within_limit(event, limit):
+            self._suppress(event)
+        return event_dict
+
+    def _within_limit(self, event: str, limit: float) -> bool:
+        second = int(time.monotonic())
+        with self._lock:
+            window = self._windows.setdefault(event, [second, 0])
+            if window[0] != second:
+                window[0], window[1] = second, 0
+            window[1] += 1
+            return window[1] <= limit
+
+    def _suppress(self, event: str):
+        with self._lock:
+            self.suppressed[event] = self.suppressed.get(event, 0) + 1
+        raise structlog.DropEvent
+
+    def take_suppressed(self) -> Dict[str, int]:
+        with self._lock:
+            suppressed, self.suppressed = self.suppressed, {}
+        return suppressed
+
+
+def enqueue_event(logger, method_name: str, event_dict: Dict[str, Any]):
+    """Last processor: stamp the time cheaply and hand the dict to the queue logger"""
+    event_dict['level'] = method_name
+    event_dict['_ts'] = time.time()
+    return (event_dict,), {}
+
+
+class QueueSink:
+    """Bounded queue drained by a background thread that renders JSON lines"""
+
+    SUPPRESSED_REPORT_SECONDS = 10.0
+
+    def __init__(self, stream: Optional[TextIO] = None, maxsize: int = 10000, event_filter: EventFilter = None):
+        self.stream = stream or sys.stdout
+        self.queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self.event_filter = event_filter
+        self.dropped = 0
+        self._writer: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._reported_at = time.monotonic()
+
+    def put(self, event_dict: Dict[str, Any]):
+        if self._writer is None:
+            self._start()
+        try:
+            self.queue.put_nowait(event_dict)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name='log-writer', daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            try:
+                event_dict = self.queue.get(timeout=self.SUPPRESSED_REPORT_SECONDS)
+            except queue.Empty:
+                event_dict = None
+            if event_dict is not None:
+                self._write(event_dict)
+                self.queue.task_done()
+            self._report_suppressed()
+
+    def _write(self, event_dict: Dict[str, Any]):
+        timestamp = event_dict.pop('_ts', None) or time.time()
+        event_dict['timestamp'] = datetime.fromtimestamp(timestamp, timezone.utc).isoformat().replace('+00:00', 'Z')
+        try:
+            line = json.dumps(event_dict, default=repr)
+        except Exception as e:
+            line = json.dumps({'event': 'Unrenderable log event', 'error': str(e), 'timestamp': event_dict['timestamp']})
+        try:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+        except Exception:
+            self.dropped += 1
+
+    def _report_suppressed(self):
+        now = time.monotonic()
+        if now - self._reported_at < self.SUPPRESSED_REPORT_SECONDS:
+            return
+        self._reported_at = now
+        suppressed = self.event_filter.take_suppressed() if self.event_filter else {}
+        dropped, self.dropped = self.dropped, 0
+        if suppressed or dropped:
+            self._write({'event': 'Log events suppressed', 'level': 'info', 'suppressed': suppressed,
+                         'queue_dropped': dropped})
+
+    def flush(self):
+        """Write out whatever is queued (called at exit)"""
+        while True:
+            try:
+                event_dict = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            self._write(event_dict)
+            self.queue.task_done()
+
+
+class QueueLogger:
+    """structlog logger whose every level method enqueues onto the sink"""
+
+    def __init__(self, sink: QueueSink):
+        self._sink = sink
+
+    def msg(self, event_dict: Dict[str, Any]):
+        self._sink.put(event_dict)
+
+    debug = info = warning = warn = error = critical = exception = fatal = log = msg
+
+
+def configure_logging(app) -> Optional[QueueSink]:
+    """Configure structlog for the app: asynchronous unless LOG_ASYNC is off"""
+    cfg = app.config
+    event_filter = EventFilter(
+        parse_event_map(cfg.get('LOG_SAMPLE_RATES', '')),
+        parse_event_map(cfg.get('LOG_RATE_LIMITS', ''))
+    )
+    if not cfg.get('LOG_ASYNC', True):
+        structlog.configure(
+            processors=[
+                event_filter,
+                structlog.processors.add_log_level,
+                structlog.processors.TimeStamper(fmt="iso"),
+                structlog.processors.JSONRenderer()
+            ]
+        )
+        return None
+    sink = QueueSink(maxsize=cfg.get('LOG_QUEUE_SIZE', 10000), event_filter=event_filter)
+    structlog.configure(
+        # Tracebacks must be formatted while the exception is still being handled
+        processors=[event_filter, structlog.processors.format_exc_info, enqueue_event],
+        logger_factory=lambda *args: QueueLogger(sink)
+    )
+    return sink
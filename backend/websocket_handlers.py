@@ -2,24 +2,60 @@
 WebSocket event handlers for HashQuest game
 """
 from flask_socketio import emit, join_room, leave_room
-from flask import request
+from flask import request, session
 from flask_jwt_extended import decode_token
-from .models.team import Team
-from .models.game_state import GameState
-from .models.page import Page
-from .services.game_service import GameManager
+from .models.scope import game_exists, get_game_models
+from .services import socket_codec
+from .services.broadcast import leaderboard_payload, status_payload
+from .services.token_revocation import revocation_store
+from .utils.constants import DEFAULT_GAME_ID
+from .utils.helpers import game_room, is_admin_token
 import structlog
 
 logger = structlog.get_logger()
 
+
+class GameAccessError(Exception):
+    """A socket named a game it may not address"""
+
+
 def register_socketio_handlers(socketio, db_manager):
     """Register all WebSocket event handlers"""
     
+    def socket_game_id(data=None):
+        """Game of this socket: set by join_game/subscribe_updates, else the default game.
+
+        A `game_id` in the event data must name an existing game, and a socket that
+        joined as a team may only name its own game unless it connected as admin.
+        """
+        joined = session.get('game_id', DEFAULT_GAME_ID)
+        if not isinstance(data, dict) or not data.get('game_id'):
+            return joined
+        game_id = data['game_id']
+        if session.get('team_id') and game_id != joined and not session.get('admin'):
+            raise GameAccessError('Not a member of this game')
+        if not isinstance(game_id, str) or not game_exists(db_manager, game_id):
+            raise GameAccessError('Game not found')
+        return game_id
+    
+    def socket_encoding():
+        return session.get('encoding', socket_codec.ENCODING_JSON)
+    
+    def updates_room(game_id):
+        """Update room of a game for this socket's payload encoding"""
+        return socket_codec.room_for(game_room(game_id, 'updates'), socket_encoding())
+    
     @socketio.on('connect')
-    def handle_connect():
-        """Handle client connection"""
-        logger.info("Client connected", client_id=request.sid)
-        emit('connected', {'message': 'Connected to HashQuest server'})
+    def handle_connect(auth=None):
+        """Handle client connection, negotiating the payload encoding"""
+        requested = (auth or {}).get('encoding') if isinstance(auth, dict) else None
+        session['encoding'] = socket_codec.negotiate(requested or request.args.get('encoding'))
+        session['admin'] = is_admin_token((auth or {}).get('admin_token') if isinstance(auth, dict) else None)
+        logger.info("Client connected", client_id=request.sid, encoding=session['encoding'])
+        connected = {'message': 'Connected to HashQuest server', 'encoding': session['encoding']}
+        if session['encoding'] == socket_codec.ENCODING_MSGPACK:
+            connected['keys'] = socket_codec.KEY_MAP
+        emit('connected', connected)
     
     @socketio.on('disconnect')
     def handle_disconnect():
@@ -39,27 +75,33 @@ def register_socketio_handlers(socketio, db_manager):
             try:
                 decoded = decode_token(token)
                 team_id = decoded.get('sub')
+                game_id = decoded.get('game_id') or DEFAULT_GAME_ID
                 
                 if not team_id:
                     emit('error', {'message': 'Invalid token'})
                     return
+                # decode_token does not consult the blocklist
+                if revocation_store.is_revoked(decoded):
+                    emit('error', {'message': 'Token has been revoked'})
+                    return
             except Exception as token_error:
                 logger.error("Token decode error", error=str(token_error))
                 emit('error', {'message': 'Invalid or expired token'})
                 return
             
             # Get team info
-            team_model = Team(db_manager)
-            team = team_model.get_by_id(team_id)
+            team = get_game_models(db_manager, game_id).team.get_by_id(team_id)
             
             if not team:
                 emit('error', {'message': 'Team not found'})
                 return
             
-            # Join the game room
-            join_room('game')
-            join_room('updates')
-            logger.info("Team joined game", team_id=team_id, team_code=team.get('code'))
+            # Join the game rooms
+            session['game_id'] = game_id
+            session['team_id'] = team_id
+            join_room(game_room(game_id, 'game'))
+            join_room(updates_room(game_id))
+            logger.info("Team joined game", game_id=game_id, team_id=team_id, team_code=team.get('code'))
             
             emit('joined_game', {
                 'message': 'Successfully joined the game',
@@ -75,68 +117,45 @@ def register_socketio_handlers(socketio, db_manager):
     def handle_leave_game():
         """Handle team leaving the game room"""
         try:
-            leave_room('game')
+            leave_room(game_room(socket_game_id(), 'game'))
             logger.info("Team left game", client_id=request.sid)
             emit('left_game', {'message': 'Left the game'})
         except Exception as e:
             logger.error("Error leaving game", error=str(e))
     
     @socketio.on('get_game_status')
-    def handle_get_game_status():
+    def handle_get_game_status(data=None):
         """Send current game status to client"""
         try:
-            game_state_model = GameState(db_manager)
-            page_model = Page(db_manager)
-            
-            game_state = game_state_model.get_current()
-            current_page = page_model.get_by_number(game_state['current_page'])
-            
-            emit('game_status', {
-                'current_page': game_state['current_page'],
-                'game_status': game_state['game_status'],
-                'revealed_letters': game_state.get('revealed_letters', {}),
-                'page_info': current_page,
-                'word': GameManager.WORD
-            })
-            
+            # Shared pre-encoded payload: one serialization per state change, not per client
+            emit('game_status', status_payload(socket_game_id(data)).for_encoding(socket_encoding()))
+        except GameAccessError as e:
+            emit('error', {'message': str(e)})
         except Exception as e:
             logger.error("Error getting game status", error=str(e))
             emit('error', {'message': 'Failed to get game status'})
     
     @socketio.on('get_leaderboard')
-    def handle_get_leaderboard():
+    def handle_get_leaderboard(data=None):
         """Send current leaderboard to client"""
         try:
-            team_model = Team(db_manager)
-            teams = team_model.get_all()
-            
-            rankings = []
-            for team in teams:
-                greens, yellows = GameManager.best_team_scores(team)
-                rankings.append({
-                    'name': team.get('name'),
-                    'code': team.get('code'),
-                    'greens': greens,
-                    'yellows': yellows,
-                    'NOMs': team.get('NOMs', 0),
-                    'word_guesses_count': len(team.get('word_guesses', [])),
-                    'guesses_left': team.get('guesses_left', 3)
-                })
-            
-            rankings.sort(key=lambda x: (-x['greens'], -x['NOMs'], -x['yellows']))
-            
-            emit('leaderboard', {'rankings': rankings})
-            
+            emit('leaderboard', leaderboard_payload(socket_game_id(data)).for_encoding(socket_encoding()))
+        except GameAccessError as e:
+            emit('error', {'message': str(e)})
         except Exception as e:
             logger.error("Error getting leaderboard", error=str(e))
             emit('error', {'message': 'Failed to get leaderboard'})
     
     @socketio.on('subscribe_updates')
-    def handle_subscribe_updates():
+    def handle_subscribe_updates(data=None):
         """Subscribe to real-time game updates"""
         try:
-            join_room('updates')
+            game_id = socket_game_id(data)
+            session['game_id'] = game_id
+            join_room(updates_room(game_id))
             emit('subscribed', {'message': 'Subscribed to game updates'})
+        except GameAccessError as e:
+            emit('error', {'message': str(e)})
         except Exception as e:
             logger.error("Error subscribing to updates", error=str(e))
             emit('error', {'message': 'Failed to subscribe to updates'})
@@ -145,7 +164,7 @@ def register_socketio_handlers(socketio, db_manager):
     def handle_unsubscribe_updates():
         """Unsubscribe from real-time game updates"""
         try:
-            leave_room('updates')
+            leave_room(updates_room(socket_game_id()))
             emit('unsubscribed', {'message': 'Unsubscribed from game updates'})
         except Exception as e:
             logger.error("Error unsubscribing from updates", error=str(e))